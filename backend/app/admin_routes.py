@@ -0,0 +1,43 @@
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import FileResponse
+
+from . import slowlog
+from .profiler import ADMIN_TOKEN, is_admin, list_profiles, profile_path
+
+router = APIRouter()
+
+
+def require_admin(x_admin_token: Optional[str] = Header(default=None)):
+    # sem ADMIN_TOKEN configurado as rotas de admin nem existem
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not is_admin(x_admin_token):
+        raise HTTPException(status_code=403, detail="admin token required")
+
+
+@router.get("/admin/profiles", dependencies=[Depends(require_admin)])
+def profiles():
+    return list_profiles()
+
+
+@router.get("/admin/profiles/{name}", dependencies=[Depends(require_admin)])
+def download_profile(name: str):
+    path = profile_path(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="profile not found")
+    return FileResponse(path, media_type="application/json", filename=name)
+
+
+@router.get("/admin/slow-queries", dependencies=[Depends(require_admin)])
+def slow_queries(limit: int = slowlog.SLOW_QUERY_TOP, order: Literal["total", "max", "mean", "count"] = "total"):
+    if limit < 1 or limit > 500:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 500")
+    return slowlog.report(limit=limit, order=order)
+
+
+@router.delete("/admin/slow-queries", dependencies=[Depends(require_admin)])
+def reset_slow_queries():
+    slowlog.reset()
+    return {"ok": True}
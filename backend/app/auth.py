@@ -4,19 +4,22 @@ import hashlib
 import secrets
 from datetime import datetime, timedelta
 
-from fastapi import Depends, HTTPException
+from fastapi import Depends, HTTPException, Request
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from sqlmodel import Session, select
 
-from .db import get_session
+from .db import DEFAULT_SHARD, engine, get_session, pin_to_primary, read_engine, shard_engine
 from .models import User, PasswordReset
 
 SECRET_KEY = "CHANGE_ME_GENERICERP_DEV_SECRET"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24  # 24h
 
+# métodos que não escrevem: não fixam o usuário no primário
+SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
@@ -42,25 +45,91 @@ def create_access_token(user_id: int) -> str:
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
-def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    session: Session = Depends(get_session),
-) -> User:
+def decode_token(token: str) -> int:
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         sub = payload.get("sub")
         if not sub:
             raise HTTPException(status_code=401, detail="invalid token")
-        user_id = int(sub)
+        return int(sub)
     except (JWTError, ValueError):
         raise HTTPException(status_code=401, detail="invalid token")
 
+
+def current_user_id(token: str = Depends(oauth2_scheme)) -> int:
+    return decode_token(token)
+
+
+def get_current_user(
+    request: Request,
+    user_id: int = Depends(current_user_id),
+    session: Session = Depends(get_session),
+) -> User:
     user = session.get(User, user_id)
     if not user:
         raise HTTPException(status_code=401, detail="user not found")
+    if request.method not in SAFE_METHODS:
+        # read-your-writes: as próximas leituras dele não vão para a réplica
+        pin_to_primary(user.id)
     return user
 
 
+def _directory_read_session(user_id: int = Depends(current_user_id)):
+    # rotas só de leitura: réplica (round-robin), salvo se o usuário escreveu há pouco
+    with Session(read_engine(user_id)) as session:
+        yield session
+
+
+def get_current_reader(
+    user_id: int = Depends(current_user_id),
+    session: Session = Depends(_directory_read_session),
+) -> User:
+    user = session.get(User, user_id)
+    if not user:
+        # conta recém-criada que a réplica ainda não recebeu
+        with Session(engine) as primary:
+            user = primary.get(User, user_id)
+    if not user:
+        raise HTTPException(status_code=401, detail="user not found")
+    return user
+
+
+def get_tenant_session(
+    request: Request,
+    user: User = Depends(get_current_user),
+    session: Session = Depends(get_session),
+):
+    # dados do tenant: banco do shard dele (no default, a mesma sessão do diretório)
+    if user.shard_frozen and request.method not in SAFE_METHODS:
+        raise HTTPException(
+            status_code=503,
+            detail="tenant being moved to another shard, retry shortly",
+            headers={"Retry-After": "5"},
+        )
+    if user.shard == DEFAULT_SHARD:
+        yield session
+        return
+    with Session(shard_engine(user.shard)) as tenant_session:
+        yield tenant_session
+
+
+def get_read_session(
+    user: User = Depends(get_current_reader),
+    session: Session = Depends(_directory_read_session),
+):
+    shard = user.shard
+    if session.get_bind() is not engine:
+        # User.shard veio da réplica: logo depois de um move_tenant ela ainda
+        # aponta o shard antigo, que o move apaga. O shard sai do primário
+        with Session(engine) as primary:
+            shard = primary.exec(select(User.shard).where(User.id == user.id)).one()
+    if shard == DEFAULT_SHARD:
+        yield session
+        return
+    with Session(read_engine(user.id, shard)) as tenant_session:
+        yield tenant_session
+
+
 def _sha256(s: str) -> str:
     return hashlib.sha256(s.encode("utf-8")).hexdigest()
 
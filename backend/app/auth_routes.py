@@ -3,10 +3,11 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlmodel import Session, select
 from pydantic import BaseModel, EmailStr
 
-from .db import get_session
+from .db import DEFAULT_SHARD, NEW_TENANT_SHARD, get_session, pin_to_primary, shard_engine
 from .models import User
-from .auth import hash_password, verify_password, create_access_token, get_current_user, create_reset_code, consume_reset_code
+from .auth import hash_password, verify_password, create_access_token, get_current_reader, create_reset_code, consume_reset_code
 from .mailer import send_email
+from .shards import ensure_user_row
 
 router = APIRouter()
 
@@ -45,10 +46,14 @@ def register(data: RegisterIn, session: Session = Depends(get_session)):
     if len(data.password.strip()) < 6:
         raise HTTPException(status_code=400, detail="A senha deve ter no mínimo 6 caracteres.")
 
-    user = User(email=email, password_hash=hash_password(data.password.strip()))
+    user = User(email=email, password_hash=hash_password(data.password.strip()), shard=NEW_TENANT_SHARD)
     session.add(user)
     session.commit()
     session.refresh(user)
+    if user.shard != DEFAULT_SHARD:
+        with shard_engine(user.shard).begin() as conn:
+            ensure_user_row(conn, user)
+    pin_to_primary(user.id)
 
     send_email(
         to_email=email,
@@ -71,7 +76,7 @@ def login(data: LoginIn, session: Session = Depends(get_session)):
 
 
 @router.get("/me")
-def me(user: User = Depends(get_current_user)):
+def me(user: User = Depends(get_current_reader)):
     return {"id": user.id, "email": user.email, "created_at": user.created_at}
 
 
@@ -0,0 +1,254 @@
+"""
+POST /batch: vários GETs de leitura numa requisição só. O token é decodificado
+e o usuário carregado uma vez; as sub-requisições recebem esses valores
+já resolvidos (cache de dependências do FastAPI) e leem todas do mesmo
+snapshot. No Postgres o snapshot é exportado (pg_export_snapshot) e até
+BATCH_CONCURRENCY sub-requisições rodam em paralelo, cada uma numa sessão
+que importa o snapshot; no SQLite rodam em sequência na mesma sessão, dentro
+de um BEGIN explícito (o pysqlite não abre transação para SELECT) desfeito no
+fim — com o banco em WAL (db._create_engine), sem travar quem escreve.
+
+Só entram rotas GET com resposta JSON cujas dependências são as de leitura
+do tenant (get_current_reader / get_read_session).
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import re
+from contextlib import AsyncExitStack
+from typing import Any
+from urllib.parse import urlencode, urlsplit
+
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.datastructures import DefaultPlaceholder
+from fastapi.dependencies.utils import is_coroutine_callable, solve_dependencies
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from fastapi.exceptions import RequestValidationError
+from fastapi.routing import APIRoute, serialize_response
+from pydantic import BaseModel
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlmodel import Session
+from starlette.concurrency import run_in_threadpool
+from starlette.routing import Match
+
+from .auth import (
+    _directory_read_session,
+    current_user_id,
+    get_current_reader,
+    get_read_session,
+    oauth2_scheme,
+)
+from .models import User
+
+router = APIRouter()
+
+BATCH_MAX_REQUESTS = int(os.getenv("BATCH_MAX_REQUESTS", "20"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+
+# dependências que o /batch resolve uma vez e repassa
+_READ_DEPS = {oauth2_scheme, current_user_id, _directory_read_session, get_current_reader, get_read_session}
+_SNAPSHOT_ID = re.compile(r"^[0-9A-Fa-f-]+$")
+
+
+class BatchItem(BaseModel):
+    path: str  # "/quotes/12" ou "/products?fields=id,name"
+    params: dict[str, Any] = {}
+
+
+class BatchIn(BaseModel):
+    requests: list[BatchItem]
+
+
+def _dependency_calls(dependant):
+    for sub in dependant.dependencies:
+        # cache_key guarda a função original (o profiler troca .call)
+        yield sub.cache_key[0]
+        yield from _dependency_calls(sub)
+
+
+def _batchable(route) -> bool:
+    if not isinstance(route, APIRoute) or "GET" not in route.methods:
+        return False
+    # arquivo/stream (ex.: documento do orçamento) nem chega a ser chamado
+    response_class = route.response_class
+    if isinstance(response_class, DefaultPlaceholder):
+        response_class = response_class.value
+    if not issubclass(response_class, JSONResponse):
+        return False
+    calls = set(_dependency_calls(route.dependant))
+    return get_current_reader in calls and calls <= _READ_DEPS
+
+
+def _match(app, path: str):
+    scope = {"type": "http", "method": "GET", "path": path, "root_path": ""}
+    for route in app.routes:
+        match, child = route.matches(scope)
+        if match == Match.FULL:
+            # a primeira rota que casa decide (mesma ordem do roteador)
+            return (route, child.get("path_params", {})) if _batchable(route) else (None, None)
+    return None, None
+
+
+async def _serialize(route: APIRoute, raw) -> tuple[int, Any]:
+    if isinstance(raw, Response):
+        # ex.: ?fields= já devolve JSONResponse
+        if raw.media_type != "application/json":
+            raise HTTPException(status_code=400, detail="response is not JSON")
+        return raw.status_code, json.loads(raw.body)
+    if route.response_field is not None:
+        content = await serialize_response(
+            field=route.response_field,
+            response_content=raw,
+            include=route.response_model_include,
+            exclude=route.response_model_exclude,
+            by_alias=route.response_model_by_alias,
+            exclude_unset=route.response_model_exclude_unset,
+            exclude_defaults=route.response_model_exclude_defaults,
+            exclude_none=route.response_model_exclude_none,
+            is_coroutine=is_coroutine_callable(route.dependant.call),
+        )
+    else:
+        content = jsonable_encoder(raw)
+    return route.status_code or 200, content
+
+
+async def _run_one(request: Request, item: BatchItem, resolved: dict, session: Session) -> dict:
+    url = urlsplit(item.path)
+    query = url.query
+    if item.params:
+        query = "&".join(q for q in (query, urlencode(item.params, doseq=True)) if q)
+    out: dict = {"path": item.path}
+
+    route, path_params = _match(request.app, url.path)
+    if route is None:
+        out.update(status=404, body={"detail": "route not found or not batchable"})
+        return out
+
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": url.path,
+        "root_path": request.scope.get("root_path", ""),
+        "query_string": query.encode(),
+        "headers": request.scope["headers"],
+        "path_params": path_params,
+        "app": request.app,
+    }
+    cache = dict(resolved)
+    cache[(_directory_read_session, ())] = session
+    cache[(get_read_session, ())] = session
+    try:
+        async with AsyncExitStack() as stack:
+            solved = await solve_dependencies(
+                request=Request(scope),
+                dependant=route.dependant,
+                dependency_cache=cache,
+                async_exit_stack=stack,
+                embed_body_fields=False,
+            )
+            if solved.errors:
+                raise RequestValidationError(solved.errors)
+            call = route.dependant.call
+            if is_coroutine_callable(call):
+                raw = await call(**solved.values)
+            else:
+                raw = await run_in_threadpool(call, **solved.values)
+            status, body = await _serialize(route, raw)
+    except HTTPException as e:
+        status, body = e.status_code, {"detail": e.detail}
+    except RequestValidationError as e:
+        status, body = 422, {"detail": jsonable_encoder(e.errors())}
+    out.update(status=status, body=body)
+    return out
+
+
+# =========================
+# SNAPSHOT
+# =========================
+def _snapshot_options(session: Session) -> None:
+    if session.get_bind().dialect.name == "postgresql":
+        session.connection(execution_options={"isolation_level": "REPEATABLE READ", "postgresql_readonly": True})
+    elif session.get_bind().dialect.name == "sqlite":
+        # sem isso cada SELECT lê o banco do momento: o BEGIN segura um snapshot
+        # do primeiro SELECT até o ROLLBACK do fim
+        session.connection().exec_driver_sql("BEGIN")
+
+
+def _export_snapshot(session: Session) -> str | None:
+    if session.get_bind().dialect.name != "postgresql":
+        return None
+    try:
+        snapshot = session.connection().execute(text("SELECT pg_export_snapshot()")).scalar()
+    except DBAPIError:
+        # sem permissão/suporte (ex.: réplica antiga): segue em sequência
+        session.rollback()
+        _snapshot_options(session)
+        return None
+    return snapshot if snapshot and _SNAPSHOT_ID.match(snapshot) else None
+
+
+def _worker_session(bind, snapshot: str) -> Session:
+    s = Session(bind)
+    _snapshot_options(s)
+    s.connection().execute(text(f"SET TRANSACTION SNAPSHOT '{snapshot}'"))
+    return s
+
+
+@router.post("/batch")
+async def batch(
+    data: BatchIn,
+    request: Request,
+    token: str = Depends(oauth2_scheme),
+    user: User = Depends(get_current_reader),
+    session: Session = Depends(get_read_session),
+):
+    if not data.requests:
+        raise HTTPException(status_code=400, detail="requests is empty")
+    if len(data.requests) > BATCH_MAX_REQUESTS:
+        raise HTTPException(status_code=400, detail=f"at most {BATCH_MAX_REQUESTS} requests per batch")
+
+    resolved = {
+        (oauth2_scheme, ()): token,
+        (current_user_id, ()): user.id,
+        (get_current_reader, ()): user,
+    }
+
+    # sessão própria: a de get_current_reader já abriu transação sem o isolamento certo
+    bind = session.get_bind()
+    snap = Session(bind)
+    workers: list[Session] = []
+    try:
+        await run_in_threadpool(_snapshot_options, snap)
+        snapshot = await run_in_threadpool(_export_snapshot, snap)
+        n = min(BATCH_CONCURRENCY, len(data.requests)) if snapshot else 1
+        if n > 1:
+            for _ in range(n):
+                workers.append(await run_in_threadpool(_worker_session, bind, snapshot))
+        else:
+            workers.append(snap)
+
+        free: asyncio.Queue = asyncio.Queue()
+        for s in workers:
+            free.put_nowait(s)
+
+        async def run(item: BatchItem) -> dict:
+            s = await free.get()
+            try:
+                return await _run_one(request, item, resolved, s)
+            finally:
+                free.put_nowait(s)
+
+        results = await asyncio.gather(*(run(item) for item in data.requests))
+    finally:
+        for s in workers:
+            if s is not snap:
+                s.close()
+        # só leitura: nada a confirmar (no SQLite encerra o BEGIN explícito)
+        await run_in_threadpool(snap.rollback)
+        snap.close()
+    # corpos já estão em JSON puro: não passa de novo pelo jsonable_encoder
+    return JSONResponse({"results": results})
@@ -0,0 +1,166 @@
+"""
+Barramento de invalidação entre processos. Quem altera dados publica
+`(escopo, user_id)`; cada processo recebe e descarta o que tem em cache
+daquele tenant (app.cache). CACHE_BUS escolhe o transporte:
+
+    local     só o próprio processo (um worker, o default do Dockerfile)
+    postgres  NOTIFY/LISTEN no banco principal
+    table     tabela `cacheevent` no banco principal, lida por polling
+              (SQLite num host só, com --workers N; conta com ids
+              confirmados em ordem, o que a trava de escrita do SQLite garante)
+
+Mensagem perdida (listener reconectando) limpa o cache inteiro do
+processo: na dúvida, recarrega do banco.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import socket
+import threading
+from datetime import datetime
+from typing import Callable
+
+from sqlalchemy import func, insert, select, text
+
+from .db import DATABASE_URL, engine
+from .models import CacheEvent
+
+log = logging.getLogger("genericerp.bus")
+
+CACHE_BUS = os.getenv("CACHE_BUS", "local").lower()
+CACHE_BUS_POLL_SECONDS = float(os.getenv("CACHE_BUS_POLL_SECONDS", "0.5"))
+CACHE_BUS_CHANNEL = os.getenv("CACHE_BUS_CHANNEL", "genericerp_cache")
+
+ORIGIN = f"{socket.gethostname()}:{os.getpid()}"
+
+# handler(scope, user_id); user_id None = tudo (mensagens perdidas)
+Handler = Callable[[str, "int | None"], None]
+
+
+class LocalBus:
+    # tem listener (thread) para mensagens de outros processos
+    remote = False
+
+    def __init__(self):
+        self._handlers: list[Handler] = []
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def subscribe(self, handler: Handler) -> None:
+        self._handlers.append(handler)
+
+    def _deliver(self, scope: str, user_id: int | None) -> None:
+        for h in self._handlers:
+            try:
+                h(scope, user_id)
+            except Exception:
+                log.exception("handler de invalidação falhou")
+
+    def publish(self, scope: str, user_id: int) -> None:
+        # o próprio processo invalida na hora; os outros pelo transporte
+        self._deliver(scope, user_id)
+        try:
+            self._send(scope, user_id)
+        except Exception:
+            # a escrita já foi confirmada; os outros processos caem no TTL
+            log.exception("falha publicando invalidação %s/%s", scope, user_id)
+
+    def _send(self, scope: str, user_id: int) -> None:
+        pass
+
+    def _listen(self) -> None:
+        pass
+
+    def start(self) -> None:
+        if self._thread is not None or not self.remote:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f"bus-{CACHE_BUS}", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self._listen()
+            except Exception:
+                log.exception("listener do barramento caiu; reconectando")
+            # pode ter perdido mensagens enquanto estava fora
+            self._deliver("*", None)
+            self._stop.wait(1.0)
+
+    def _receive(self, payload: str) -> None:
+        msg = json.loads(payload)
+        if msg.get("origin") != ORIGIN:
+            self._deliver(msg["scope"], msg["user_id"])
+
+
+class PostgresBus(LocalBus):
+    remote = True
+
+    def _send(self, scope: str, user_id: int) -> None:
+        payload = json.dumps({"scope": scope, "user_id": user_id, "origin": ORIGIN})
+        with engine.connect() as conn:
+            conn.execute(text("SELECT pg_notify(:ch, :p)"), {"ch": CACHE_BUS_CHANNEL, "p": payload})
+            conn.commit()
+
+    def _listen(self) -> None:
+        import psycopg
+
+        url = engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+        with psycopg.connect(url, autocommit=True) as conn:
+            conn.execute(f'LISTEN "{CACHE_BUS_CHANNEL}"')
+            while not self._stop.is_set():
+                # timeout: volta para conferir o stop
+                for n in conn.notifies(timeout=1.0):
+                    self._receive(n.payload)
+
+
+class TableBus(LocalBus):
+    remote = True
+
+    def _send(self, scope: str, user_id: int) -> None:
+        with engine.begin() as conn:
+            conn.execute(insert(CacheEvent.__table__).values(
+                scope=scope, user_id=user_id, origin=ORIGIN, created_at=datetime.utcnow(),
+            ))
+
+    def _listen(self) -> None:
+        table = CacheEvent.__table__
+        with engine.connect() as conn:
+            last = conn.execute(select(func.coalesce(func.max(table.c.id), 0))).scalar()
+            conn.rollback()
+            while not self._stop.wait(CACHE_BUS_POLL_SECONDS):
+                rows = conn.execute(
+                    select(table.c.id, table.c.scope, table.c.user_id, table.c.origin)
+                    .where(table.c.id > last)
+                    .order_by(table.c.id)
+                ).all()
+                conn.rollback()  # snapshot novo no próximo poll
+                for r in rows:
+                    last = r.id
+                    if r.origin != ORIGIN:
+                        self._deliver(r.scope, r.user_id)
+
+
+def _make_bus() -> LocalBus:
+    kind = CACHE_BUS
+    if kind == "postgres":
+        if not DATABASE_URL.startswith("postgresql"):
+            raise RuntimeError("CACHE_BUS=postgres precisa de DATABASE_URL no Postgres")
+        return PostgresBus()
+    if kind == "table":
+        return TableBus()
+    if kind != "local":
+        raise RuntimeError(f"CACHE_BUS desconhecido: {kind!r} (local, postgres, table)")
+    return LocalBus()
+
+
+bus = _make_bus()
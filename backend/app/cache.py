@@ -0,0 +1,129 @@
+"""
+Cache em processo de leituras por tenant (listas de catálogo, saldo,
+orçamentos), desligado por padrão (CACHE_ENABLED). Cada escrita chama
+`invalidate(escopo, user_id)` depois do commit, que chega aos outros
+processos pelo app.bus — com --workers N, ligue o cache só junto com
+CACHE_BUS=postgres ou table.
+"""
+from __future__ import annotations
+
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable
+
+from sqlmodel import Session
+
+from .bus import bus
+from .db import replica_engines
+
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "false").lower() == "true"
+# rede de segurança caso uma invalidação se perca
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "60"))
+# tenants por cache (LRU)
+CACHE_MAX_TENANTS = int(os.getenv("CACHE_MAX_TENANTS", "1000"))
+# chaves por tenant (LRU): as/of, períodos e fields entram na chave
+CACHE_MAX_KEYS = int(os.getenv("CACHE_MAX_KEYS", "64"))
+
+
+class TenantCache:
+    def __init__(self, scope: str):
+        self.scope = scope
+        self._lock = threading.Lock()
+        # user_id -> {chave: (expira_em, valor)}, os dois níveis em ordem de uso
+        self._data: OrderedDict[int, OrderedDict] = OrderedDict()
+        # geração por tenant: leitura que começou antes de uma invalidação
+        # não grava o resultado (seria o valor velho). Quem não está aqui vale
+        # _floor, que sobe sempre que uma geração sai (nenhuma leitura em voo
+        # confunde "saiu" com "nunca invalidado")
+        self._gen: OrderedDict[int, int] = OrderedDict()
+        self._seq = itertools.count(1)
+        self._floor = 0
+
+    def _version(self, user_id: int) -> int:
+        return self._gen.get(user_id, self._floor)
+
+    def _forget_gen(self, user_id: int) -> None:
+        if self._gen.pop(user_id, None) is not None:
+            self._floor = next(self._seq)
+
+    def get_or_load(self, session: Session, user_id: int, key: Any, load: Callable[[], Any]) -> Any:
+        if not CACHE_ENABLED:
+            return load()
+        now = time.monotonic()
+        with self._lock:
+            entries = self._data.get(user_id)
+            hit = entries.get(key) if entries else None
+            if hit is not None:
+                if hit[0] > now:
+                    entries.move_to_end(key)
+                    self._data.move_to_end(user_id)
+                    return hit[1]
+                del entries[key]
+            version = self._version(user_id)
+
+        value = load()
+
+        # réplica pode estar atrás da invalidação que acabou de chegar
+        if session.get_bind() in replica_engines:
+            return value
+        with self._lock:
+            if self._version(user_id) == version:
+                entries = self._data.get(user_id)
+                if entries is None:
+                    entries = self._data[user_id] = OrderedDict()
+                entries[key] = (now + CACHE_TTL_SECONDS, value)
+                entries.move_to_end(key)
+                for k in [k for k, (expires, _) in entries.items() if expires <= now]:
+                    del entries[k]
+                while len(entries) > CACHE_MAX_KEYS:
+                    entries.popitem(last=False)
+                self._data.move_to_end(user_id)
+                while len(self._data) > CACHE_MAX_TENANTS:
+                    evicted, _ = self._data.popitem(last=False)
+                    self._forget_gen(evicted)
+        return value
+
+    def invalidate(self, user_id: int | None) -> None:
+        with self._lock:
+            if user_id is None:
+                self._floor = next(self._seq)
+                self._data.clear()
+                self._gen.clear()
+            else:
+                self._gen.pop(user_id, None)
+                self._gen[user_id] = next(self._seq)
+                self._data.pop(user_id, None)
+                # tenant invalidado que nunca mais lê não fica aqui para sempre
+                while len(self._gen) > CACHE_MAX_TENANTS:
+                    oldest = next(iter(self._gen))
+                    self._forget_gen(oldest)
+
+
+_caches: dict[str, TenantCache] = {}
+
+
+def tenant_cache(scope: str) -> TenantCache:
+    cache = _caches.get(scope)
+    if cache is None:
+        cache = _caches[scope] = TenantCache(scope)
+    return cache
+
+
+def _on_message(scope: str, user_id: int | None) -> None:
+    for cache in list(_caches.values()):
+        if scope == "*" or cache.scope == scope:
+            cache.invalidate(user_id)
+
+
+bus.subscribe(_on_message)
+
+
+def invalidate(*scopes: str, user_id: int) -> None:
+    # depois do commit: publicar antes deixaria outro processo recarregar o valor velho
+    if not CACHE_ENABLED:
+        return
+    for scope in scopes:
+        bus.publish(scope, user_id)
@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+from datetime import datetime
+
+from sqlalchemy import func, insert, literal, select, text
+from sqlmodel import Session
+
+from .models import CatalogChange
+
+# pg_advisory_xact_lock(_LOCK_KEY, user_id): alterações de catálogo do mesmo
+# tenant em fila, então seq nunca é confirmado fora de ordem
+_LOCK_KEY = 0x5C7A_106
+
+
+def touch_catalog(
+    session: Session,
+    user_id: int,
+    op: str = "upsert",
+    entity: str | None = None,
+    entity_id: int | None = None,
+) -> int:
+    """
+    Registra uma alteração de catálogo e devolve o seq dela — quem altera
+    grava esse valor em change_seq/updated_at das linhas. Não faz commit.
+    """
+    if session.bind.dialect.name == "postgresql":
+        session.exec(text("SELECT pg_advisory_xact_lock(:k, :u)"), params={"k": _LOCK_KEY, "u": user_id})
+
+    # um único INSERT ... SELECT: no SQLite já é atômico sob o lock de escrita
+    next_seq = (
+        select(
+            literal(user_id),
+            func.coalesce(func.max(CatalogChange.seq), 0) + 1,
+            literal(op),
+            literal(entity),
+            literal(entity_id),
+            literal(datetime.utcnow()),
+        )
+        .where(CatalogChange.user_id == user_id)
+    )
+    stmt = (
+        insert(CatalogChange)
+        .from_select(["user_id", "seq", "op", "entity", "entity_id", "created_at"], next_seq)
+        .returning(CatalogChange.seq)
+    )
+    return session.exec(stmt).scalar_one()
+
+
+def mark_changed(session: Session, user_id: int, *rows) -> int:
+    # Category/Product alterados: entram no próximo /sync/catalog
+    seq = touch_catalog(session, user_id)
+    now = datetime.utcnow()
+    for row in rows:
+        row.change_seq = seq
+        row.updated_at = now
+        session.add(row)
+    return seq
+
+
+def catalog_window(session: Session, user_id: int) -> tuple[int, int]:
+    # (menor seq ainda no log, cursor atual). O scheduler apaga o começo do
+    # log; quem está antes do menor seq pode ter perdido exclusões
+    oldest, cursor = session.exec(
+        select(func.coalesce(func.min(CatalogChange.seq), 0), func.coalesce(func.max(CatalogChange.seq), 0))
+        .where(CatalogChange.user_id == user_id)
+    ).one()
+    return oldest, cursor
@@ -1,14 +1,36 @@
+from datetime import datetime
+
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import Float, Numeric, case, cast, delete, func, update
+from sqlalchemy.exc import IntegrityError
 from sqlmodel import Session, select
 from pydantic import BaseModel
-from typing import Optional
-
-from .db import get_session
-from .auth import get_current_user
-from .models import Category, Product, User
+from typing import Literal, Optional
+
+from .cache import invalidate, tenant_cache
+from .catalog import mark_changed, touch_catalog
+from .auth import get_current_reader, get_current_user, get_read_session, get_tenant_session
+from .events import broker
+from .fields import parse_fields, rows, select_fields, sparse_response
+from .models import (
+    Category,
+    Product,
+    Quote,
+    QuoteItem,
+    ReorderPoint,
+    StockAlert,
+    StockMovement,
+    StockMovementArchive,
+    User,
+)
+from .quotes import line_values, refresh_totals
+from .quotes_routes import publish_quote
 
 router = APIRouter()
 
+catalog_cache = tenant_cache("catalog")
+# escritas de catálogo invalidam também "stock": saldo e valorização mostram produto/categoria
+
 
 # ---------- Categories ----------
 class CategoryIn(BaseModel):
@@ -23,10 +45,17 @@ class CategoryPatch(BaseModel):
     default_discount_percent: Optional[float] = None
 
 
+class RepriceIn(BaseModel):
+    mode: Literal["percent", "absolute"] = "percent"
+    value: float  # +10 = 10% (ou R$ 10) a mais; negativo reduz
+    rounding: Literal["cents", "integer", "x.90", "x.99"] = "cents"
+    update_draft_quotes: bool = False  # reprecifica os itens dos orçamentos DRAFT
+
+
 @router.post("/categories", response_model=Category)
 def create_category(
     data: CategoryIn,
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_tenant_session),
     user: User = Depends(get_current_user),
 ):
     name = (data.name or "").strip()
@@ -48,27 +77,30 @@ def create_category(
         auto_discount_enabled=bool(data.auto_discount_enabled),
         default_discount_percent=float(data.default_discount_percent or 0.0),
     )
-    session.add(cat)
+    mark_changed(session, user.id, cat)
     session.commit()
+    invalidate("catalog", "stock", user_id=user.id)
     session.refresh(cat)
     return cat
 
 
 @router.get("/categories", response_model=list[Category])
 def list_categories(
-    session: Session = Depends(get_session),
-    user: User = Depends(get_current_user),
+    session: Session = Depends(get_read_session),
+    user: User = Depends(get_current_reader),
 ):
-    return session.exec(
-        select(Category).where(Category.user_id == user.id).order_by(Category.id.desc())
-    ).all()
+    return catalog_cache.get_or_load(session, user.id, "categories", lambda: [
+        c.model_dump() for c in session.exec(
+            select(Category).where(Category.user_id == user.id).order_by(Category.id.desc())
+        ).all()
+    ])
 
 
 @router.patch("/categories/{category_id}", response_model=Category)
 def patch_category(
     category_id: int,
     data: CategoryPatch,
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_tenant_session),
     user: User = Depends(get_current_user),
 ):
     cat = session.get(Category, category_id)
@@ -97,12 +129,120 @@ def patch_category(
             raise HTTPException(status_code=400, detail="Desconto padrão deve ser entre 0 e 100.")
         cat.default_discount_percent = float(data.default_discount_percent)
 
-    session.add(cat)
+    mark_changed(session, user.id, cat)
     session.commit()
+    invalidate("catalog", "stock", user_id=user.id)
     session.refresh(cat)
     return cat
 
 
+@router.delete("/categories/{category_id}")
+def delete_category(
+    category_id: int,
+    session: Session = Depends(get_tenant_session),
+    user: User = Depends(get_current_user),
+):
+    cat = session.get(Category, category_id)
+    if not cat or cat.user_id != user.id:
+        raise HTTPException(status_code=404, detail="Categoria não encontrada.")
+
+    in_use = session.exec(
+        select(Product.id).where(Product.user_id == user.id).where(Product.category_id == category_id).limit(1)
+    ).first()
+    if in_use:
+        raise HTTPException(status_code=409, detail="Categoria possui produtos.")
+
+    session.delete(cat)
+    touch_catalog(session, user.id, op="delete", entity="category", entity_id=category_id)
+    session.commit()
+    invalidate("catalog", "stock", user_id=user.id)
+    return {"ok": True}
+
+
+def _round_price(expr, rounding: str):
+    # round(double, int) não existe no Postgres: arredonda como numeric
+    def r(x, digits):
+        return cast(func.round(cast(x, Numeric(18, 6)), digits), Float)
+
+    if rounding == "cents":
+        return r(expr, 2)
+    if rounding == "integer":
+        return r(expr, 0)
+    # preço "psicológico": inteiro mais próximo menos 0,10/0,01 (abaixo de 1, centavos)
+    whole = r(expr, 0)
+    ending = 0.10 if rounding == "x.90" else 0.01
+    return case((whole >= 1, r(whole - ending, 2)), else_=r(expr, 2))
+
+
+@router.post("/categories/{category_id}/reprice")
+def reprice_category(
+    category_id: int,
+    data: RepriceIn,
+    session: Session = Depends(get_tenant_session),
+    user: User = Depends(get_current_user),
+):
+    cat = session.get(Category, category_id)
+    if not cat or cat.user_id != user.id:
+        raise HTTPException(status_code=404, detail="Categoria não encontrada.")
+
+    in_category = (Product.user_id == user.id) & (Product.category_id == category_id)
+    if data.mode == "percent":
+        if data.value <= -100:
+            raise HTTPException(status_code=400, detail="Redução percentual deve ser menor que 100%.")
+        new_price = Product.price * (1 + data.value / 100.0)
+    else:
+        new_price = Product.price + data.value
+        negative = session.exec(select(func.count()).where(in_category, new_price < 0)).one()
+        if negative:
+            raise HTTPException(status_code=400, detail=f"{negative} produto(s) ficariam com preço negativo.")
+
+    # um UPDATE para a categoria inteira (e um seq de catálogo para todos)
+    seq = touch_catalog(session, user.id)
+    updated = session.exec(
+        update(Product)
+        .where(in_category)
+        .values(price=_round_price(new_price, data.rounding), change_seq=seq, updated_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+    quote_ids = []
+    if data.update_draft_quotes and updated:
+        drafts = select(Quote.id).where(Quote.user_id == user.id, Quote.status == "DRAFT")
+        quote_ids = session.exec(
+            select(QuoteItem.quote_id)
+            .join(Product, Product.id == QuoteItem.product_id)
+            .where(in_category, QuoteItem.user_id == user.id, QuoteItem.quote_id.in_(drafts))
+            .distinct()
+        ).all()
+        if quote_ids:
+            # UPDATE ... FROM product: preço novo e totais da linha no mesmo comando
+            session.exec(
+                update(QuoteItem)
+                .where(
+                    QuoteItem.product_id == Product.id,
+                    in_category,
+                    QuoteItem.user_id == user.id,
+                    QuoteItem.quote_id.in_(quote_ids),
+                )
+                .values(
+                    unit_price=Product.price,
+                    **line_values(QuoteItem.quantity, Product.price, QuoteItem.discount_percent),
+                )
+                .execution_options(synchronize_session=False)
+            )
+            refresh_totals(session, user.id, quote_ids)
+
+    session.commit()
+    invalidate("catalog", "stock", user_id=user.id)
+    if quote_ids:
+        invalidate("quotes", user_id=user.id)
+        if broker.has_subscribers(user.id):
+            for q in session.exec(select(Quote).where(Quote.id.in_(quote_ids))).all():
+                publish_quote(q)
+
+    return {"category_id": category_id, "updated": updated, "quotes_recalculated": len(quote_ids)}
+
+
 # ---------- Products ----------
 class ProductIn(BaseModel):
     sku: str
@@ -122,10 +262,31 @@ class ProductPatch(BaseModel):
     pack_factor: Optional[float] = None
 
 
+def _sku_taken(session: Session, user_id: int, sku: str, product_id: Optional[int] = None) -> bool:
+    stmt = select(Product.id).where(Product.user_id == user_id).where(Product.sku == sku)
+    if product_id is not None:
+        stmt = stmt.where(Product.id != product_id)
+    return session.exec(stmt).first() is not None
+
+
+def _save_product(session: Session, user_id: int, p: Product) -> None:
+    # a checagem antes é só a mensagem amigável: dois pedidos com o mesmo SKU
+    # passam juntos por ela e quem segura é o índice único (user_id, sku)
+    product_id, sku = p.id, p.sku
+    try:
+        mark_changed(session, user_id, p)
+        session.commit()
+    except IntegrityError:
+        session.rollback()
+        if _sku_taken(session, user_id, sku, product_id):
+            raise HTTPException(status_code=409, detail="SKU já existe.")
+        raise
+
+
 @router.post("/products", response_model=Product)
 def create_product(
     data: ProductIn,
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_tenant_session),
     user: User = Depends(get_current_user),
 ):
     sku = (data.sku or "").strip()
@@ -140,12 +301,7 @@ def create_product(
     if data.pack_factor <= 0:
         raise HTTPException(status_code=400, detail="Fator de embalagem deve ser > 0.")
 
-    exists = session.exec(
-        select(Product)
-        .where(Product.user_id == user.id)
-        .where(Product.sku == sku)
-    ).first()
-    if exists:
+    if _sku_taken(session, user.id, sku):
         raise HTTPException(status_code=409, detail="SKU já existe.")
 
     cat = session.get(Category, data.category_id)
@@ -161,69 +317,81 @@ def create_product(
         price=float(data.price),
         pack_factor=float(data.pack_factor),
     )
-    session.add(p)
-    session.commit()
+    _save_product(session, user.id, p)
+    invalidate("catalog", "stock", user_id=user.id)
     session.refresh(p)
     return p
 
 
 @router.get("/products", response_model=list[Product])
 def list_products(
-    session: Session = Depends(get_session),
-    user: User = Depends(get_current_user),
+    fields: Optional[str] = None,
+    session: Session = Depends(get_read_session),
+    user: User = Depends(get_current_reader),
 ):
-    return session.exec(
-        select(Product).where(Product.user_id == user.id).order_by(Product.id.desc())
-    ).all()
+    names = parse_fields(Product, fields)
+    if names is not None:
+        stmt = select_fields(Product, names).where(Product.user_id == user.id).order_by(Product.id.desc())
+        return sparse_response(catalog_cache.get_or_load(
+            session, user.id, ("products", names), lambda: rows(session, stmt),
+        ))
+    return catalog_cache.get_or_load(session, user.id, "products", lambda: [
+        p.model_dump() for p in session.exec(
+            select(Product).where(Product.user_id == user.id).order_by(Product.id.desc())
+        ).all()
+    ])
 
 
 @router.get("/products/min")
 def products_min(
-    session: Session = Depends(get_session),
-    user: User = Depends(get_current_user),
+    session: Session = Depends(get_read_session),
+    user: User = Depends(get_current_reader),
 ):
     # Dropdown + orçamento: precisa preço e desconto padrão da categoria
-    stmt = (
-        select(
-            Product.id,
-            Product.sku,
-            Product.name,
-            Product.unit,
-            Product.price,
-            Product.pack_factor,
-            Product.category_id,
-            Category.name,
-            Category.auto_discount_enabled,
-            Category.default_discount_percent,
+    def load():
+        stmt = (
+            select(
+                Product.id,
+                Product.sku,
+                Product.name,
+                Product.unit,
+                Product.price,
+                Product.pack_factor,
+                Product.category_id,
+                Category.name,
+                Category.auto_discount_enabled,
+                Category.default_discount_percent,
+            )
+            .join(Category, Category.id == Product.category_id)
+            .where(Product.user_id == user.id)
+            .order_by(Product.name.asc())
         )
-        .join(Category, Category.id == Product.category_id)
-        .where(Product.user_id == user.id)
-        .order_by(Product.name.asc())
-    )
 
-    rows = session.exec(stmt).all()
-    return [
-        {
-            "id": r[0],
-            "sku": r[1],
-            "name": r[2],
-            "unit": r[3],
-            "price": r[4],
-            "pack_factor": r[5],
-            "category_id": r[6],
-            "category_name": r[7],
-            "auto_discount_enabled": r[8],
-            "default_discount_percent": r[9],
-        }
-        for r in rows
-    ]
+        rows = session.exec(stmt).all()
+        return [
+            {
+                "id": r[0],
+                "sku": r[1],
+                "name": r[2],
+                "unit": r[3],
+                "price": r[4],
+                "pack_factor": r[5],
+                "category_id": r[6],
+                "category_name": r[7],
+                "auto_discount_enabled": r[8],
+                "default_discount_percent": r[9],
+            }
+            for r in rows
+        ]
+
+    return catalog_cache.get_or_load(session, user.id, "products_min", load)
 
 
 @router.patch("/products/{product_id}", response_model=Product)
 def patch_product(
     product_id: int,
     data: ProductPatch,
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_tenant_session),
     user: User = Depends(get_current_user),
 ):
     p = session.get(Product, product_id)
@@ -234,13 +402,7 @@ def patch_product(
         sku = data.sku.strip()
         if not sku:
             raise HTTPException(status_code=400, detail="SKU inválido.")
-        exists = session.exec(
-            select(Product)
-            .where(Product.user_id == user.id)
-            .where(Product.sku == sku)
-            .where(Product.id != product_id)
-        ).first()
-        if exists:
+        if _sku_taken(session, user.id, sku, product_id):
             raise HTTPException(status_code=409, detail="SKU já existe.")
         p.sku = sku
 
@@ -272,7 +434,35 @@ def patch_product(
             raise HTTPException(status_code=400, detail="Categoria inválida.")
         p.category_id = int(data.category_id)
 
-    session.add(p)
-    session.commit()
+    _save_product(session, user.id, p)
+    invalidate("catalog", "stock", user_id=user.id)
     session.refresh(p)
     return p
+
+
+@router.delete("/products/{product_id}")
+def delete_product(
+    product_id: int,
+    session: Session = Depends(get_tenant_session),
+    user: User = Depends(get_current_user),
+):
+    p = session.get(Product, product_id)
+    if not p or p.user_id != user.id:
+        raise HTTPException(status_code=404, detail="Produto não encontrado.")
+
+    # histórico de estoque e orçamentos apontam pro produto
+    for model in (StockMovement, StockMovementArchive, QuoteItem):
+        used = session.exec(
+            select(model.id).where(model.user_id == user.id).where(model.product_id == product_id).limit(1)
+        ).first()
+        if used:
+            raise HTTPException(status_code=409, detail="Produto possui movimentações ou orçamentos.")
+
+    # ponto de pedido e alertas vão junto com o produto
+    for model in (StockAlert, ReorderPoint):
+        session.exec(delete(model).where(model.user_id == user.id, model.product_id == product_id))
+    session.delete(p)
+    touch_catalog(session, user.id, op="delete", entity="product", entity_id=product_id)
+    session.commit()
+    invalidate("catalog", "stock", user_id=user.id)
+    return {"ok": True}
@@ -1,12 +1,108 @@
+import itertools
+import os
+import threading
+import time
+
+from sqlalchemy import event
 from sqlmodel import Session, create_engine
 
-DATABASE_URL = "sqlite:///./dev.db"
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./dev.db")
+
+# réplicas de leitura, separadas por vírgula (vazio = tudo no primário)
+READ_REPLICA_URLS = [u.strip() for u in os.getenv("READ_REPLICA_URLS", "").split(",") if u.strip()]
+# depois de uma escrita, as leituras do mesmo usuário ficam no primário por
+# esse tempo (cobre o atraso de replicação)
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+
+# shards de tenants além do banco principal: "nome=url,nome=url". O
+# principal ("default") guarda o diretório de usuários (login, User.shard)
+DEFAULT_SHARD = "default"
+SHARD_URLS = {
+    name.strip(): url.strip()
+    for name, _, url in (s.partition("=") for s in os.getenv("SHARDS", "").split(",") if s.strip())
+}
+NEW_TENANT_SHARD = os.getenv("NEW_TENANT_SHARD", DEFAULT_SHARD)
+
+# um pool por banco: tenant pesado esgota o pool do shard dele, não o dos outros
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+# segundos esperando conexão antes do 503: curto, para recusar em vez de enfileirar
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "2"))
+
+
+def _create_engine(url: str):
+    if url.startswith("sqlite"):
+        eng = create_engine(url, echo=False, connect_args={"check_same_thread": False})
+
+        @event.listens_for(eng, "connect")
+        def _pragmas(dbapi_conn, _):
+            # só vale para arquivo novo (antes da primeira tabela): o scheduler
+            # devolve as páginas livres aos poucos em vez de um VACUUM inteiro
+            dbapi_conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            # leitor não segura escritor (o /batch lê dentro de uma transação
+            # só); em :memory: o SQLite ignora
+            dbapi_conn.execute("PRAGMA journal_mode = WAL")
+
+        return eng
+    return create_engine(
+        url,
+        echo=False,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+    )
+
+
+engine = _create_engine(DATABASE_URL)
+replica_engines = [_create_engine(url) for url in READ_REPLICA_URLS]
+shard_engines = {DEFAULT_SHARD: engine}
+shard_engines.update({name: _create_engine(url) for name, url in SHARD_URLS.items() if name != DEFAULT_SHARD})
+
+_next_replica = itertools.count()
+# user_id -> instante (monotonic) até quando lê do primário; só deste processo.
+# Ordem de inserção = ordem de expiração (o prazo é o mesmo para todos)
+_pinned: dict[int, float] = {}
+_pinned_lock = threading.Lock()
+
+
+def shard_engine(name: str):
+    try:
+        return shard_engines[name]
+    except KeyError:
+        raise RuntimeError(f"shard desconhecido: {name!r} (confira SHARDS)")
+
+
+def pin_to_primary(user_id: int) -> None:
+    if not replica_engines:
+        return
+    now = time.monotonic()
+    with _pinned_lock:
+        # sai e volta no fim: mantém a ordem de expiração
+        _pinned.pop(user_id, None)
+        _pinned[user_id] = now + READ_YOUR_WRITES_SECONDS
+        # varre os vencidos do começo: quem escreveu uma vez e sumiu não fica aqui
+        for uid, until in list(itertools.islice(_pinned.items(), 64)):
+            if until > now:
+                break
+            del _pinned[uid]
+
+
+def read_engine(user_id: int | None = None, shard: str = DEFAULT_SHARD):
+    # réplicas só existem para o banco principal
+    if shard != DEFAULT_SHARD:
+        return shard_engine(shard)
+    if not replica_engines:
+        return engine
+    if user_id is not None:
+        until = _pinned.get(user_id)
+        if until is not None:
+            if until > time.monotonic():
+                return engine
+            with _pinned_lock:
+                if _pinned.get(user_id) == until:
+                    del _pinned[user_id]
+    return replica_engines[next(_next_replica) % len(replica_engines)]
 
-engine = create_engine(
-    DATABASE_URL,
-    echo=False,
-    connect_args={"check_same_thread": False},
-)
 
 def get_session():
     with Session(engine) as session:
@@ -0,0 +1,459 @@
+"""
+Documento do orçamento (HTML/PDF) para mandar ao cliente. A saída fica num
+cache em disco endereçado por conteúdo: `blobs/<sha256>` guarda o arquivo e
+`refs/<chave>` aponta para ele, com a chave derivada de (formato, tenant,
+orçamento, Quote.version). Alteração de item ou de status sobe a versão,
+então o documento velho simplesmente deixa de ser pedido — não há
+invalidação. O sha256 do conteúdo é o ETag.
+
+Render frio de orçamento grande (DOCUMENT_POOL_MIN_ITEMS itens ou mais) vai
+para um pool de processos (DOCUMENT_POOL_WORKERS) e não segura o GIL dos
+workers; os menores rodam no threadpool. Pedidos simultâneos do mesmo
+documento esperam um render só. O cache é por host e fica abaixo de
+DOCUMENT_CACHE_MAX_MB (sai o que foi lido há mais tempo).
+
+Só stdlib aqui: o pool importa este módulo nos processos filhos.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import html
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import BinaryIO, Callable, Iterator
+
+log = logging.getLogger("genericerp.documents")
+
+DOCUMENT_CACHE_DIR = Path(os.getenv("DOCUMENT_CACHE_DIR", "./document-cache"))
+DOCUMENT_CACHE_MAX_MB = float(os.getenv("DOCUMENT_CACHE_MAX_MB", "512"))
+DOCUMENT_POOL_WORKERS = int(os.getenv("DOCUMENT_POOL_WORKERS", "2"))
+DOCUMENT_POOL_MIN_ITEMS = int(os.getenv("DOCUMENT_POOL_MIN_ITEMS", "500"))
+
+# mudou o layout: sobe aqui e todas as chaves mudam junto
+RENDER_VERSION = 1
+
+FORMATS = {
+    "html": "text/html; charset=utf-8",
+    "pdf": "application/pdf",
+}
+
+STATUS_LABELS = {
+    "DRAFT": "Rascunho",
+    "SENT": "Enviado",
+    "APPROVED": "Aprovado",
+    "REJECTED": "Recusado",
+    "CANCELLED": "Cancelado",
+    "EXPIRED": "Expirado",
+}
+
+
+# =========================
+# FORMATAÇÃO
+# =========================
+def _money(v: float) -> str:
+    # 1234.5 -> 1.234,50
+    return f"{float(v or 0.0):,.2f}".replace(",", "_").replace(".", ",").replace("_", ".")
+
+
+def _qty(v: float) -> str:
+    s = f"{float(v):,.3f}".rstrip("0").rstrip(".")
+    return s.replace(",", "_").replace(".", ",").replace("_", ".")
+
+
+def _date(iso: str | None) -> str:
+    # AAAA-MM-DD -> DD/MM/AAAA
+    if not iso:
+        return "-"
+    y, m, d = iso[:10].split("-")
+    return f"{d}/{m}/{y}"
+
+
+# =========================
+# HTML
+# =========================
+_CSS = """
+body{font-family:Helvetica,Arial,sans-serif;font-size:12px;color:#222;margin:24px}
+h1{font-size:18px;margin:0 0 4px}
+.meta td{padding:1px 12px 1px 0}
+table.items{border-collapse:collapse;width:100%;margin-top:16px}
+table.items th,table.items td{border-bottom:1px solid #ddd;padding:4px 6px;text-align:left}
+table.items .n{text-align:right;white-space:nowrap}
+.totals{margin-top:12px;margin-left:auto}
+.totals td{padding:2px 6px}
+.totals .net td{font-weight:bold;border-top:1px solid #222}
+.notes{margin-top:16px;white-space:pre-wrap}
+@media print{body{margin:0}}
+"""
+
+
+def render_html(doc: dict) -> bytes:
+    e = html.escape
+    out = [
+        "<!doctype html><html lang=\"pt-BR\"><head><meta charset=\"utf-8\">",
+        f"<title>Orçamento #{doc['id']}</title><style>{_CSS}</style></head><body>",
+        f"<h1>Orçamento #{doc['id']}</h1><table class=\"meta\">",
+        f"<tr><td>Cliente</td><td>{e(doc['customer_name'])}</td></tr>",
+    ]
+    if doc["customer_email"]:
+        out.append(f"<tr><td>E-mail</td><td>{e(doc['customer_email'])}</td></tr>")
+    out += [
+        f"<tr><td>Emissão</td><td>{_date(doc['issued_at'])}</td></tr>",
+        f"<tr><td>Validade</td><td>{_date(doc['valid_until'])}</td></tr>",
+        f"<tr><td>Situação</td><td>{e(STATUS_LABELS.get(doc['status'], doc['status']))}</td></tr>",
+        "</table><table class=\"items\"><thead><tr><th>SKU</th><th>Produto</th><th>Un.</th>"
+        "<th class=\"n\">Qtd.</th><th class=\"n\">Preço</th><th class=\"n\">Desc. %</th>"
+        "<th class=\"n\">Total</th></tr></thead><tbody>",
+    ]
+    for sku, name, unit, qty, price, disc, net in doc["items"]:
+        out.append(
+            f"<tr><td>{e(sku)}</td><td>{e(name)}</td><td>{e(unit)}</td><td class=\"n\">{_qty(qty)}</td>"
+            f"<td class=\"n\">{_money(price)}</td><td class=\"n\">{_qty(disc)}</td>"
+            f"<td class=\"n\">{_money(net)}</td></tr>"
+        )
+    out += [
+        "</tbody></table><table class=\"totals\">",
+        f"<tr><td>Bruto</td><td class=\"n\">{_money(doc['total_gross'])}</td></tr>",
+        f"<tr><td>Descontos</td><td class=\"n\">{_money(doc['total_discount'])}</td></tr>",
+        f"<tr class=\"net\"><td>Total</td><td class=\"n\">{_money(doc['total_net'])}</td></tr>",
+        "</table>",
+    ]
+    if doc["notes"]:
+        out.append(f"<div class=\"notes\">{e(doc['notes'])}</div>")
+    out.append("</body></html>")
+    return "".join(out).encode("utf-8")
+
+
+# =========================
+# PDF (texto puro, fontes padrão do PDF: nada para instalar)
+# =========================
+_PAGE_W, _PAGE_H, _MARGIN = 595, 842, 40  # A4 em pontos
+_ROW = 11  # altura da linha da tabela (Courier 8)
+# colunas da tabela em caracteres de Courier 8 (4,8 pt cada)
+_COLS = ((14, "<"), (40, "<"), (4, "<"), (10, ">"), (12, ">"), (7, ">"), (14, ">"))
+_FONTS = {"F1": "Helvetica", "F2": "Helvetica-Bold", "F3": "Courier"}
+
+
+def _pdf_text(s: str) -> bytes:
+    b = s.encode("cp1252", "replace")
+    return b.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+
+
+def _fit(s: str, width: int) -> str:
+    return s if len(s) <= width else s[: width - 1] + "…"
+
+
+def _row(values) -> str:
+    return " ".join(
+        _fit(str(v), w).ljust(w) if align == "<" else _fit(str(v), w).rjust(w)
+        for v, (w, align) in zip(values, _COLS)
+    )
+
+
+def _pdf_pages(doc: dict) -> list[list[tuple]]:
+    """Cada página é uma lista de (fonte, tamanho, x, y, texto)."""
+    pages: list[list[tuple]] = []
+    header = _row(("SKU", "Produto", "Un.", "Qtd.", "Preço", "Desc.%", "Total"))
+
+    def new_page() -> list[tuple]:
+        page: list[tuple] = []
+        pages.append(page)
+        return page
+
+    page = new_page()
+    y = _PAGE_H - _MARGIN - 16
+    page.append(("F2", 16, _MARGIN, y, f"Orçamento #{doc['id']}"))
+    y -= 22
+    meta = [("Cliente", doc["customer_name"])]
+    if doc["customer_email"]:
+        meta.append(("E-mail", doc["customer_email"]))
+    meta += [
+        ("Emissão", _date(doc["issued_at"])),
+        ("Validade", _date(doc["valid_until"])),
+        ("Situação", STATUS_LABELS.get(doc["status"], doc["status"])),
+    ]
+    for label, value in meta:
+        page.append(("F2", 10, _MARGIN, y, label))
+        page.append(("F1", 10, _MARGIN + 70, y, value))
+        y -= 14
+    y -= 10
+
+    bottom = _MARGIN + 20
+    page.append(("F3", 8, _MARGIN, y, header))
+    y -= _ROW
+    for sku, name, unit, qty, price, disc, net in doc["items"]:
+        if y < bottom:
+            page = new_page()
+            y = _PAGE_H - _MARGIN
+            page.append(("F3", 8, _MARGIN, y, header))
+            y -= _ROW
+        page.append(("F3", 8, _MARGIN, y, _row((sku, name, unit, _qty(qty), _money(price), _qty(disc), _money(net)))))
+        y -= _ROW
+
+    lines = [
+        ("F1", f"Bruto: {_money(doc['total_gross'])}"),
+        ("F1", f"Descontos: {_money(doc['total_discount'])}"),
+        ("F2", f"Total: {_money(doc['total_net'])}"),
+    ]
+    notes = [ln[i:i + 100] for ln in (doc["notes"] or "").splitlines() for i in range(0, max(len(ln), 1), 100)]
+    if notes:
+        lines.append(("F1", ""))
+        lines += [("F1", ln) for ln in notes]
+    y -= 6
+    for font, text in lines:
+        if y < bottom:
+            page = new_page()
+            y = _PAGE_H - _MARGIN
+        page.append((font, 10, _MARGIN, y, text))
+        y -= 14
+
+    for n, p in enumerate(pages, 1):
+        p.append(("F1", 8, _PAGE_W - _MARGIN - 60, _MARGIN - 10, f"Página {n} de {len(pages)}"))
+    return pages
+
+
+def render_pdf(doc: dict) -> bytes:
+    pages = _pdf_pages(doc)
+    objects: list[bytes] = []
+
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    catalog = add(b"")  # preenchidos depois de saber os números
+    tree = add(b"")
+    fonts = {
+        name: add(f"<< /Type /Font /Subtype /Type1 /BaseFont /{base} /Encoding /WinAnsiEncoding >>".encode())
+        for name, base in _FONTS.items()
+    }
+    resources = "<< /Font << " + " ".join(f"/{n} {i} 0 R" for n, i in fonts.items()) + " >> >>"
+
+    kids = []
+    for ops in pages:
+        stream = b"\n".join(
+            b"BT /%s %d Tf 1 0 0 1 %d %d Tm (%s) Tj ET" % (font.encode(), size, x, y, _pdf_text(text))
+            for font, size, x, y, text in ops
+        )
+        data = zlib.compress(stream, 6)
+        content = add(b"<< /Length %d /Filter /FlateDecode >>\nstream\n%s\nendstream" % (len(data), data))
+        kids.append(add(
+            f"<< /Type /Page /Parent {tree} 0 R /MediaBox [0 0 {_PAGE_W} {_PAGE_H}] "
+            f"/Resources {resources} /Contents {content} 0 R >>".encode()
+        ))
+    objects[catalog - 1] = f"<< /Type /Catalog /Pages {tree} 0 R >>".encode()
+    objects[tree - 1] = (
+        f"<< /Type /Pages /Kids [{' '.join(f'{k} 0 R' for k in kids)}] /Count {len(kids)} >>".encode()
+    )
+
+    # sem data de criação: mesma entrada, mesmos bytes (o cache é por conteúdo)
+    out = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for n, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (n, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % off for off in offsets)
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog, xref)
+    return bytes(out)
+
+
+def render(fmt: str, doc: dict) -> bytes:
+    return render_pdf(doc) if fmt == "pdf" else render_html(doc)
+
+
+# =========================
+# CACHE EM DISCO
+# =========================
+def document_key(fmt: str, user_id: int, quote_id: int, created_at, version: int) -> str:
+    # created_at entra porque o id pode ser renumerado numa mudança de shard
+    raw = f"{RENDER_VERSION}:{fmt}:{user_id}:{quote_id}:{created_at}:{version}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _ref_path(key: str) -> Path:
+    return DOCUMENT_CACHE_DIR / "refs" / key[:2] / key
+
+
+def _blob_path(digest: str) -> Path:
+    return DOCUMENT_CACHE_DIR / "blobs" / digest[:2] / digest
+
+
+def _write(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_bytes(data)
+    tmp.replace(path)
+
+
+def lookup(key: str) -> tuple[Path, str] | None:
+    """(arquivo, sha256) do documento já renderizado, ou None."""
+    ref = _ref_path(key)
+    try:
+        digest = ref.read_text().strip()
+        blob = _blob_path(digest)
+        # mtime = último uso (a limpeza tira os mais antigos)
+        os.utime(blob)
+        os.utime(ref)
+    except (FileNotFoundError, ValueError):
+        return None
+    return blob, digest
+
+
+def store(key: str, body: bytes) -> tuple[Path, str]:
+    digest = hashlib.sha256(body).hexdigest()
+    blob = _blob_path(digest)
+    try:
+        os.utime(blob)
+    except FileNotFoundError:
+        _write(blob, body)
+    _write(_ref_path(key), digest.encode())
+    _maybe_prune()
+    return blob, digest
+
+
+_prune_lock = threading.Lock()
+_last_prune = 0.0
+
+
+def _maybe_prune() -> None:
+    global _last_prune
+    now = time.monotonic()
+    if now - _last_prune < 60 or not _prune_lock.acquire(blocking=False):
+        return
+    try:
+        _last_prune = now
+        prune()
+    finally:
+        _prune_lock.release()
+
+
+def prune(max_bytes: float | None = None) -> int:
+    """Apaga os arquivos usados há mais tempo até caber no limite; devolve quantos saíram."""
+    limit = DOCUMENT_CACHE_MAX_MB * 1024 * 1024 if max_bytes is None else max_bytes
+    files = []
+    total = 0
+    for f in DOCUMENT_CACHE_DIR.glob("*/*/*"):
+        try:
+            st = f.stat()
+        except FileNotFoundError:
+            continue
+        files.append((st.st_mtime, st.st_size, f))
+        total += st.st_size
+    removed = 0
+    # ref sem blob (ou o contrário) só vira um render de novo
+    for _, size, f in sorted(files):
+        if total <= limit:
+            break
+        f.unlink(missing_ok=True)
+        total -= size
+        removed += 1
+    return removed
+
+
+# =========================
+# RENDER (threadpool ou pool de processos)
+# =========================
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+_inflight: dict[str, asyncio.Future] = {}
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: o filho não herda as threads (scheduler, barramento) nem as conexões
+            _pool = ProcessPoolExecutor(
+                max_workers=DOCUMENT_POOL_WORKERS, mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+
+def shutdown() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+async def _render_and_store(key: str, fmt: str, load: Callable[[], dict]) -> tuple[Path, str]:
+    from starlette.concurrency import run_in_threadpool
+
+    doc = await run_in_threadpool(load)
+    body = None
+    if DOCUMENT_POOL_WORKERS > 0 and len(doc["items"]) >= DOCUMENT_POOL_MIN_ITEMS:
+        try:
+            body = await asyncio.wrap_future(_get_pool().submit(render, fmt, doc))
+        except BrokenProcessPool:
+            # filho morreu (OOM, kill): o próximo pedido sobe um pool novo
+            log.exception("pool de documentos quebrado; renderizando no threadpool")
+            shutdown()
+    if body is None:
+        body = await run_in_threadpool(render, fmt, doc)
+    return await run_in_threadpool(store, key, body)
+
+
+async def get_document(key: str, fmt: str, load: Callable[[], dict]) -> tuple[Path, str]:
+    """
+    Documento do cache ou renderizado agora. `load` (síncrona, roda no
+    threadpool) devolve os dados do orçamento; só é chamada num miss.
+    """
+    from starlette.concurrency import run_in_threadpool
+
+    hit = await run_in_threadpool(lookup, key)
+    if hit is not None:
+        return hit
+    fut = _inflight.get(key)
+    if fut is not None:
+        # mesmo documento já sendo renderizado: espera aquele
+        return await asyncio.shield(fut)
+    fut = asyncio.get_running_loop().create_future()
+    _inflight[key] = fut
+    try:
+        result = await _render_and_store(key, fmt, load)
+    except asyncio.CancelledError:
+        fut.cancel()
+        raise
+    except Exception as e:
+        fut.set_exception(e)
+        # ninguém esperando: não deixa "exception never retrieved" no log
+        fut.exception()
+        raise
+    else:
+        fut.set_result(result)
+        return result
+    finally:
+        _inflight.pop(key, None)
+
+
+async def open_document(key: str, fmt: str, load: Callable[[], dict]) -> tuple[BinaryIO, str]:
+    """
+    get_document com o arquivo já aberto: a limpeza pode apagar o blob depois
+    disso sem quebrar a resposta (o arquivo aberto continua legível).
+    """
+    from starlette.concurrency import run_in_threadpool
+
+    path, digest = await get_document(key, fmt, load)
+    try:
+        return await run_in_threadpool(open, path, "rb"), digest
+    except FileNotFoundError:
+        # a limpeza levou o blob entre o lookup e o open: conta como miss
+        log.info("documento %s sumiu do cache antes de abrir; renderizando de novo", key)
+        path, digest = await _render_and_store(key, fmt, load)
+        return await run_in_threadpool(open, path, "rb"), digest
+
+
+def iter_file(f: BinaryIO, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+    # fecha o arquivo no fim (ou quando o cliente desconecta)
+    with f:
+        while data := f.read(chunk_size):
+            yield data
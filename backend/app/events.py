@@ -0,0 +1,102 @@
+"""
+Pub/sub em processo para o stream SSE (GET /events). As rotas publicam
+depois do commit (de threads do threadpool); cada cliente conectado tem uma
+fila limitada no event loop. Cliente lento que enche a fila recebe
+`resync` e é desconectado — ao reconectar, recarrega as telas.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import threading
+
+EVENTS_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", "100"))
+EVENTS_HEARTBEAT_SECONDS = float(os.getenv("EVENTS_HEARTBEAT_SECONDS", "15"))
+
+_CLOSE = object()
+
+
+class Subscriber:
+    def __init__(self, user_id: int, loop: asyncio.AbstractEventLoop, maxsize: int):
+        self.user_id = user_id
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.closed = False
+
+    def offer(self, item) -> None:
+        # roda no event loop
+        if self.closed:
+            return
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self.closed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(("resync", {}))
+            self.queue.put_nowait(_CLOSE)
+
+
+class Broker:
+    def __init__(self, queue_size: int = EVENTS_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subs: dict[int, set[Subscriber]] = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id: int) -> Subscriber:
+        sub = Subscriber(user_id, asyncio.get_running_loop(), self.queue_size)
+        with self._lock:
+            self._subs.setdefault(user_id, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscriber) -> None:
+        sub.closed = True
+        with self._lock:
+            subs = self._subs.get(sub.user_id)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._subs[sub.user_id]
+
+    def has_subscribers(self, user_id: int) -> bool:
+        return user_id in self._subs
+
+    def publish(self, user_id: int, event: str, data: dict) -> int:
+        with self._lock:
+            subs = list(self._subs.get(user_id, ()))
+        for sub in subs:
+            try:
+                sub.loop.call_soon_threadsafe(sub.offer, (event, data))
+            except RuntimeError:
+                # loop já fechado (shutdown)
+                self.unsubscribe(sub)
+        return len(subs)
+
+    def connected(self) -> int:
+        with self._lock:
+            return sum(len(s) for s in self._subs.values())
+
+
+broker = Broker()
+
+
+def format_sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'), default=str)}\n\n"
+
+
+async def stream(sub: Subscriber):
+    try:
+        yield "retry: 3000\n\n"
+        while True:
+            try:
+                item = await asyncio.wait_for(sub.queue.get(), timeout=EVENTS_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                # comentário SSE: mantém proxies abertos e revela cliente que caiu
+                yield ": ping\n\n"
+                continue
+            if item is _CLOSE:
+                return
+            yield format_sse(*item)
+    finally:
+        broker.unsubscribe(sub)
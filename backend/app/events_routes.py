@@ -0,0 +1,19 @@
+from fastapi import APIRouter
+from fastapi.responses import StreamingResponse
+
+from .auth import decode_token
+from .events import broker, stream
+
+router = APIRouter()
+
+
+@router.get("/events")
+async def events(token: str):
+    # EventSource não manda header Authorization: token vai na query
+    user_id = decode_token(token)
+    sub = broker.subscribe(user_id)
+    return StreamingResponse(
+        stream(sub),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
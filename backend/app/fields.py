@@ -0,0 +1,39 @@
+"""
+`?fields=id,name` nas listas: só as colunas pedidas entram no SELECT, as
+linhas viram dicts direto do cursor (sem montar o model) e a resposta sai
+sem passar pelo response_model.
+"""
+from __future__ import annotations
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import select
+
+
+def parse_fields(model, fields: str | None) -> tuple[str, ...] | None:
+    """Nomes pedidos, na ordem e sem repetição; None = model inteiro."""
+    if fields is None:
+        return None
+    names = tuple(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+    if not names:
+        raise HTTPException(status_code=400, detail="fields is empty")
+    columns = model.__table__.c
+    unknown = [n for n in names if n not in columns]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"unknown fields: {', '.join(unknown)}")
+    return names
+
+
+def select_fields(model, names: tuple[str, ...]):
+    # select do SQLAlchemy: devolve Row, não instâncias do model
+    columns = model.__table__.c
+    return select(*(columns[n] for n in names))
+
+
+def rows(session, stmt) -> list[dict]:
+    return [dict(r._mapping) for r in session.exec(stmt)]
+
+
+def sparse_response(data: list[dict]) -> JSONResponse:
+    return JSONResponse(jsonable_encoder(data))
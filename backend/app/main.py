@@ -1,14 +1,23 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from sqlmodel import SQLModel
+from fastapi.responses import JSONResponse
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 
-from .db import engine
-from . import models  # noqa: F401
+from .bus import bus
+from .documents import shutdown as shutdown_documents
+from .migrations import migrate_shards
+from .profiler import ProfilerMiddleware, instrument
+from .scheduler import SCHEDULER_ENABLED, scheduler
+from .slowlog import SlowQueryMiddleware
 
+from .admin_routes import router as admin_router
 from .auth_routes import router as auth_router
+from .batch_routes import router as batch_router
 from .catalog_routes import router as catalog_router
+from .events_routes import router as events_router
 from .quotes_routes import router as quotes_router
 from .stock_routes import router as stock_router
+from .sync_routes import router as sync_router
 
 app = FastAPI(title="GenericERP API", version="0.4.0")
 
@@ -29,7 +38,22 @@ app.add_middleware(
 
 @app.on_event("startup")
 def on_startup():
-    SQLModel.metadata.create_all(engine)
+    # só confere a versão do schema; índices pesados rodam à parte (--online)
+    migrate_shards()
+    bus.start()
+    if SCHEDULER_ENABLED:
+        scheduler.start()
+
+@app.on_event("shutdown")
+def on_shutdown():
+    scheduler.stop()
+    bus.stop()
+    shutdown_documents()
+
+@app.exception_handler(PoolTimeoutError)
+def pool_exhausted(request: Request, exc: PoolTimeoutError):
+    # pool do shard esgotado (DB_POOL_TIMEOUT): recusa em vez de enfileirar
+    return JSONResponse(status_code=503, content={"detail": "database busy"}, headers={"Retry-After": "1"})
 
 @app.get("/health")
 def health():
@@ -43,3 +67,13 @@ app.include_router(auth_router, prefix="/auth", tags=["auth"])
 app.include_router(catalog_router, tags=["catalog"])
 app.include_router(quotes_router, tags=["quotes"])
 app.include_router(stock_router, tags=["stock"])
+app.include_router(events_router, tags=["events"])
+app.include_router(sync_router, tags=["sync"])
+app.include_router(admin_router, tags=["admin"])
+app.include_router(batch_router, tags=["batch"])
+
+# profiler por requisição (X-Profile: <ADMIN_TOKEN> ou PROFILE_SAMPLE_RATE)
+app.add_middleware(ProfilerMiddleware)
+# rota de origem no log de consultas lentas (SLOW_QUERY_MS)
+app.add_middleware(SlowQueryMiddleware)
+instrument(app)
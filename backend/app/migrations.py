@@ -0,0 +1,360 @@
+"""
+Migrações versionadas. O startup só lê as versões aplicadas (uma query) e
+roda o que faltar; construções pesadas (índices em tabelas grandes) ficam
+em migrações "online", rodadas à parte para não travar o boot:
+
+    cd backend
+    python -m app.migrations             # aplica as pendentes (o startup já faz isso)
+    python -m app.migrations --online    # inclui as online (CREATE INDEX CONCURRENTLY no Postgres)
+    python -m app.migrations --status
+    python -m app.migrations --shard big  # só um shard (default: todos os de db.SHARDS)
+
+Toda migração precisa ser idempotente (checkfirst / IF NOT EXISTS): bancos
+criados antes das migrações já têm as tabelas da versão 1.
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import sys
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable
+
+from sqlalchemy import func, inspect, select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.schema import CreateColumn, CreateIndex
+from sqlmodel import SQLModel
+
+from .models import (
+    CacheEvent,
+    CatalogChange,
+    Category,
+    JobLease,
+    PasswordReset,
+    Product,
+    Quote,
+    QuoteDailySummary,
+    QuoteItem,
+    ReorderPoint,
+    SchemaVersion,
+    StockAlert,
+    StockMovement,
+    StockMovementArchive,
+    StockPeriod,
+    User,
+)
+from .quotes import rebuild_summary
+
+log = logging.getLogger("genericerp.migrations")
+
+# chave do pg_advisory_xact_lock: só um worker migra por vez
+_LOCK_KEY = 0x6E5E_21C0
+
+
+class MigrationError(RuntimeError):
+    """A migração não pode seguir sem alguém mexer nos dados (nada é registrado)."""
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    apply: Callable[[Connection], None]
+    online: bool = False
+
+
+MIGRATIONS: list[Migration] = []
+
+
+def migration(version: int, name: str, online: bool = False):
+    def deco(fn: Callable[[Connection], None]):
+        MIGRATIONS.append(Migration(version=version, name=name, apply=fn, online=online))
+        MIGRATIONS.sort(key=lambda m: m.version)
+        return fn
+    return deco
+
+
+# =========================
+# HELPERS
+# =========================
+def add_column(conn: Connection, model, column_name: str) -> None:
+    table = model.__table__
+    existing = {c["name"] for c in inspect(conn).get_columns(table.name)}
+    if column_name in existing:
+        return
+    ddl = CreateColumn(table.c[column_name]).compile(dialect=conn.dialect)
+    conn.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN {ddl}'))
+
+
+def _check_unique(conn: Connection, index) -> None:
+    # falhar aqui, com os valores na mensagem, e não no meio do CREATE INDEX
+    cols = list(index.columns)
+    dups = conn.execute(
+        select(*cols, func.count()).group_by(*cols).having(func.count() > 1).limit(5)
+    ).all()
+    if dups:
+        names = ", ".join(c.name for c in cols)
+        sample = "; ".join(", ".join(map(str, d[:-1])) + f" ({d[-1]}x)" for d in dups)
+        raise MigrationError(
+            f"{index.name}: {index.table.name} tem valores repetidos em ({names}), ex.: {sample}. "
+            "Corrija ou apague as linhas duplicadas e rode de novo `python -m app.migrations --online`"
+        )
+
+
+def _pg_index_valid(conn: Connection, name: str) -> bool:
+    return bool(conn.execute(text(
+        "SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+        "WHERE c.relname = :name AND pg_table_is_visible(c.oid)"
+    ), {"name": name}).scalar())
+
+
+def create_index(conn: Connection, index, concurrently: bool = False) -> None:
+    # concurrently só vale em migração online (conexão em autocommit)
+    if index.unique:
+        _check_unique(conn, index)
+    ddl = str(CreateIndex(index, if_not_exists=True).compile(dialect=conn.dialect))
+    if not (concurrently and conn.dialect.name == "postgresql"):
+        conn.execute(text(ddl))
+        return
+
+    ddl = ddl.replace("INDEX IF NOT EXISTS", "INDEX CONCURRENTLY IF NOT EXISTS", 1)
+    # CONCURRENTLY que falha no meio deixa o índice INVALID, e o IF NOT EXISTS
+    # da próxima tentativa passaria reto por ele: confere e reconstrói uma vez
+    for _ in range(2):
+        try:
+            conn.execute(text(ddl))
+        except DBAPIError:
+            drop_index(conn, index.name, concurrently=True)
+            raise
+        if _pg_index_valid(conn, index.name):
+            return
+        log.warning("índice %s ficou INVALID: reconstruindo", index.name)
+        drop_index(conn, index.name, concurrently=True)
+    raise MigrationError(f"{index.name}: CREATE INDEX CONCURRENTLY terminou INVALID duas vezes")
+
+
+def drop_index(conn: Connection, name: str, concurrently: bool = False) -> None:
+    if concurrently and conn.dialect.name == "postgresql":
+        conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS "{name}"'))
+    else:
+        conn.execute(text(f'DROP INDEX IF EXISTS "{name}"'))
+
+
+# =========================
+# MIGRAÇÕES
+# =========================
+# o que o create_all do startup criava até a v0.4.0
+BASELINE = (User, PasswordReset, Category, Product, StockMovement, Quote, QuoteItem)
+
+
+@migration(1, "baseline")
+def _baseline(conn: Connection) -> None:
+    SQLModel.metadata.create_all(conn, tables=[m.__table__ for m in BASELINE])
+
+
+@migration(2, "composite indexes for tenant access paths", online=True)
+def _composite_indexes(conn: Connection) -> None:
+    for model in (Category, Product, StockMovement, Quote, QuoteItem):
+        for index in model.__table__.indexes:
+            create_index(conn, index, concurrently=True)
+    # cobertos pelos compostos acima (mesmo prefixo) ou nunca usados sozinhos
+    for name in (
+        "ix_category_user_id", "ix_category_name",
+        "ix_product_user_id", "ix_product_sku",
+        "ix_stockmovement_user_id", "ix_stockmovement_product_id", "ix_stockmovement_type",
+        "ix_quote_user_id",
+        "ix_quoteitem_quote_id", "ix_quoteitem_user_id",
+    ):
+        drop_index(conn, name, concurrently=True)
+
+
+@migration(3, "stock movement archive and closed periods")
+def _stock_archive(conn: Connection) -> None:
+    SQLModel.metadata.create_all(conn, tables=[StockMovementArchive.__table__, StockPeriod.__table__])
+
+
+@migration(4, "tenant shard columns on user")
+def _user_shard(conn: Connection) -> None:
+    add_column(conn, User, "shard")
+    add_column(conn, User, "shard_frozen")
+
+
+@migration(5, "catalog change tracking for delta sync")
+def _catalog_changes(conn: Connection) -> None:
+    SQLModel.metadata.create_all(conn, tables=[CatalogChange.__table__])
+    for model in (Category, Product):
+        add_column(conn, model, "updated_at")
+        add_column(conn, model, "change_seq")
+        table = model.__table__
+        conn.execute(table.update().where(table.c.updated_at.is_(None)).values(updated_at=table.c.created_at))
+    create_index(conn, next(i for i in Category.__table__.indexes if i.name == "ix_category_user_id_change_seq"))
+    create_index(conn, next(i for i in Product.__table__.indexes if i.name == "ix_product_user_id_change_seq"))
+
+
+@migration(6, "job leases and password reset expiry index")
+def _job_leases(conn: Connection) -> None:
+    SQLModel.metadata.create_all(conn, tables=[JobLease.__table__])
+    create_index(conn, next(i for i in PasswordReset.__table__.indexes if i.name == "ix_passwordreset_expires_at"))
+
+
+@migration(7, "cache invalidation events")
+def _cache_events(conn: Connection) -> None:
+    SQLModel.metadata.create_all(conn, tables=[CacheEvent.__table__])
+
+
+@migration(8, "reorder points and stock alerts")
+def _stock_alerts(conn: Connection) -> None:
+    SQLModel.metadata.create_all(conn, tables=[ReorderPoint.__table__, StockAlert.__table__])
+
+
+@migration(9, "quote daily summary")
+def _quote_summary(conn: Connection) -> None:
+    SQLModel.metadata.create_all(conn, tables=[QuoteDailySummary.__table__])
+    # orçamentos que já existem entram de uma vez (um INSERT ... SELECT)
+    rebuild_summary(conn)
+
+
+@migration(10, "quote version for document cache")
+def _quote_version(conn: Connection) -> None:
+    add_column(conn, Quote, "version")
+
+
+# =========================
+# RUNNER
+# =========================
+def applied_versions(engine: Engine) -> set[int]:
+    try:
+        with engine.connect() as conn:
+            return set(conn.execute(select(SchemaVersion.version)).scalars())
+    except DBAPIError:
+        # banco novo: nem a tabela de versões existe ainda
+        return set()
+
+
+def _record(conn: Connection, m: Migration) -> None:
+    if conn.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    # dois workers subindo juntos: quem chegar depois não derruba o startup
+    conn.execute(dialect_insert(SchemaVersion.__table__).values(
+        version=m.version, name=m.name, applied_at=datetime.utcnow(),
+    ).on_conflict_do_nothing())
+
+
+def is_empty(engine: Engine) -> bool:
+    # sem schemaversion não quer dizer banco novo: o create_all antigo também
+    # não criava a tabela. Qualquer linha em qualquer tabela da versão 1 conta
+    # (um banco só com usuários e catálogo já não é novo)
+    with engine.connect() as conn:
+        insp = inspect(conn)
+        for model in BASELINE:
+            table = model.__table__
+            if insp.has_table(table.name) and conn.execute(select(table.c.id).limit(1)).first() is not None:
+                return False
+    return True
+
+
+def migrate(engine: Engine, online: bool = False) -> list[int]:
+    """Aplica as migrações pendentes e devolve as versões aplicadas."""
+    applied = applied_versions(engine)
+    if not applied and is_empty(engine):
+        # banco novo: tabelas vazias, as online custam nada e já entram agora
+        online = True
+    todo = [m for m in MIGRATIONS if m.version not in applied and (online or not m.online)]
+
+    late = [m for m in MIGRATIONS if m.version not in applied and m.online and not online]
+    if late:
+        log.warning(
+            "%d migração(ões) online pendente(s) (%s): rode `python -m app.migrations --online`",
+            len(late), ", ".join(str(m.version) for m in late),
+        )
+    if not todo:
+        return []
+
+    done = []
+    regular = [m for m in todo if not m.online]
+    if regular:
+        with engine.begin() as conn:
+            if conn.dialect.name == "postgresql":
+                conn.execute(text("SELECT pg_advisory_xact_lock(:k)"), {"k": _LOCK_KEY})
+            SchemaVersion.__table__.create(conn, checkfirst=True)
+            # outro worker pode ter migrado enquanto esperávamos o lock
+            applied = set(conn.execute(select(SchemaVersion.version)).scalars())
+            for m in regular:
+                if m.version in applied:
+                    continue
+                log.info("migração %s: %s", m.version, m.name)
+                m.apply(conn)
+                _record(conn, m)
+                done.append(m.version)
+
+    online_todo = [m for m in todo if m.online]
+    if online_todo:
+        # fora de transação: no Postgres vira CREATE INDEX CONCURRENTLY. O lock
+        # é de sessão (não de transação): segura o laço inteiro
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            pg = conn.dialect.name == "postgresql"
+            if pg:
+                conn.execute(text("SELECT pg_advisory_lock(:k)"), {"k": _LOCK_KEY})
+            try:
+                SchemaVersion.__table__.create(conn, checkfirst=True)
+                for m in online_todo:
+                    if m.version in set(conn.execute(select(SchemaVersion.version)).scalars()):
+                        continue
+                    log.info("migração online %s: %s", m.version, m.name)
+                    m.apply(conn)
+                    _record(conn, m)
+                    done.append(m.version)
+            finally:
+                if pg:
+                    conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": _LOCK_KEY})
+
+    return done
+
+
+def migrate_shards(online: bool = False) -> dict[str, list[int]]:
+    # todo shard tem o schema inteiro (o diretório de usuários só é usado no default)
+    from .db import shard_engines
+
+    return {name: migrate(eng, online=online) for name, eng in shard_engines.items()}
+
+
+def main(argv=None) -> int:
+    from .db import shard_engine, shard_engines
+
+    parser = argparse.ArgumentParser(prog="python -m app.migrations")
+    parser.add_argument("--online", action="store_true", help="inclui as migrações online (índices pesados)")
+    parser.add_argument("--status", action="store_true", help="só mostra o que está aplicado/pendente")
+    parser.add_argument("--shard", action="append", help="restringe a um shard (repetível)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    names = args.shard or list(shard_engines)
+    for name in names:
+        engine = shard_engine(name)
+        if len(shard_engines) > 1:
+            print(f"== {name}")
+
+        if args.status:
+            applied = applied_versions(engine)
+            for m in MIGRATIONS:
+                mark = "x" if m.version in applied else " "
+                kind = " (online)" if m.online else ""
+                print(f"[{mark}] {m.version:>3} {m.name}{kind}")
+            continue
+
+        try:
+            done = migrate(engine, online=args.online)
+        except MigrationError as e:
+            print(f"erro: {e}", file=sys.stderr)
+            return 1
+        print("nada a fazer" if not done else f"aplicadas: {', '.join(map(str, done))}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,6 +3,7 @@ from __future__ import annotations
 from datetime import datetime, date
 from typing import Optional, List
 
+from sqlalchemy import Index, false, text
 from sqlmodel import SQLModel, Field, Relationship
 
 
@@ -15,13 +16,17 @@ class User(SQLModel, table=True):
     password_hash: str
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
+    # banco onde ficam os dados do tenant (ver db.SHARDS); frozen = mudando de shard
+    shard: str = Field(default="default", sa_column_kwargs={"server_default": "default"})
+    shard_frozen: bool = Field(default=False, sa_column_kwargs={"server_default": false()})
+
 
 class PasswordReset(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     user_id: int = Field(index=True, foreign_key="user.id")
 
     token_hash: str = Field(index=True)
-    expires_at: datetime
+    expires_at: datetime = Field(index=True)  # limpeza (scheduler)
     used_at: Optional[datetime] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
@@ -30,59 +35,175 @@ class PasswordReset(SQLModel, table=True):
 # CATALOG
 # =========================
 class Category(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_category_user_id_id", "user_id", "id"),  # listagem: user_id + id desc
+        Index("ix_category_user_id_name", "user_id", "name"),
+        Index("ix_category_user_id_change_seq", "user_id", "change_seq"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
-    user_id: int = Field(index=True, foreign_key="user.id")
+    user_id: int = Field(foreign_key="user.id")
 
-    name: str = Field(index=True)
+    name: str
     auto_discount_enabled: bool = Field(default=False)
     default_discount_percent: float = Field(default=0.0)
 
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: Optional[datetime] = Field(default_factory=datetime.utcnow)
+    # CatalogChange.seq da última alteração (cursor do /sync/catalog)
+    change_seq: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
 
 
 class Product(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_product_user_id_id", "user_id", "id"),
+        Index("ux_product_user_id_sku", "user_id", "sku", unique=True),
+        Index("ix_product_user_id_change_seq", "user_id", "change_seq"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
-    user_id: int = Field(index=True, foreign_key="user.id")
+    user_id: int = Field(foreign_key="user.id")
 
     category_id: int = Field(index=True, foreign_key="category.id")
 
-    sku: str = Field(index=True)
+    sku: str
     name: str
     unit: str  # UN, CX, KG, L...
     pack_factor: float = Field(default=1.0)  # ex: CX = 12 UN
     price: float = Field(default=0.0)
 
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: Optional[datetime] = Field(default_factory=datetime.utcnow)
+    change_seq: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
+
+
+# log de alterações do catálogo: seq é um contador por tenant (sobrevive a
+# mudança de shard); exclusões ficam como tombstone (entity + entity_id)
+class CatalogChange(SQLModel, table=True):
+    __table_args__ = (Index("ux_catalogchange_user_id_seq", "user_id", "seq", unique=True),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: int = Field(foreign_key="user.id")
+
+    seq: int
+    op: str = Field(default="upsert")  # upsert / delete / reset (cliente recarrega tudo)
+    entity: Optional[str] = None  # product / category (só nas exclusões)
+    entity_id: Optional[int] = None
+
+    created_at: datetime = Field(default_factory=datetime.utcnow)
 
 
 # =========================
 # STOCK
 # =========================
 class StockMovement(SQLModel, table=True):
+    __table_args__ = (
+        # saldo/extrato: user_id + product_id, ordenado por created_at, id
+        Index("ix_stockmovement_user_product_created", "user_id", "product_id", "created_at", "id"),
+        Index("ix_stockmovement_user_id_id", "user_id", "id"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
 
-    user_id: int = Field(index=True, foreign_key="user.id")
-    product_id: int = Field(index=True, foreign_key="product.id")
+    user_id: int = Field(foreign_key="user.id")
+    product_id: int = Field(foreign_key="product.id")
 
-    # IN / OUT / ADJUST
-    type: str = Field(index=True)
+    # IN / OUT / ADJUST (+ OPENING: saldo de abertura gerado ao encerrar período)
+    type: str
     quantity: float
     note: Optional[str] = None
 
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 
+# movimentações de períodos encerrados (mesmo id da original)
+class StockMovementArchive(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_stockmovementarchive_user_product_created", "user_id", "product_id", "created_at", "id"),
+    )
+
+    id: int = Field(primary_key=True, sa_column_kwargs={"autoincrement": False})
+
+    user_id: int = Field(foreign_key="user.id")
+    product_id: int = Field(foreign_key="product.id")
+
+    type: str
+    quantity: float
+    note: Optional[str] = None
+
+    created_at: datetime
+    archived_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+# ponto de pedido por produto: balance acompanha cada movimentação (não soma
+# o histórico) e low diz se há alerta aberto
+class ReorderPoint(SQLModel, table=True):
+    __table_args__ = (Index("ux_reorderpoint_user_id_product_id", "user_id", "product_id", unique=True),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: int = Field(foreign_key="user.id")
+    product_id: int = Field(foreign_key="product.id")
+
+    reorder_min: float
+    reorder_max: Optional[float] = None  # alerta só fecha ao chegar aqui (histerese)
+
+    balance: float = Field(default=0.0)
+    low: bool = Field(default=False)
+
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class StockAlert(SQLModel, table=True):
+    __table_args__ = (
+        # no máximo um alerta aberto por produto
+        Index(
+            "ux_stockalert_open", "user_id", "product_id", unique=True,
+            sqlite_where=text("resolved_at IS NULL"), postgresql_where=text("resolved_at IS NULL"),
+        ),
+        Index("ix_stockalert_user_id_id", "user_id", "id"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: int = Field(foreign_key="user.id")
+    product_id: int = Field(foreign_key="product.id")
+
+    kind: str = Field(default="LOW")
+    balance: float  # saldo que abriu o alerta
+    reorder_min: float
+    reorder_max: Optional[float] = None
+
+    opened_at: datetime = Field(default_factory=datetime.utcnow)
+    resolved_at: Optional[datetime] = None
+    resolved_balance: Optional[float] = None
+
+
+# encerramento: tudo antes de closed_before foi para o arquivo
+class StockPeriod(SQLModel, table=True):
+    __table_args__ = (Index("ix_stockperiod_user_id_closed", "user_id", "closed_before"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: int = Field(foreign_key="user.id")
+
+    closed_before: datetime
+    movements_archived: int = Field(default=0)
+    products_carried: int = Field(default=0)
+
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
 # =========================
 # QUOTES (ORÇAMENTOS)
 # =========================
 class Quote(SQLModel, table=True):
+    __table_args__ = (Index("ix_quote_user_id_id", "user_id", "id"),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
-    user_id: int = Field(index=True, foreign_key="user.id")
+    user_id: int = Field(foreign_key="user.id")
 
     customer_name: str
     customer_email: Optional[str] = None
 
-    status: str = Field(default="DRAFT", index=True)  # DRAFT/SENT/APPROVED/REJECTED/CANCELLED
+    status: str = Field(default="DRAFT", index=True)  # DRAFT/SENT/APPROVED/REJECTED/CANCELLED/EXPIRED
     issued_at: date = Field(default_factory=lambda: date.today())
     valid_until: Optional[date] = None
     notes: Optional[str] = None
@@ -91,13 +212,18 @@ class Quote(SQLModel, table=True):
     total_discount: float = Field(default=0.0)
     total_net: float = Field(default=0.0)
 
+    # sobe a cada alteração de itens/status: chave do documento em cache (documents.py)
+    version: int = Field(default=1, sa_column_kwargs={"server_default": "1"})
+
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 
 class QuoteItem(SQLModel, table=True):
+    __table_args__ = (Index("ix_quoteitem_quote_user_id", "quote_id", "user_id", "id"),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
-    quote_id: int = Field(index=True, foreign_key="quote.id")
-    user_id: int = Field(index=True, foreign_key="user.id")
+    quote_id: int = Field(foreign_key="quote.id")
+    user_id: int = Field(foreign_key="user.id")
 
     product_id: int = Field(index=True, foreign_key="product.id")
 
@@ -115,3 +241,55 @@ class QuoteItem(SQLModel, table=True):
     net_total: float = Field(default=0.0)
 
     created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+# totais dos orçamentos por dia de emissão e status, mantidos a cada alteração
+# de status/itens (quotes.bump_summary): o /quotes/summary não soma orçamentos
+class QuoteDailySummary(SQLModel, table=True):
+    __table_args__ = (Index("ux_quotedailysummary_user_id_day_status", "user_id", "day", "status", unique=True),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: int = Field(foreign_key="user.id")
+
+    day: date  # Quote.issued_at
+    status: str
+
+    quote_count: int = Field(default=0)
+    total_gross: float = Field(default=0.0)
+    total_discount: float = Field(default=0.0)
+    total_net: float = Field(default=0.0)
+
+
+# =========================
+# SCHEMA (migrações)
+# =========================
+class SchemaVersion(SQLModel, table=True):
+    version: int = Field(primary_key=True, sa_column_kwargs={"autoincrement": False})
+    name: str
+    applied_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+# =========================
+# MANUTENÇÃO (scheduler)
+# =========================
+# uma linha por job, no banco principal: quem consegue o lease roda o job
+# (um worker só, mesmo com vários processos)
+class JobLease(SQLModel, table=True):
+    name: str = Field(primary_key=True)
+
+    owner: Optional[str] = None
+    locked_until: Optional[datetime] = None
+
+    last_started_at: Optional[datetime] = None
+    last_finished_at: Optional[datetime] = None
+    last_result: Optional[str] = None
+
+
+# barramento de invalidação por polling (CACHE_BUS=table); o scheduler apaga as antigas
+class CacheEvent(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+
+    scope: str
+    user_id: int
+    origin: str  # host:pid de quem publicou (ignora a própria mensagem)
+    created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
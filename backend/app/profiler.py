@@ -0,0 +1,343 @@
+"""
+Profiler por amostragem, ligado por requisição. Com o header
+`X-Profile: <ADMIN_TOKEN>` (ou por sorteio, PROFILE_SAMPLE_RATE) a
+requisição é amostrada a cada PROFILE_INTERVAL_MS e o resultado vai para
+PROFILE_DIR como arquivo do speedscope (https://www.speedscope.app): um
+perfil com as pilhas (flamegraph) e outro com a linha do tempo do SQL.
+Só os PROFILE_KEEP arquivos mais novos ficam; o nome volta no header
+`X-Profile-Id` e os arquivos saem por /admin/profiles.
+
+Rotas síncronas rodam no threadpool: o profiler marca as threads que estão
+executando a rota/dependências da requisição (instrument) e amostra só elas.
+Streams (text/event-stream) não são amostrados, e nenhuma requisição é
+amostrada por mais de PROFILE_MAX_SECONDS.
+"""
+from __future__ import annotations
+
+import contextvars
+import functools
+import hmac
+import inspect
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+import anyio
+from fastapi.dependencies.utils import is_async_gen_callable, is_coroutine_callable, is_gen_callable
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", "./profiles"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+# conexão que fica aberta (download lento, stream) não prende o amostrador
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "30"))
+
+SPEEDSCOPE_SUFFIX = ".speedscope.json"
+
+_current: contextvars.ContextVar["Profile | None"] = contextvars.ContextVar("profile", default=None)
+
+
+def is_admin(token: str | None) -> bool:
+    return bool(ADMIN_TOKEN) and bool(token) and hmac.compare_digest(token, ADMIN_TOKEN)
+
+
+class Profile:
+    def __init__(self, name: str):
+        self.name = name
+        self.t0 = time.perf_counter()
+        self.t1: float | None = None
+        self._lock = threading.Lock()
+        # thread ident -> profundidade (rota e dependência podem aninhar)
+        self.threads: dict[int, int] = {}
+        # (instante, pilha de code objects da raiz para a folha)
+        self.samples: list[tuple[float, tuple]] = []
+        # (início, fim, sql)
+        self.queries: list[tuple[float, float, str]] = []
+
+    def attach(self) -> None:
+        ident = threading.get_ident()
+        with self._lock:
+            self.threads[ident] = self.threads.get(ident, 0) + 1
+
+    def detach(self) -> None:
+        ident = threading.get_ident()
+        with self._lock:
+            depth = self.threads.get(ident, 0) - 1
+            if depth > 0:
+                self.threads[ident] = depth
+            else:
+                self.threads.pop(ident, None)
+
+    def sample(self, frames: dict, now: float) -> None:
+        with self._lock:
+            idents = list(self.threads)
+        for ident in idents:
+            frame = frames.get(ident)
+            stack = []
+            while frame is not None:
+                if frame.f_code is _RUN_CODE:
+                    break  # daqui para cima é threadpool/anyio
+                stack.append(frame.f_code)
+                frame = frame.f_back
+            if stack:
+                self.samples.append((now, tuple(reversed(stack))))
+
+    # ---------- speedscope ----------
+    def speedscope(self) -> dict:
+        frames: list[dict] = []
+        index: dict = {}
+
+        def frame_id(key, make) -> int:
+            i = index.get(key)
+            if i is None:
+                i = index[key] = len(frames)
+                frames.append(make())
+            return i
+
+        def code_id(code) -> int:
+            return frame_id(code, lambda: {
+                "name": code.co_qualname, "file": code.co_filename, "line": code.co_firstlineno,
+            })
+
+        ms = lambda t: round((t - self.t0) * 1000.0, 3)  # noqa: E731
+        end = ms(self.t1 or time.perf_counter())
+
+        samples, weights = [], []
+        prev = self.t0
+        for at, stack in self.samples:
+            samples.append([code_id(c) for c in stack])
+            weights.append(round((at - prev) * 1000.0, 3))
+            prev = at
+
+        events = []
+        last_close = 0.0
+        for start, stop, sql in sorted(self.queries):
+            # speedscope exige eventos aninhados: consultas sobrepostas são cortadas
+            opened = max(ms(start), last_close)
+            closed = max(ms(stop), opened)
+            fid = frame_id(("sql", sql), lambda: {"name": sql})
+            events.append({"type": "O", "frame": fid, "at": opened})
+            events.append({"type": "C", "frame": fid, "at": closed})
+            last_close = closed
+
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": self.name,
+            "exporter": "genericerp",
+            "activeProfileIndex": 0,
+            "shared": {"frames": frames},
+            "profiles": [
+                {"type": "sampled", "name": f"{self.name} (CPU)", "unit": "milliseconds",
+                 "startValue": 0, "endValue": end, "samples": samples, "weights": weights},
+                {"type": "evented", "name": f"{self.name} (SQL)", "unit": "milliseconds",
+                 "startValue": 0, "endValue": end, "events": events},
+            ],
+        }
+
+
+# =========================
+# AMOSTRADOR (uma thread para todos os perfis ativos)
+# =========================
+_active: set[Profile] = set()
+_active_lock = threading.Lock()
+_sampler: threading.Thread | None = None
+
+
+def _sample_loop() -> None:
+    global _sampler
+    interval = PROFILE_INTERVAL_MS / 1000.0
+    while True:
+        time.sleep(interval)
+        with _active_lock:
+            profiles = list(_active)
+            if not profiles:
+                _sampler = None
+                return
+        frames = sys._current_frames()
+        now = time.perf_counter()
+        for p in profiles:
+            if now - p.t0 > PROFILE_MAX_SECONDS:
+                _stop(p)
+                continue
+            p.sample(frames, now)
+
+
+def _start(p: Profile) -> None:
+    global _sampler
+    with _active_lock:
+        _active.add(p)
+        if _sampler is None:
+            _sampler = threading.Thread(target=_sample_loop, name="profiler", daemon=True)
+            _sampler.start()
+
+
+def _stop(p: Profile) -> None:
+    with _active_lock:
+        if p not in _active:
+            return
+        _active.discard(p)
+    p.t1 = time.perf_counter()
+
+
+# =========================
+# SQL (todas as engines)
+# =========================
+@event.listens_for(Engine, "before_cursor_execute")
+def _sql_start(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("profile_t0", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _sql_end(conn, cursor, statement, parameters, context, executemany):
+    p = _current.get()
+    if p is None:
+        return
+    starts = conn.info.get("profile_t0")
+    if p.t1 is not None:
+        # perfil já encerrado (stream, PROFILE_MAX_SECONDS): só desempilha
+        if starts:
+            starts.pop()
+        return
+    if starts:
+        p.queries.append((starts.pop(), time.perf_counter(), " ".join(statement.split())[:300]))
+
+
+# =========================
+# ROTAS: marca as threads da requisição
+# =========================
+def _run(call, *args, **kwargs):
+    p = _current.get()
+    if p is None:
+        return call(*args, **kwargs)
+    p.attach()
+    try:
+        return call(*args, **kwargs)
+    finally:
+        p.detach()
+
+
+_RUN_CODE = _run.__code__
+
+
+def instrument(app) -> None:
+    """
+    Envolve rotas e dependências síncronas (as que rodam no threadpool).
+    Dependências com yield ficam de fora: a thread delas volta ao pool no yield.
+    """
+    wrapped: dict = {}
+
+    def wrap(call):
+        if call in wrapped:
+            return wrapped[call]
+        # só funções síncronas comuns (OAuth2PasswordBearer etc. são objetos async)
+        if (
+            not inspect.isfunction(call)
+            or is_coroutine_callable(call)
+            or is_gen_callable(call)
+            or is_async_gen_callable(call)
+        ):
+            return call
+        wrapped[call] = functools.wraps(call)(functools.partial(_run, call))
+        return wrapped[call]
+
+    def walk(dependant) -> None:
+        # cache_key de dependências foi calculado com a função original: segue valendo
+        dependant.call = wrap(dependant.call)
+        for sub in dependant.dependencies:
+            walk(sub)
+
+    for route in app.routes:
+        dependant = getattr(route, "dependant", None)
+        if dependant is not None and dependant.call is not None:
+            walk(dependant)
+
+
+# =========================
+# MIDDLEWARE
+# =========================
+def _slug(path: str) -> str:
+    return re.sub(r"[^A-Za-z0-9]+", "_", path).strip("_")[:60] or "root"
+
+
+def _write(p: Profile, filename: str) -> None:
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = PROFILE_DIR / (filename + ".tmp")
+    tmp.write_text(json.dumps(p.speedscope()), encoding="utf-8")
+    tmp.replace(PROFILE_DIR / filename)
+    # anel: só os PROFILE_KEEP mais novos
+    files = sorted(PROFILE_DIR.glob("*" + SPEEDSCOPE_SUFFIX))
+    for old in files[:-PROFILE_KEEP] if PROFILE_KEEP > 0 else files:
+        old.unlink(missing_ok=True)
+
+
+def list_profiles() -> list[dict]:
+    if not PROFILE_DIR.is_dir():
+        return []
+    out = []
+    for f in sorted(PROFILE_DIR.glob("*" + SPEEDSCOPE_SUFFIX), reverse=True):
+        st = f.stat()
+        out.append({"name": f.name, "bytes": st.st_size, "created_at": datetime.utcfromtimestamp(st.st_mtime)})
+    return out
+
+
+def profile_path(name: str) -> Path | None:
+    if not re.fullmatch(r"[\w.-]+", name) or not name.endswith(SPEEDSCOPE_SUFFIX):
+        return None
+    path = PROFILE_DIR / name
+    return path if path.is_file() else None
+
+
+class ProfilerMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    def _wanted(self, scope) -> bool:
+        headers = dict(scope.get("headers") or [])
+        if b"text/event-stream" in headers.get(b"accept", b""):
+            return False  # EventSource: conexão da vida inteira da tela
+        token = headers.get(b"x-profile")
+        if token is not None and is_admin(token.decode("latin-1")):
+            return True
+        return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._wanted(scope):
+            return await self.app(scope, receive, send)
+
+        method, path = scope["method"], scope["path"]
+        stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")
+        filename = f"{stamp}-{method}-{_slug(path)}{SPEEDSCOPE_SUFFIX}"
+        p = Profile(f"{method} {path}")
+        status = {}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-profile-id", filename.encode())]
+                if any(k.lower() == b"content-type" and v.startswith(b"text/event-stream")
+                       for k, v in message["headers"]):
+                    # o resto é espera por eventos: fica só o que veio antes dos headers
+                    _stop(p)
+            await send(message)
+
+        token = _current.set(p)
+        _start(p)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _stop(p)
+            _current.reset(token)
+            p.name = f"{method} {path} -> {status.get('code', '?')}"
+            # resposta já saiu; grava fora do event loop
+            await anyio.to_thread.run_sync(_write, p, filename)
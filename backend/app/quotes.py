@@ -0,0 +1,218 @@
+from __future__ import annotations
+
+from datetime import date
+
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.engine import Connection
+from sqlmodel import Session
+
+from .models import Quote, QuoteDailySummary, QuoteItem
+
+_SUMMARY_TOTALS = ("total_gross", "total_discount", "total_net")
+# somas incrementais em float divergem da soma direta nos últimos bits: abaixo
+# de meio centavo não é desvio
+_SUMMARY_TOLERANCE = 0.005
+
+
+def line_values(quantity, unit_price, discount_percent) -> dict:
+    # mesma conta de quotes_routes.calc_line, em SQL (UPDATE/INSERT ... SELECT)
+    gross = quantity * unit_price
+    disc = gross * discount_percent / 100.0
+    return {"gross_total": gross, "discount_total": disc, "net_total": gross - disc}
+
+
+def refresh_totals(session: Session, user_id: int, quote_ids) -> None:
+    """Recalcula os totais de vários orçamentos num UPDATE só (não faz commit)."""
+    items = QuoteItem.__table__
+
+    def total(col):
+        return (
+            select(func.coalesce(func.sum(col), 0.0))
+            .where(items.c.quote_id == Quote.id, items.c.user_id == user_id)
+            .scalar_subquery()
+        )
+
+    # FOR UPDATE: ninguém muda os totais entre a leitura e o UPDATE (resumo diário)
+    before = {
+        r.id: summary_row(r)
+        for r in session.exec(
+            select(Quote.id, *_summary_columns())
+            .where(Quote.user_id == user_id, Quote.id.in_(quote_ids))
+            .with_for_update()
+        )
+    }
+    after = session.exec(
+        update(Quote)
+        .where(Quote.user_id == user_id, Quote.id.in_(quote_ids))
+        .values(
+            total_gross=total(items.c.gross_total),
+            total_discount=total(items.c.discount_total),
+            total_net=total(items.c.net_total),
+            version=Quote.version + 1,
+        )
+        .returning(Quote.id, *_summary_columns())
+        .execution_options(synchronize_session=False)
+    ).all()
+    bump_summary(session.connection(), [(user_id, before.get(r.id), summary_row(r)) for r in after])
+
+
+# =========================
+# RESUMO DIÁRIO (QuoteDailySummary)
+# =========================
+def _summary_columns():
+    return (Quote.issued_at, Quote.status, Quote.total_gross, Quote.total_discount, Quote.total_net)
+
+
+def summary_row(q) -> tuple:
+    """(dia, status, bruto, desconto, líquido) de um Quote ou Row; guarde antes de alterar."""
+    return (q.issued_at, q.status, q.total_gross, q.total_discount, q.total_net)
+
+
+def _insert(conn: Connection):
+    if conn.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    return dialect_insert(QuoteDailySummary.__table__)
+
+
+def bump_summary(conn: Connection, changes) -> None:
+    """
+    Aplica no resumo as mudanças [(user_id, antes, depois)], com antes/depois
+    vindos de summary_row (None = orçamento novo). Um upsert só, somando os
+    deltas na linha (user_id, dia, status). Não faz commit.
+    """
+    acc: dict[tuple, list] = {}
+    for user_id, before, after in changes:
+        if before == after:
+            continue
+        for row, sign in ((before, -1), (after, 1)):
+            if row is None:
+                continue
+            day, status, *totals = row
+            a = acc.setdefault((user_id, day, status), [0, 0.0, 0.0, 0.0])
+            a[0] += sign
+            for n, v in enumerate(totals, 1):
+                a[n] += sign * float(v or 0.0)
+    if not acc:
+        return
+
+    table = QuoteDailySummary.__table__
+    # ordem fixa das chaves: dois upserts concorrentes não se travam no Postgres
+    stmt = _insert(conn).values([
+        {"user_id": u, "day": d, "status": s, "quote_count": c,
+         "total_gross": g, "total_discount": di, "total_net": n}
+        for (u, d, s), (c, g, di, n) in sorted(acc.items(), key=lambda kv: (kv[0][0], str(kv[0][1]), kv[0][2]))
+    ])
+    conn.execute(stmt.on_conflict_do_update(
+        index_elements=["user_id", "day", "status"],
+        set_={
+            col: table.c[col] + stmt.excluded[col]
+            for col in ("quote_count", *_SUMMARY_TOTALS)
+        },
+    ))
+
+
+def rebuild_summary(conn: Connection, user_ids=None) -> None:
+    """Refaz o resumo a partir dos orçamentos (migração, seed). Não faz commit."""
+    table = QuoteDailySummary.__table__
+    quotes = Quote.__table__
+    wipe = delete(table)
+    grouped = (
+        select(
+            quotes.c.user_id, quotes.c.issued_at, quotes.c.status, func.count(),
+            *(func.coalesce(func.sum(quotes.c[col]), 0.0) for col in _SUMMARY_TOTALS),
+        )
+        .group_by(quotes.c.user_id, quotes.c.issued_at, quotes.c.status)
+    )
+    if user_ids is not None:
+        wipe = wipe.where(table.c.user_id.in_(user_ids))
+        grouped = grouped.where(quotes.c.user_id.in_(user_ids))
+    conn.execute(wipe)
+    conn.execute(insert(table).from_select(
+        ["user_id", "day", "status", "quote_count", *_SUMMARY_TOTALS], grouped,
+    ))
+
+
+def _same_summary(a, b) -> bool:
+    # None = linha ausente, o mesmo que uma linha zerada
+    a, b = a or (0, 0.0, 0.0, 0.0), b or (0, 0.0, 0.0, 0.0)
+    return a[0] == b[0] and all(abs((x or 0.0) - (y or 0.0)) <= _SUMMARY_TOLERANCE for x, y in zip(a[1:], b[1:]))
+
+
+def summary_drift(conn: Connection, user_id: int, lock: bool = False) -> dict:
+    """
+    {(dia, status): (contagem, bruto, desconto, líquido) certo, ou None para
+    apagar} das linhas do resumo do tenant que não batem com os orçamentos.
+    Com lock, trava as linhas do resumo antes de somar (os orçamentos nunca).
+    """
+    table, quotes = QuoteDailySummary.__table__, Quote.__table__
+    stored = select(table.c.day, table.c.status, table.c.quote_count, *(table.c[c] for c in _SUMMARY_TOTALS)).where(
+        table.c.user_id == user_id,
+    )
+    if lock:
+        stored = stored.with_for_update()
+    have = {(r[0], r[1]): tuple(r[2:]) for r in conn.execute(stored)}
+    want = {
+        (r[0], r[1]): tuple(r[2:])
+        for r in conn.execute(
+            select(quotes.c.issued_at, quotes.c.status, func.count(),
+                   *(func.coalesce(func.sum(quotes.c[c]), 0.0) for c in _SUMMARY_TOTALS))
+            .where(quotes.c.user_id == user_id)
+            .group_by(quotes.c.issued_at, quotes.c.status)
+        )
+    }
+    return {key: want.get(key) for key in have.keys() | want.keys() if not _same_summary(have.get(key), want.get(key))}
+
+
+def repair_summary(conn: Connection, user_id: int) -> int:
+    """
+    Corrige só as linhas do resumo do tenant que divergem, travando só elas
+    (não faz commit). Devolve quantas linhas mudaram.
+    """
+    if conn.dialect.name == "sqlite" and not conn.connection.driver_connection.in_transaction:
+        # sem FOR UPDATE no SQLite: o lock de escrita já no começo
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+    drift = summary_drift(conn, user_id, lock=True)
+    table = QuoteDailySummary.__table__
+    for (day, status), row in sorted(drift.items(), key=lambda kv: (str(kv[0][0]), kv[0][1])):
+        if row is None:
+            conn.execute(delete(table).where(
+                table.c.user_id == user_id, table.c.day == day, table.c.status == status,
+            ))
+            continue
+        values = dict(zip(("quote_count", *_SUMMARY_TOTALS), row))
+        stmt = _insert(conn).values(user_id=user_id, day=day, status=status, **values)
+        conn.execute(stmt.on_conflict_do_update(index_elements=["user_id", "day", "status"], set_=values))
+    return len(drift)
+
+
+def quote_summary(session: Session, user_id: int, date_from: date | None, date_to: date | None) -> dict:
+    s = QuoteDailySummary
+    stmt = select(s.day, s.status, s.quote_count, s.total_gross, s.total_discount, s.total_net).where(
+        s.user_id == user_id, s.quote_count != 0,
+    )
+    if date_from is not None:
+        stmt = stmt.where(s.day >= date_from)
+    if date_to is not None:
+        stmt = stmt.where(s.day <= date_to)
+
+    by_day, by_status = [], {}
+    for day, status, count, gross, disc, net in session.exec(stmt.order_by(s.day, s.status)):
+        # somas incrementais em float: centavos bastam
+        row = {"day": day, "status": status, "count": count,
+               "total_gross": round(gross, 2), "total_discount": round(disc, 2), "total_net": round(net, 2)}
+        by_day.append(row)
+        acc = by_status.setdefault(status, {"status": status, "count": 0,
+                                            "total_gross": 0.0, "total_discount": 0.0, "total_net": 0.0})
+        acc["count"] += count
+        for col in _SUMMARY_TOTALS:
+            acc[col] += row[col]
+
+    statuses = sorted(by_status.values(), key=lambda r: r["status"])
+    for r in statuses:
+        for col in _SUMMARY_TOTALS:
+            r[col] = round(r[col], 2)
+    totals = {"count": sum(r["count"] for r in statuses)}
+    totals.update({col: round(sum((r[col] for r in statuses), 0.0), 2) for col in _SUMMARY_TOTALS})
+    return {"from": date_from, "to": date_to, "totals": totals, "by_status": statuses, "by_day": by_day}
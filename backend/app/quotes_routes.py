@@ -1,16 +1,26 @@
-from datetime import date, timedelta
-from typing import Optional
+import os
+from datetime import date, datetime, timedelta
+from typing import Literal, Optional
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, EmailStr
+from sqlalchemy import case, insert, literal
 from sqlmodel import Session, select
+from starlette.concurrency import run_in_threadpool
 
-from .db import get_session
-from .auth import get_current_user
+from .auth import get_current_reader, get_current_user, get_read_session, get_tenant_session
+from . import documents
+from .cache import invalidate, tenant_cache
+from .events import broker
+from .fields import parse_fields, rows, select_fields, sparse_response
 from .models import Quote, QuoteItem, Product, Category, User
+from .quotes import bump_summary, line_values, quote_summary, refresh_totals, summary_row
 
 router = APIRouter()
 
+quotes_cache = tenant_cache("quotes")
+
 
 def calc_line(quantity: float, unit_price: float, discount_percent: float):
     gross = float(quantity) * float(unit_price)
@@ -20,6 +30,9 @@ def calc_line(quantity: float, unit_price: float, discount_percent: float):
 
 
 def recalc_quote(session: Session, quote: Quote):
+    # relê travando a linha: os totais antigos entram no delta do resumo diário
+    session.refresh(quote, with_for_update=True)
+    before = summary_row(quote)
     items = session.exec(
         select(QuoteItem)
         .where(QuoteItem.quote_id == quote.id)
@@ -34,13 +47,28 @@ def recalc_quote(session: Session, quote: Quote):
     quote.total_gross = float(tg)
     quote.total_discount = float(td)
     quote.total_net = float(tn)
+    quote.version += 1
 
     session.add(quote)
+    bump_summary(session.connection(), [(quote.user_id, before, summary_row(quote))])
     session.commit()
     session.refresh(quote)
+    invalidate("quotes", user_id=quote.user_id)
+    publish_quote(quote)
     return quote, items
 
 
+def publish_quote(quote: Quote):
+    # SSE: telas abertas atualizam totais/status sem refazer GET
+    broker.publish(quote.user_id, "quote.totals", {
+        "quote_id": quote.id,
+        "status": quote.status,
+        "total_gross": quote.total_gross,
+        "total_discount": quote.total_discount,
+        "total_net": quote.total_net,
+    })
+
+
 class QuoteIn(BaseModel):
     customer_name: str
     customer_email: Optional[EmailStr] = None
@@ -48,6 +76,14 @@ class QuoteIn(BaseModel):
     notes: Optional[str] = None
 
 
+class QuoteDuplicateIn(BaseModel):
+    customer_name: Optional[str] = None  # vazio = mesmo cliente
+    customer_email: Optional[EmailStr] = None
+    valid_days: int = 7
+    notes: Optional[str] = None
+    refresh_prices: bool = False  # preço atual do produto + desconto automático da categoria
+
+
 class QuoteStatusIn(BaseModel):
     status: str  # DRAFT/SENT/APPROVED/REJECTED/CANCELLED
 
@@ -68,7 +104,7 @@ class QuoteItemPatch(BaseModel):
 @router.post("/quotes", response_model=Quote)
 def create_quote(
     data: QuoteIn,
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_tenant_session),
     user: User = Depends(get_current_user),
 ):
     name = (data.customer_name or "").strip()
@@ -89,46 +125,211 @@ def create_quote(
         status="DRAFT",
     )
     session.add(q)
+    bump_summary(session.connection(), [(user.id, None, summary_row(q))])
     session.commit()
     session.refresh(q)
+    invalidate("quotes", user_id=user.id)
+    return q
+
+
+@router.post("/quotes/{quote_id}/duplicate", response_model=Quote)
+def duplicate_quote(
+    quote_id: int,
+    data: QuoteDuplicateIn,
+    session: Session = Depends(get_tenant_session),
+    user: User = Depends(get_current_user),
+):
+    src = session.get(Quote, quote_id)
+    if not src or src.user_id != user.id:
+        raise HTTPException(status_code=404, detail="Orçamento não encontrado.")
+
+    valid_days = int(data.valid_days or 0)
+    if valid_days <= 0 or valid_days > 365:
+        raise HTTPException(status_code=400, detail="Validade deve ser entre 1 e 365 dias.")
+
+    # cliente novo não herda o e-mail do antigo
+    name = (data.customer_name or "").strip()
+    if name:
+        email = data.customer_email
+    else:
+        name, email = src.customer_name, data.customer_email or src.customer_email
+    q = Quote(
+        user_id=user.id,
+        customer_name=name,
+        customer_email=(str(email).strip().lower() if email else None),
+        issued_at=date.today(),
+        valid_until=date.today() + timedelta(days=valid_days),
+        notes=(data.notes.strip() if data.notes else src.notes),
+        status="DRAFT",
+        total_gross=src.total_gross,
+        total_discount=src.total_discount,
+        total_net=src.total_net,
+    )
+    session.add(q)
+    session.flush()
+    bump_summary(session.connection(), [(user.id, None, summary_row(q))])
+
+    # itens copiados num INSERT ... SELECT só (orçamento de centenas de linhas
+    # não passa pelo add_item item a item)
+    cols = ["quote_id", "user_id", "product_id", "sku_snapshot", "name_snapshot", "unit_snapshot",
+            "quantity", "unit_price", "discount_percent", "gross_total", "discount_total", "net_total", "created_at"]
+    if data.refresh_prices:
+        discount = case((Category.auto_discount_enabled, Category.default_discount_percent), else_=0.0)
+        line = line_values(QuoteItem.quantity, Product.price, discount)
+        rows = (
+            select(
+                literal(q.id), QuoteItem.user_id, QuoteItem.product_id,
+                Product.sku, Product.name, Product.unit,
+                QuoteItem.quantity, Product.price, discount,
+                line["gross_total"], line["discount_total"], line["net_total"],
+                literal(datetime.utcnow()),
+            )
+            .join(Product, Product.id == QuoteItem.product_id)
+            .join(Category, Category.id == Product.category_id)
+        )
+    else:
+        rows = select(
+            literal(q.id), QuoteItem.user_id, QuoteItem.product_id,
+            QuoteItem.sku_snapshot, QuoteItem.name_snapshot, QuoteItem.unit_snapshot,
+            QuoteItem.quantity, QuoteItem.unit_price, QuoteItem.discount_percent,
+            QuoteItem.gross_total, QuoteItem.discount_total, QuoteItem.net_total,
+            literal(datetime.utcnow()),
+        )
+    rows = rows.where(QuoteItem.quote_id == src.id, QuoteItem.user_id == user.id).order_by(QuoteItem.id)
+    session.exec(insert(QuoteItem).from_select(cols, rows))
+
+    if data.refresh_prices:
+        refresh_totals(session, user.id, [q.id])
+    session.commit()
+    session.refresh(q)
+    invalidate("quotes", user_id=user.id)
+    publish_quote(q)
     return q
 
 
 @router.get("/quotes")
 def list_quotes(
-    session: Session = Depends(get_session),
-    user: User = Depends(get_current_user),
+    fields: Optional[str] = None,
+    session: Session = Depends(get_read_session),
+    user: User = Depends(get_current_reader),
 ):
-    rows = session.exec(
-        select(Quote)
-        .where(Quote.user_id == user.id)
-        .order_by(Quote.id.desc())
-    ).all()
-    return rows
+    names = parse_fields(Quote, fields)
+    if names is not None:
+        stmt = select_fields(Quote, names).where(Quote.user_id == user.id).order_by(Quote.id.desc())
+        return sparse_response(quotes_cache.get_or_load(
+            session, user.id, ("list", names), lambda: rows(session, stmt),
+        ))
+    return quotes_cache.get_or_load(session, user.id, "list", lambda: [
+        q.model_dump() for q in session.exec(
+            select(Quote)
+            .where(Quote.user_id == user.id)
+            .order_by(Quote.id.desc())
+        ).all()
+    ])
+
+
+# antes de /quotes/{quote_id}: senão "summary" cai no parâmetro inteiro
+@router.get("/quotes/summary")
+def get_quote_summary(
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    session: Session = Depends(get_read_session),
+    user: User = Depends(get_current_reader),
+):
+    if date_from is not None and date_to is not None and date_from > date_to:
+        raise HTTPException(status_code=400, detail="Período inválido: from depois de to.")
+    # lê só QuoteDailySummary (uma linha por dia e status), não os orçamentos
+    return quotes_cache.get_or_load(
+        session, user.id, ("summary", date_from, date_to),
+        lambda: quote_summary(session, user.id, date_from, date_to),
+    )
 
 
 @router.get("/quotes/{quote_id}")
 def get_quote(
     quote_id: int,
-    session: Session = Depends(get_session),
-    user: User = Depends(get_current_user),
+    session: Session = Depends(get_read_session),
+    user: User = Depends(get_current_reader),
 ):
     q = session.get(Quote, quote_id)
     if not q or q.user_id != user.id:
         raise HTTPException(status_code=404, detail="Orçamento não encontrado.")
 
-    q, items = recalc_quote(session, q)
+    # só leitura (pode vir da réplica): os totais já são recalculados a cada alteração de item
+    items = session.exec(
+        select(QuoteItem)
+        .where(QuoteItem.quote_id == q.id)
+        .where(QuoteItem.user_id == user.id)
+        .order_by(QuoteItem.id.asc())
+    ).all()
     return {"quote": q, "items": items}
 
 
+def _document_data(session: Session, q: Quote) -> dict:
+    # só as colunas do documento (orçamento grande: nada de montar QuoteItem)
+    items = session.exec(
+        select(
+            QuoteItem.sku_snapshot, QuoteItem.name_snapshot, QuoteItem.unit_snapshot,
+            QuoteItem.quantity, QuoteItem.unit_price, QuoteItem.discount_percent, QuoteItem.net_total,
+        )
+        .where(QuoteItem.quote_id == q.id)
+        .where(QuoteItem.user_id == q.user_id)
+        .order_by(QuoteItem.id.asc())
+    ).all()
+    return {
+        "id": q.id,
+        "customer_name": q.customer_name,
+        "customer_email": q.customer_email,
+        "status": q.status,
+        "issued_at": q.issued_at.isoformat() if q.issued_at else None,
+        "valid_until": q.valid_until.isoformat() if q.valid_until else None,
+        "notes": q.notes,
+        "total_gross": q.total_gross,
+        "total_discount": q.total_discount,
+        "total_net": q.total_net,
+        "items": [tuple(r) for r in items],
+    }
+
+
+# response_class: fora do /batch (só rotas JSON entram lá)
+@router.get("/quotes/{quote_id}/document", response_class=StreamingResponse)
+async def get_quote_document(
+    quote_id: int,
+    request: Request,
+    fmt: Literal["html", "pdf"] = Query("html", alias="format"),
+    session: Session = Depends(get_read_session),
+    user: User = Depends(get_current_reader),
+):
+    q = await run_in_threadpool(session.get, Quote, quote_id)
+    if not q or q.user_id != user.id:
+        raise HTTPException(status_code=404, detail="Orçamento não encontrado.")
+
+    # a versão é lida antes dos itens: no pior caso a chave velha guarda itens
+    # mais novos, nunca o contrário
+    key = documents.document_key(fmt, user.id, q.id, q.created_at, q.version)
+    # aberto antes de responder: a limpeza do cache não apaga o blob no meio
+    f, digest = await documents.open_document(key, fmt, lambda: _document_data(session, q))
+
+    etag = f'"{digest}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag in [t.strip() for t in request.headers.get("if-none-match", "").split(",")]:
+        f.close()
+        return Response(status_code=304, headers=headers)
+    headers.update({
+        "Content-Length": str(os.fstat(f.fileno()).st_size),
+        "Content-Disposition": f'inline; filename="orcamento-{q.id}.{fmt}"',
+    })
+    return StreamingResponse(documents.iter_file(f), media_type=documents.FORMATS[fmt], headers=headers)
+
+
 @router.patch("/quotes/{quote_id}/status", response_model=Quote)
 def set_quote_status(
     quote_id: int,
     data: QuoteStatusIn,
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_tenant_session),
     user: User = Depends(get_current_user),
 ):
-    q = session.get(Quote, quote_id)
+    q = session.get(Quote, quote_id, with_for_update=True)
     if not q or q.user_id != user.id:
         raise HTTPException(status_code=404, detail="Orçamento não encontrado.")
 
@@ -137,10 +338,15 @@ def set_quote_status(
     if status not in allowed:
         raise HTTPException(status_code=400, detail=f"Status inválido. Use: {sorted(allowed)}")
 
+    before = summary_row(q)
     q.status = status
+    q.version += 1
     session.add(q)
+    bump_summary(session.connection(), [(user.id, before, summary_row(q))])
     session.commit()
     session.refresh(q)
+    invalidate("quotes", user_id=user.id)
+    publish_quote(q)
     return q
 
 
@@ -148,7 +354,7 @@ def set_quote_status(
 def add_item(
     quote_id: int,
     data: QuoteItemIn,
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_tenant_session),
     user: User = Depends(get_current_user),
 ):
     q = session.get(Quote, quote_id)
@@ -202,6 +408,7 @@ def add_item(
 
     # recalcula totais do orçamento
     recalc_quote(session, q)
+    session.refresh(item)
     return item
 
 
@@ -210,7 +417,7 @@ def patch_item(
     quote_id: int,
     item_id: int,
     data: QuoteItemPatch,
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_tenant_session),
     user: User = Depends(get_current_user),
 ):
     q = session.get(Quote, quote_id)
@@ -243,9 +450,9 @@ def patch_item(
 
     session.add(item)
     session.commit()
-    session.refresh(item)
 
     recalc_quote(session, q)
+    session.refresh(item)
     return item
 
 
@@ -253,7 +460,7 @@ def patch_item(
 def delete_item(
     quote_id: int,
     item_id: int,
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_tenant_session),
     user: User = Depends(get_current_user),
 ):
     q = session.get(Quote, quote_id)
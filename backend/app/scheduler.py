@@ -0,0 +1,362 @@
+"""
+Manutenção em segundo plano: uma thread por processo acorda a cada
+SCHEDULER_TICK_SECONDS e roda os jobs vencidos. Cada job tem uma linha em
+`joblease` (banco principal); só quem consegue o lease roda, então com
+vários workers cada job roda em um só. Os jobs trabalham em lotes de
+MAINTENANCE_BATCH linhas, cada lote na própria transação, com uma pausa
+entre lotes — nenhum segura lock por muito tempo; o que sobrar (mais de
+MAINTENANCE_MAX_BATCHES lotes) fica para a próxima rodada.
+
+    cd backend
+    python -m app.scheduler list
+    python -m app.scheduler run expire_quotes
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Callable
+
+from sqlalchemy import delete, func, or_, select, text, update
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import aliased
+
+from .cache import invalidate
+from .db import engine, shard_engines
+from .models import CacheEvent, CatalogChange, JobLease, PasswordReset, Quote, QuoteDailySummary
+from .quotes import bump_summary, repair_summary, summary_drift
+from .shards import TENANT_TABLES
+
+log = logging.getLogger("genericerp.scheduler")
+
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "true").lower() == "true"
+SCHEDULER_TICK_SECONDS = float(os.getenv("SCHEDULER_TICK_SECONDS", "60"))
+MAINTENANCE_BATCH = int(os.getenv("MAINTENANCE_BATCH", "1000"))
+MAINTENANCE_MAX_BATCHES = int(os.getenv("MAINTENANCE_MAX_BATCHES", "50"))
+MAINTENANCE_PAUSE_SECONDS = float(os.getenv("MAINTENANCE_PAUSE_SECONDS", "0.05"))
+# log do /sync/catalog: cliente parado há mais tempo que isso recebe o catálogo inteiro
+CATALOG_CHANGE_RETENTION_DAYS = int(os.getenv("CATALOG_CHANGE_RETENTION_DAYS", "30"))
+# tenants conferidos entre pausas no rebuild_quote_summary
+SUMMARY_REBUILD_TENANTS = int(os.getenv("SUMMARY_REBUILD_TENANTS", "20"))
+# páginas devolvidas por rodada no SQLite (auto_vacuum=INCREMENTAL)
+VACUUM_PAGES = int(os.getenv("VACUUM_PAGES", "2000"))
+
+OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+
+@dataclass(frozen=True)
+class Job:
+    name: str
+    every: timedelta
+    run: Callable[[], dict]
+    # lease vence sozinho se o worker morrer no meio
+    lease: timedelta = timedelta(minutes=15)
+
+
+JOBS: list[Job] = []
+
+
+def job(name: str, every: timedelta, lease: timedelta = timedelta(minutes=15)):
+    def deco(fn: Callable[[], dict]) -> Callable[[], dict]:
+        JOBS.append(Job(name=name, every=every, run=fn, lease=lease))
+        return fn
+    return deco
+
+
+def _in_batches(eng: Engine, pick, apply: Callable[[Connection, list[int]], None]) -> int:
+    """`pick` seleciona ids; `apply` altera esses ids. Um lote por transação."""
+    total = 0
+    for _ in range(MAINTENANCE_MAX_BATCHES):
+        with eng.begin() as conn:
+            ids = list(conn.execute(pick.limit(MAINTENANCE_BATCH)).scalars())
+            if ids:
+                apply(conn, ids)
+        total += len(ids)
+        if len(ids) < MAINTENANCE_BATCH:
+            break
+        time.sleep(MAINTENANCE_PAUSE_SECONDS)
+    return total
+
+
+# =========================
+# JOBS
+# =========================
+@job("purge_password_resets", every=timedelta(hours=1))
+def purge_password_resets() -> dict:
+    # códigos vencidos não servem pra nada (usados ou não); ficam no diretório
+    table = PasswordReset.__table__
+    n = _in_batches(
+        engine,
+        select(table.c.id).where(table.c.expires_at < datetime.utcnow()),
+        lambda conn, ids: conn.execute(delete(table).where(table.c.id.in_(ids))),
+    )
+    return {"default": n}
+
+
+@job("expire_quotes", every=timedelta(hours=1))
+def expire_quotes() -> dict:
+    table = Quote.__table__
+    today = date.today()
+    users: set[int] = set()
+
+    def expire(conn: Connection, ids: list[int]) -> None:
+        # status de novo no WHERE: o usuário pode ter mudado entre o select e o update
+        expired = conn.execute(
+            update(table)
+            .where(table.c.id.in_(ids), table.c.status == "DRAFT")
+            .values(status="EXPIRED", version=table.c.version + 1)
+            .returning(table.c.user_id, table.c.issued_at, table.c.total_gross,
+                       table.c.total_discount, table.c.total_net)
+        ).all()
+        bump_summary(conn, [
+            (r.user_id, (r.issued_at, "DRAFT", *r[2:]), (r.issued_at, "EXPIRED", *r[2:]))
+            for r in expired
+        ])
+        users.update(r.user_id for r in expired)
+
+    out = {}
+    for name, eng in shard_engines.items():
+        out[name] = _in_batches(
+            eng,
+            select(table.c.id).where(table.c.status == "DRAFT", table.c.valid_until < today),
+            expire,
+        )
+    for user_id in users:
+        invalidate("quotes", user_id=user_id)
+    return out
+
+
+@job("rebuild_quote_summary", every=timedelta(days=1), lease=timedelta(hours=1))
+def rebuild_quote_summary() -> dict:
+    # o resumo é só incremental (bump_summary): qualquer escrita que escape das
+    # rotas o desvia para sempre. Confere tenant a tenant sem travar nada e só
+    # corrige (travando as linhas do resumo) quem diverge
+    quotes, summary = Quote.__table__, QuoteDailySummary.__table__
+    out, drifted = {}, set()
+    for name, eng in shard_engines.items():
+        last, n, off = 0, 0, 0
+        # passa por todos os tenants (não para em MAINTENANCE_MAX_BATCHES): roda uma vez por dia
+        while True:
+            with eng.connect() as conn:
+                # próximo tenant por busca no índice (user_id, ...) das duas tabelas
+                nxt = [u for u in conn.execute(select(
+                    select(func.min(quotes.c.user_id)).where(quotes.c.user_id > last).scalar_subquery(),
+                    select(func.min(summary.c.user_id)).where(summary.c.user_id > last).scalar_subquery(),
+                )).one() if u is not None]
+                if not nxt:
+                    break
+                last = min(nxt)
+                clean = not summary_drift(conn, last)
+            if not clean:
+                with eng.begin() as conn:
+                    if repair_summary(conn, last):
+                        drifted.add(last)
+                        off += 1
+            n += 1
+            if n % SUMMARY_REBUILD_TENANTS == 0:
+                time.sleep(MAINTENANCE_PAUSE_SECONDS)
+        out[name] = {"tenants": n, "drifted": off}
+    for user_id in drifted:
+        invalidate("quotes", user_id=user_id)
+    return out
+
+
+@job("prune_catalog_changes", every=timedelta(hours=6))
+def prune_catalog_changes() -> dict:
+    # a última linha de cada tenant fica (é o cursor do /sync/catalog)
+    table = CatalogChange.__table__
+    newer = aliased(CatalogChange)
+    latest = select(func.max(newer.seq)).where(newer.user_id == CatalogChange.user_id).scalar_subquery()
+    cutoff = datetime.utcnow() - timedelta(days=CATALOG_CHANGE_RETENTION_DAYS)
+    out = {}
+    for name, eng in shard_engines.items():
+        out[name] = _in_batches(
+            eng,
+            select(CatalogChange.id)
+            .where(CatalogChange.created_at < cutoff, CatalogChange.seq < latest)
+            .order_by(CatalogChange.id),
+            lambda conn, ids: conn.execute(delete(table).where(table.c.id.in_(ids))),
+        )
+    return out
+
+
+@job("prune_cache_events", every=timedelta(minutes=10))
+def prune_cache_events() -> dict:
+    # os listeners leem a cada CACHE_BUS_POLL_SECONDS; dez minutos sobram
+    table = CacheEvent.__table__
+    n = _in_batches(
+        engine,
+        select(table.c.id).where(table.c.created_at < datetime.utcnow() - timedelta(minutes=10)),
+        lambda conn, ids: conn.execute(delete(table).where(table.c.id.in_(ids))),
+    )
+    return {"default": n}
+
+
+@job("analyze", every=timedelta(days=1), lease=timedelta(hours=1))
+def analyze() -> dict:
+    tables = [PasswordReset.__table__.name] + [t.model.__table__.name for t in TENANT_TABLES]
+    out = {}
+    for name, eng in shard_engines.items():
+        with eng.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            if conn.dialect.name == "sqlite":
+                # PRAGMA optimize só roda ANALYZE onde as estatísticas ficaram velhas
+                conn.execute(text("PRAGMA optimize"))
+                free = conn.execute(text("PRAGMA freelist_count")).scalar()
+                if conn.execute(text("PRAGMA auto_vacuum")).scalar() == 2:
+                    # libera uma página por passo e o pysqlite só dá o primeiro
+                    # passo; executescript roda até o fim
+                    conn.connection.driver_connection.executescript(f"PRAGMA incremental_vacuum({int(VACUUM_PAGES)})")
+                    out[name] = {"free_pages_before": free}
+                else:
+                    # banco criado antes do auto_vacuum: VACUUM inteiro trava o
+                    # arquivo, então fica para uma janela de manutenção
+                    out[name] = {"free_pages": free, "hint": "VACUUM offline converte para auto_vacuum incremental"}
+            else:
+                # VACUUM fica com o autovacuum; ANALYZE por tabela é curto
+                for tb in tables:
+                    conn.execute(text(f'ANALYZE "{tb}"'))
+                out[name] = {"analyzed": len(tables)}
+    return out
+
+
+# =========================
+# LEASE
+# =========================
+def _ensure_leases(conn: Connection) -> None:
+    have = set(conn.execute(select(JobLease.name)).scalars())
+    for j in JOBS:
+        if j.name in have:
+            continue
+        if conn.dialect.name == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        conn.execute(insert(JobLease.__table__).values(name=j.name).on_conflict_do_nothing())
+
+
+def _acquire(j: Job, force: bool) -> bool:
+    table = JobLease.__table__
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        _ensure_leases(conn)
+        stmt = update(table).where(
+            table.c.name == j.name,
+            or_(table.c.locked_until.is_(None), table.c.locked_until < now),
+        )
+        if not force:
+            stmt = stmt.where(or_(table.c.last_finished_at.is_(None), table.c.last_finished_at <= now - j.every))
+        # um UPDATE condicional: dois workers nunca pegam o mesmo lease
+        res = conn.execute(stmt.values(owner=OWNER, locked_until=now + j.lease, last_started_at=now))
+        return res.rowcount == 1
+
+
+def _release(j: Job, result: str) -> None:
+    table = JobLease.__table__
+    with engine.begin() as conn:
+        conn.execute(
+            update(table)
+            .where(table.c.name == j.name, table.c.owner == OWNER)
+            .values(owner=None, locked_until=None, last_finished_at=datetime.utcnow(), last_result=result[:1000])
+        )
+
+
+def run_job(j: Job, force: bool = False) -> dict | None:
+    """Roda o job se ele estiver vencido e livre; devolve None se não rodou."""
+    if not _acquire(j, force):
+        return None
+    t0 = time.perf_counter()
+    try:
+        result = j.run()
+    except Exception as e:
+        _release(j, f"erro: {e!r}")
+        raise
+    result = {"seconds": round(time.perf_counter() - t0, 3), **result}
+    _release(j, json.dumps(result, default=str))
+    return result
+
+
+# =========================
+# THREAD
+# =========================
+class Scheduler:
+    def __init__(self, tick: float = SCHEDULER_TICK_SECONDS):
+        self.tick = tick
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+            self._thread = None
+
+    def run_pending(self) -> None:
+        for j in JOBS:
+            if self._stop.is_set():
+                return
+            try:
+                result = run_job(j)
+            except Exception:
+                log.exception("job %s falhou", j.name)
+                continue
+            if result is not None:
+                log.info("job %s: %s", j.name, result)
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.tick):
+            self.run_pending()
+
+
+scheduler = Scheduler()
+
+
+# =========================
+# CLI
+# =========================
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.scheduler")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("list", help="jobs e situação do lease")
+    p = sub.add_parser("run", help="roda um job agora (respeita o lease)")
+    p.add_argument("name", choices=[j.name for j in JOBS])
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if args.cmd == "list":
+        with engine.begin() as conn:
+            _ensure_leases(conn)
+            leases = {r.name: r for r in conn.execute(select(JobLease.__table__))}
+        for j in JOBS:
+            r = leases[j.name]
+            state = f"rodando em {r.owner} até {r.locked_until:%Y-%m-%d %H:%M:%S}" if r.owner else "livre"
+            print(f"{j.name:24} a cada {j.every}  {state}")
+            print(f"{'':24} última: {r.last_finished_at or '-'} {r.last_result or ''}")
+        return 0
+
+    j = next(j for j in JOBS if j.name == args.name)
+    result = run_job(j, force=True)
+    if result is None:
+        print(f"{j.name} está rodando em outro worker")
+        return 1
+    print(json.dumps(result, indent=2, default=str))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,452 @@
+"""
+Gerador de dados sintéticos (catálogo, movimentações com sazonalidade e
+orçamentos). Mesma --seed + mesmos parâmetros => mesmas linhas.
+
+    cd backend
+    python -m app.seed --db sqlite:///./big.db --tenants 3 --movements 10000000
+
+Escreve por caminhos em lote: executemany direto no driver no SQLite e
+COPY no Postgres (psycopg 3). Outros bancos caem no insert() do Core.
+"""
+from __future__ import annotations
+
+import argparse
+import math
+import random
+import sys
+import time
+from dataclasses import dataclass
+from datetime import date, timedelta
+
+from sqlalchemy import create_engine, func, insert, select, text
+
+from .models import Category, Product, Quote, QuoteItem, StockMovement, User
+from .quotes import rebuild_summary
+
+CATEGORY_NAMES = [
+    "Ferragens", "Elétrica", "Hidráulica", "Pintura", "Ferramentas", "EPI", "Limpeza",
+    "Fixação", "Iluminação", "Jardinagem", "Madeiras", "Adesivos", "Embalagens", "Escritório",
+]
+PRODUCT_WORDS = [
+    "Parafuso", "Porca", "Arruela", "Cabo", "Tinta", "Cola", "Fita", "Luva", "Broca", "Chave",
+    "Lâmpada", "Tomada", "Disjuntor", "Tubo", "Conexão", "Registro", "Torneira", "Mangueira",
+    "Lixa", "Pincel", "Rolo", "Prego", "Bucha", "Abraçadeira",
+]
+PRODUCT_TRAITS = [
+    "Inox", "Galvanizado", "Reforçado", "Premium", "Econômico", "Industrial", "Branco",
+    "Preto", "Azul", "Pequeno", "Médio", "Grande",
+]
+UNITS = [("UN", 1.0), ("UN", 1.0), ("CX", 12.0), ("KG", 1.0), ("L", 1.0), ("PC", 1.0)]
+
+# IN / OUT / ADJUST
+MOVEMENT_KINDS = ["IN", "OUT", "ADJUST"]
+MOVEMENT_CUM_WEIGHTS = [35, 95, 100]
+# tipo -> (mínimo, amplitude, nota): entradas em lotes, saídas fracionadas
+MOVEMENT_QTY = {"IN": (10, 191, None), "OUT": (1, 30, None), "ADJUST": (1, 5, "inventário")}
+
+# horário comercial (07h-19h) pré-formatado: formatar hora por linha custa caro
+BUSINESS_START = 7 * 3600
+BUSINESS_SECONDS = 12 * 3600
+CLOCK = [
+    f"{t // 3600:02d}:{t // 60 % 60:02d}:{t % 60:02d}.000000"
+    for t in range(BUSINESS_START, BUSINESS_START + BUSINESS_SECONDS)
+]
+
+
+@dataclass
+class SeedConfig:
+    tenants: int = 1
+    categories: int = 20
+    products: int = 1_000
+    movements: int = 100_000  # por tenant
+    quotes: int = 100
+    quote_items: int = 50  # média de itens por orçamento
+    days: int = 365
+    until: date = date(2025, 12, 31)
+    seed: int = 42
+    email_domain: str = "seed.genericerp.dev"
+    password: str = "seed-password"
+    batch: int = 50_000
+    defer_indexes: bool = True  # recria os índices das tabelas grandes no fim
+
+
+# =========================
+# WRITERS
+# =========================
+class _CoreWriter:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def begin(self):
+        pass
+
+    def end(self):
+        pass
+
+    def after_commit(self):
+        pass
+
+    def write(self, table, columns: list[str], rows, batch: int) -> int:
+        n = 0
+        buf = []
+        for row in rows:
+            buf.append(dict(zip(columns, row)))
+            if len(buf) >= batch:
+                self.conn.execute(insert(table), buf)
+                n += len(buf)
+                buf = []
+        if buf:
+            self.conn.execute(insert(table), buf)
+            n += len(buf)
+        return n
+
+
+class _SQLiteWriter(_CoreWriter):
+    def begin(self):
+        self.raw = self.conn.connection.driver_connection
+        self.raw.execute("PRAGMA synchronous=OFF")
+
+    def after_commit(self):
+        self.raw.execute("PRAGMA synchronous=FULL")
+
+    def write(self, table, columns, rows, batch):
+        cols = ", ".join(f'"{c}"' for c in columns)
+        marks = ", ".join("?" for _ in columns)
+        sql = f'INSERT INTO "{table.name}" ({cols}) VALUES ({marks})'
+        cur = self.raw.cursor()
+        n = 0
+        buf = []
+        for row in rows:
+            buf.append(row)
+            if len(buf) >= batch:
+                cur.executemany(sql, buf)
+                n += len(buf)
+                buf = []
+        if buf:
+            cur.executemany(sql, buf)
+            n += len(buf)
+        return n
+
+
+class _PostgresCopyWriter(_CoreWriter):
+    def begin(self):
+        self.raw = self.conn.connection.driver_connection
+        self.tables = set()
+
+    def end(self):
+        # ids foram gerados aqui; acerta as sequences
+        for name in self.tables:
+            self.conn.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('\"{name}\"', 'id'), "
+                f"(SELECT max(id) FROM \"{name}\"))"
+            ))
+
+    def write(self, table, columns, rows, batch):
+        self.tables.add(table.name)
+        cols = ", ".join(f'"{c}"' for c in columns)
+        n = 0
+        with self.raw.cursor() as cur:
+            with cur.copy(f'COPY "{table.name}" ({cols}) FROM STDIN') as copy:
+                for row in rows:
+                    copy.write_row(row)
+                    n += 1
+        return n
+
+
+def _writer_for(conn):
+    dialect = conn.dialect.name
+    if dialect == "sqlite":
+        return _SQLiteWriter(conn)
+    if dialect == "postgresql" and conn.dialect.driver == "psycopg":
+        return _PostgresCopyWriter(conn)
+    return _CoreWriter(conn)
+
+
+# =========================
+# GERADORES
+# =========================
+def _ts(prefix: str, seconds: int) -> str:
+    # mesmo formato que o SQLAlchemy grava no SQLite; o Postgres aceita igual
+    return f"{prefix}{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}.000000"
+
+
+def _days(cfg: SeedConfig) -> tuple[list[date], list[float]]:
+    start = cfg.until - timedelta(days=cfg.days - 1)
+    days, weights = [], []
+    for n in range(cfg.days):
+        d = start + timedelta(days=n)
+        # sazonalidade anual com pico em novembro/dezembro + semana comercial
+        season = 1.0 + 0.35 * math.sin(2 * math.pi * (d.timetuple().tm_yday - 239) / 365.25)
+        weekday = (1.0, 1.0, 1.0, 1.0, 1.1, 0.5, 0.15)[d.weekday()]
+        days.append(d)
+        weights.append(season * weekday)
+    return days, weights
+
+
+def _spread(total: int, weights: list[float]) -> list[int]:
+    # distribui total pelos pesos sem perder nenhuma linha no arredondamento
+    s = sum(weights)
+    out, acc, prev = [], 0.0, 0
+    for w in weights:
+        acc += w
+        cur = int(total * acc / s)
+        out.append(cur - prev)
+        prev = cur
+    return out
+
+
+def _zipf_cum(n: int, s: float = 0.8) -> list[float]:
+    cum, acc = [], 0.0
+    for k in range(1, n + 1):
+        acc += 1.0 / k ** s
+        cum.append(acc)
+    return cum
+
+
+@dataclass
+class _Catalog:
+    category_ids: list[int]
+    category_discount: dict[int, float]
+    product_ids: list[int]
+    product_cum: list[float]
+    products: dict[int, tuple]  # id -> (sku, name, unit, price, category_id)
+
+
+def _seed_tenant(writer, cfg: SeedConfig, idx: int, ids: dict, user_id: int, password_hash: str, stats: dict):
+    def rng(stream: str) -> random.Random:
+        return random.Random(f"{cfg.seed}:{idx}:{stream}")
+
+    created = cfg.until - timedelta(days=cfg.days)
+    created_ts = _ts(created.isoformat() + " ", 8 * 3600)
+
+    def count(table, n):
+        stats[table] = stats.get(table, 0) + n
+
+    count("user", writer.write(
+        User.__table__, ["id", "email", "password_hash", "created_at"],
+        [(user_id, f"tenant{user_id}@{cfg.email_domain}", password_hash, created_ts)], cfg.batch,
+    ))
+
+    # ---------- catálogo ----------
+    r = rng("catalog")
+    cat_rows = []
+    discount = {}
+    for n in range(cfg.categories):
+        cid = ids["category"] + n
+        name = CATEGORY_NAMES[n] if n < len(CATEGORY_NAMES) else f"{CATEGORY_NAMES[n % len(CATEGORY_NAMES)]} {n + 1}"
+        auto = r.random() < 0.3
+        pct = float(r.choice([5, 10, 15])) if auto else 0.0
+        discount[cid] = pct
+        cat_rows.append((cid, user_id, name, auto, pct, created_ts, created_ts))
+    ids["category"] += cfg.categories
+    count("category", writer.write(
+        Category.__table__,
+        ["id", "user_id", "name", "auto_discount_enabled", "default_discount_percent", "created_at", "updated_at"],
+        cat_rows, cfg.batch,
+    ))
+
+    cat_ids = [row[0] for row in cat_rows]
+    products = {}
+
+    def product_rows():
+        for n in range(cfg.products):
+            pid = ids["product"] + n
+            unit, pack = r.choice(UNITS)
+            name = f"{r.choice(PRODUCT_WORDS)} {r.choice(PRODUCT_TRAITS)} {n + 1}"
+            sku = f"SKU-{n + 1:07d}"
+            price = round(min(5000.0, math.exp(r.gauss(3.5, 1.0))), 2)
+            cid = r.choice(cat_ids)
+            products[pid] = (sku, name, unit, price, cid)
+            yield (pid, user_id, cid, sku, name, unit, pack, price, created_ts, created_ts)
+
+    count("product", writer.write(
+        Product.__table__,
+        ["id", "user_id", "category_id", "sku", "name", "unit", "pack_factor", "price", "created_at", "updated_at"],
+        product_rows(), cfg.batch,
+    ))
+    ids["product"] += cfg.products
+    cat = _Catalog(
+        category_ids=cat_ids,
+        category_discount=discount,
+        product_ids=list(products),
+        product_cum=_zipf_cum(len(products)),
+        products=products,
+    )
+
+    # ---------- movimentações ----------
+    days, weights = _days(cfg)
+    per_day = _spread(cfg.movements, weights)
+    r = rng("movements")
+
+    def movement_rows():
+        mid = ids["stockmovement"]
+        rnd = r.random
+        for d, k in zip(days, per_day):
+            if not k:
+                continue
+            prefix = d.isoformat() + " "
+            secs = sorted(int(rnd() * BUSINESS_SECONDS) for _ in range(k))
+            pids = r.choices(cat.product_ids, cum_weights=cat.product_cum, k=k)
+            kinds = r.choices(MOVEMENT_KINDS, cum_weights=MOVEMENT_CUM_WEIGHTS, k=k)
+            for s, pid, kind in zip(secs, pids, kinds):
+                lo, span, note = MOVEMENT_QTY[kind]
+                yield (mid, user_id, pid, kind, float(lo + int(rnd() * span)), note, prefix + CLOCK[s])
+                mid += 1
+        ids["stockmovement"] = mid
+
+    count("stockmovement", writer.write(
+        StockMovement.__table__,
+        ["id", "user_id", "product_id", "type", "quantity", "note", "created_at"],
+        movement_rows(), cfg.batch,
+    ))
+
+    # ---------- orçamentos ----------
+    # cada orçamento tem o próprio gerador: o cabeçalho (com totais) e os
+    # itens são gerados em duas passadas idênticas, sem guardar tudo em memória
+    r = rng("quotes")
+    quote_days = r.choices(days, weights=weights, k=cfg.quotes)
+    quote_ids = list(range(ids["quote"], ids["quote"] + cfg.quotes))
+    ids["quote"] += cfg.quotes
+
+    def items_for(qid: int):
+        qr = rng(f"quote:{qid}")
+        k = qr.randint(max(1, cfg.quote_items // 2), max(1, cfg.quote_items * 3 // 2))
+        pids = qr.choices(cat.product_ids, cum_weights=cat.product_cum, k=k)
+        for pid in pids:
+            sku, name, unit, price, cid = cat.products[pid]
+            qty = float(qr.randint(1, 50))
+            disc = cat.category_discount[cid]
+            gross = qty * price
+            d = gross * disc / 100.0
+            yield (pid, sku, name, unit, qty, price, disc, gross, d, gross - d)
+
+    def quote_rows():
+        for n, (qid, issued) in enumerate(zip(quote_ids, quote_days)):
+            tg = td = tn = 0.0
+            for it in items_for(qid):
+                tg += it[7]
+                td += it[8]
+                tn += it[9]
+            valid = issued + timedelta(days=r.choice([7, 15, 30]))
+            if valid < cfg.until:
+                status = r.choices(["APPROVED", "REJECTED", "CANCELLED", "DRAFT"], weights=[40, 25, 10, 25])[0]
+            else:
+                status = r.choice(["DRAFT", "SENT"])
+            yield (
+                qid, user_id, f"Cliente {n + 1}", f"cliente{n + 1}@example.com", status,
+                issued.isoformat(), valid.isoformat(), None, tg, td, tn,
+                _ts(issued.isoformat() + " ", 9 * 3600),
+            )
+
+    count("quote", writer.write(
+        Quote.__table__,
+        ["id", "user_id", "customer_name", "customer_email", "status", "issued_at", "valid_until",
+         "notes", "total_gross", "total_discount", "total_net", "created_at"],
+        quote_rows(), cfg.batch,
+    ))
+
+    def item_rows():
+        iid = ids["quoteitem"]
+        for qid, issued in zip(quote_ids, quote_days):
+            ts = _ts(issued.isoformat() + " ", 9 * 3600)
+            for it in items_for(qid):
+                yield (iid, qid, user_id, *it, ts)
+                iid += 1
+        ids["quoteitem"] = iid
+
+    count("quoteitem", writer.write(
+        QuoteItem.__table__,
+        ["id", "quote_id", "user_id", "product_id", "sku_snapshot", "name_snapshot", "unit_snapshot",
+         "quantity", "unit_price", "discount_percent", "gross_total", "discount_total", "net_total",
+         "created_at"],
+        item_rows(), cfg.batch,
+    ))
+
+
+def seed_database(engine, cfg: SeedConfig, log=None) -> list[int]:
+    """Semeia cfg.tenants tenants novos e devolve os user_id criados."""
+    from .auth import hash_password  # bcrypt uma vez só, não por usuário
+
+    password_hash = hash_password(cfg.password)
+    stats: dict[str, int] = {}
+    user_ids = []
+    t0 = time.perf_counter()
+
+    with engine.begin() as conn:
+        ids = {
+            model.__tablename__: int(conn.execute(select(func.coalesce(func.max(model.id), 0))).scalar_one()) + 1
+            for model in (User, Category, Product, StockMovement, Quote, QuoteItem)
+        }
+        # manter índice secundário a cada linha é o que mais custa na carga;
+        # construir de uma vez no fim (dados já ordenados) sai bem mais barato
+        deferred = []
+        if cfg.defer_indexes:
+            for model in (StockMovement, QuoteItem):
+                for index in model.__table__.indexes:
+                    index.drop(conn, checkfirst=True)
+                    deferred.append(index)
+
+        writer = _writer_for(conn)
+        writer.begin()
+        for idx in range(cfg.tenants):
+            user_id = ids["user"]
+            ids["user"] += 1
+            _seed_tenant(writer, cfg, idx, ids, user_id, password_hash, stats)
+            user_ids.append(user_id)
+            if log:
+                elapsed = time.perf_counter() - t0
+                total = sum(stats.values())
+                log(f"tenant {idx + 1}/{cfg.tenants}: {total:,} linhas, {total / elapsed:,.0f} linhas/s")
+        writer.end()
+        # resumo diário dos orçamentos: um INSERT ... SELECT por carga, não por linha
+        rebuild_summary(conn, user_ids)
+        if deferred and log:
+            log(f"recriando {len(deferred)} índice(s)...")
+        for index in deferred:
+            index.create(conn, checkfirst=True)
+    writer.after_commit()
+
+    if log:
+        elapsed = time.perf_counter() - t0
+        for table, n in stats.items():
+            log(f"  {table:15} {n:>12,}")
+        total = sum(stats.values())
+        log(f"total: {total:,} linhas em {elapsed:.1f}s ({total / elapsed:,.0f} linhas/s)")
+    return user_ids
+
+
+def main(argv=None) -> int:
+    from .db import DATABASE_URL
+
+    d = SeedConfig()
+    parser = argparse.ArgumentParser(prog="python -m app.seed", description="Gera dados sintéticos em lote.")
+    parser.add_argument("--db", default=DATABASE_URL, help="URL SQLAlchemy (default: DATABASE_URL)")
+    parser.add_argument("--tenants", type=int, default=d.tenants)
+    parser.add_argument("--categories", type=int, default=d.categories)
+    parser.add_argument("--products", type=int, default=d.products)
+    parser.add_argument("--movements", type=int, default=d.movements, help="movimentações por tenant")
+    parser.add_argument("--quotes", type=int, default=d.quotes)
+    parser.add_argument("--quote-items", type=int, default=d.quote_items, help="média de itens por orçamento")
+    parser.add_argument("--days", type=int, default=d.days, help="dias de histórico")
+    parser.add_argument("--until", type=date.fromisoformat, default=d.until, help="último dia do histórico (AAAA-MM-DD)")
+    parser.add_argument("--seed", type=int, default=d.seed)
+    parser.add_argument("--email-domain", default=d.email_domain)
+    parser.add_argument("--password", default=d.password)
+    parser.add_argument("--batch", type=int, default=d.batch)
+    parser.add_argument("--keep-indexes", dest="defer_indexes", action="store_false",
+                        help="não derruba/recria índices (melhor quando o banco já é grande)")
+    args = parser.parse_args(argv)
+
+    cfg = SeedConfig(**{k: v for k, v in vars(args).items() if k != "db"})
+    engine = create_engine(args.db)
+
+    from .migrations import migrate
+
+    migrate(engine, online=True)
+    user_ids = seed_database(engine, cfg, log=lambda m: print(m, file=sys.stderr, flush=True))
+    print(" ".join(str(u) for u in user_ids))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
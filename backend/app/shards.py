@@ -0,0 +1,432 @@
+"""
+Shards de tenants: cada usuário tem os dados num banco (User.shard); o banco
+principal continua sendo o diretório de usuários. Mudança de shard com o
+tenant no ar:
+
+    cd backend
+    python -m app.shards list
+    python -m app.shards move 42 big
+
+A mudança copia tudo para o destino sem bloquear o tenant (as tabelas só de
+inserção, como as movimentações, seguem sendo copiadas por marca d'água de
+id), depois congela as escritas dele por alguns segundos (503 + Retry-After),
+sincroniza o que mudou, confere as contagens, troca User.shard e só então
+apaga a origem. Ids que já existirem no destino são renumerados.
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import sys
+import time
+from dataclasses import dataclass, field
+
+from sqlalchemy import bindparam, delete, func, insert, select, text, update
+from sqlalchemy.engine import Connection
+from sqlmodel import Session
+
+from .cache import invalidate
+from .catalog import touch_catalog
+from .db import engine, shard_engine, shard_engines
+from .models import (
+    CatalogChange,
+    Category,
+    Product,
+    Quote,
+    QuoteDailySummary,
+    QuoteItem,
+    ReorderPoint,
+    StockAlert,
+    StockMovement,
+    StockMovementArchive,
+    StockPeriod,
+    User,
+)
+
+log = logging.getLogger("genericerp.shards")
+
+
+@dataclass(frozen=True)
+class TenantTable:
+    model: type
+    # coluna -> modelo cujo mapa de ids (origem -> destino) se aplica
+    refs: dict = field(default_factory=dict)
+    # só recebe INSERT: copiado ao vivo por marca d'água de id; as demais são
+    # sincronizadas (insert/update/delete) com as escritas congeladas
+    append_only: bool = False
+    # tabelas que dividem o espaço de ids (o arquivo reaproveita o id da movimentação)
+    id_space: tuple = ()
+    # coluna que cresce a cada alteração da linha: a sincronização só relê o
+    # que passou da marca. Sem ela, compara um hash de cada linha com a rodada anterior
+    changed_by: str | None = None
+
+
+# pais antes dos filhos (a remoção usa a ordem inversa). Tabela nova com
+# user_id precisa entrar aqui.
+TENANT_TABLES = [
+    TenantTable(Category, changed_by="change_seq"),
+    TenantTable(Product, {"category_id": Category}, changed_by="change_seq"),
+    TenantTable(Quote),
+    TenantTable(QuoteItem, {"quote_id": Quote, "product_id": Product}),
+    TenantTable(QuoteDailySummary),
+    TenantTable(ReorderPoint, {"product_id": Product}),
+    TenantTable(StockAlert, {"product_id": Product}),
+    # não é só de inserção: o encerramento grava os contadores no fim
+    TenantTable(StockPeriod),
+    TenantTable(StockMovementArchive, {"product_id": Product}, append_only=True, id_space=(StockMovement,)),
+    TenantTable(StockMovement, {"product_id": Product}, append_only=True, id_space=(StockMovementArchive,)),
+    # seq vai junto: o cursor do /sync/catalog continua valendo no destino
+    TenantTable(CatalogChange, append_only=True),
+]
+
+
+class MoveAborted(RuntimeError):
+    pass
+
+
+# =========================
+# HELPERS
+# =========================
+def ensure_user_row(conn: Connection, user: User) -> None:
+    # cópia da linha do usuário no shard: as FKs user_id apontam pra ela
+    table = User.__table__
+    if conn.execute(select(table.c.id).where(table.c.id == user.id)).first():
+        return
+    conn.execute(insert(table).values(
+        id=user.id,
+        email=user.email,
+        password_hash=user.password_hash,
+        created_at=user.created_at,
+        shard=user.shard,
+    ))
+    _bump_sequence(conn, table)
+
+
+def _bump_sequence(conn: Connection, table) -> None:
+    # ids explícitos no Postgres: a sequence precisa passar do maior id
+    if conn.dialect.name != "postgresql":
+        return
+    seq = conn.execute(text(f"SELECT pg_get_serial_sequence('\"{table.name}\"', 'id')")).scalar()
+    if seq:
+        conn.execute(text(
+            f"SELECT setval('{seq}', GREATEST((SELECT COALESCE(max(id), 1) FROM \"{table.name}\"), "
+            f"(SELECT last_value FROM {seq})))"
+        ))
+
+
+def _allocate_ids(conn: Connection, t: TenantTable, n: int) -> list[int]:
+    tables = [t.model.__table__] + [m.__table__ for m in t.id_space]
+    if conn.dialect.name == "postgresql":
+        seq_table = next(tb for tb in tables if tb.c.id.autoincrement is not False)
+        return list(conn.execute(
+            text(f"SELECT nextval(pg_get_serial_sequence('\"{seq_table.name}\"', 'id')) FROM generate_series(1, :n)"),
+            {"n": n},
+        ).scalars())
+    # SQLite: rowid novo = max + 1, então um bloco acima do maior id não colide —
+    # desde que ninguém insira entre o max e o INSERT: a reserva pega o lock de
+    # escrita do destino, que só sai no commit depois do INSERT do bloco
+    if not conn.connection.driver_connection.in_transaction:
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+    base = max(conn.execute(select(func.max(tb.c.id))).scalar() or 0 for tb in tables) + 1
+    return list(range(base, base + n))
+
+
+def _remap(t: TenantTable, row: dict, ids: dict) -> dict:
+    for col, ref in t.refs.items():
+        try:
+            row[col] = ids[ref][row[col]]
+        except KeyError:
+            raise MoveAborted(f"{t.model.__tablename__}.{col}={row[col]} sem linha correspondente no destino")
+    return row
+
+
+def _count(conn: Connection, t: TenantTable, user_id: int) -> int:
+    table = t.model.__table__
+    return conn.execute(select(func.count()).select_from(table).where(table.c.user_id == user_id)).scalar()
+
+
+def _purge(conn: Connection, user_id: int, batch: int) -> int:
+    n = 0
+    for t in reversed(TENANT_TABLES):
+        table = t.model.__table__
+        while True:
+            chunk = list(conn.execute(
+                select(table.c.id).where(table.c.user_id == user_id).limit(batch)
+            ).scalars())
+            if not chunk:
+                break
+            conn.execute(delete(table).where(table.c.id.in_(chunk)))
+            conn.commit()
+            n += len(chunk)
+    return n
+
+
+# =========================
+# CÓPIA
+# =========================
+class TenantMove:
+    def __init__(self, user_id: int, source: str, target: str, batch: int = 10_000):
+        self.user_id = user_id
+        self.src = shard_engine(source)
+        self.dst = shard_engine(target)
+        self.batch = batch
+        # modelo -> {id na origem: id no destino}
+        self.ids: dict[type, dict[int, int]] = {}
+        # marca d'água (maior id de origem já copiado) das tabelas só de inserção
+        self.copied_upto: dict[type, int] = {}
+        # mutáveis: maior changed_by já sincronizado / hash de cada linha copiada
+        self.synced_upto: dict[type, int] = {}
+        self.digests: dict[type, dict[int, int]] = {}
+
+    def sync_mutable(self, src: Connection, dst: Connection) -> None:
+        stale: dict[type, list[int]] = {}
+        for t in TENANT_TABLES:
+            if not t.append_only:
+                stale[t.model] = self._sync_table(src, dst, t)
+        # apagadas na origem: filhos antes dos pais
+        for t in reversed(TENANT_TABLES):
+            olds = stale.get(t.model)
+            if olds:
+                table = t.model.__table__
+                mapping = self.ids[t.model]
+                digests = self.digests.get(t.model, {})
+                for old in olds:
+                    digests.pop(old, None)
+                dst.execute(delete(table).where(table.c.id.in_([mapping.pop(old) for old in olds])))
+
+    def _changed_rows(self, src: Connection, t: TenantTable) -> tuple[list[dict], set[int]]:
+        """(linhas novas ou alteradas desde a rodada anterior, ids que existem na origem)"""
+        table = t.model.__table__
+        mine = table.c.user_id == self.user_id
+        if t.changed_by:
+            stmt = select(table).where(mine).order_by(table.c.id)
+            mark = self.synced_upto.get(t.model)
+            if mark is not None:
+                stmt = stmt.where(table.c[t.changed_by] > mark)
+            rows = [dict(r._mapping) for r in src.execute(stmt)]
+            self.synced_upto[t.model] = max([mark or 0, *(row[t.changed_by] for row in rows)])
+            return rows, set(src.execute(select(table.c.id).where(mine)).scalars())
+
+        digests = self.digests.setdefault(t.model, {})
+        rows, live = [], set()
+        for r in src.execute(select(table).where(mine).order_by(table.c.id)):
+            live.add(r.id)
+            digest = hash(tuple(r))
+            if digests.get(r.id) != digest:
+                digests[r.id] = digest
+                rows.append(dict(r._mapping))
+        return rows, live
+
+    def _sync_table(self, src: Connection, dst: Connection, t: TenantTable) -> list[int]:
+        table = t.model.__table__
+        mapping = self.ids.setdefault(t.model, {})
+        # congelado, o custo é o das linhas alteradas, não o tamanho do tenant
+        rows, live = self._changed_rows(src, t)
+
+        updates, fresh = [], []
+        for row in rows:
+            old = row["id"]
+            _remap(t, row, self.ids)
+            if old in mapping:
+                row["id"] = mapping[old]
+                updates.append(row)
+            else:
+                fresh.append((old, row))
+
+        if updates:
+            cols = [c.name for c in table.columns if c.name != "id"]
+            dst.execute(
+                update(table)
+                .where(table.c.id == bindparam("_id"))
+                .values({c: bindparam(f"_{c}") for c in cols}),
+                [{f"_{k}": v for k, v in row.items()} for row in updates],
+            )
+
+        # mantém o id quando está livre no destino (links continuam valendo)
+        explicit = False
+        for i in range(0, len(fresh), 500):
+            chunk = fresh[i:i + 500]
+            taken = set(dst.execute(
+                select(table.c.id).where(table.c.id.in_([old for old, _ in chunk]))
+            ).scalars())
+            keep = [row for old, row in chunk if old not in taken]
+            if keep:
+                dst.execute(insert(table), keep)
+                explicit = True
+                for row in keep:
+                    mapping[row["id"]] = row["id"]
+            for old, row in chunk:
+                if old in taken:
+                    row = {k: v for k, v in row.items() if k != "id"}
+                    mapping[old] = dst.execute(insert(table).values(**row)).inserted_primary_key[0]
+        if explicit:
+            _bump_sequence(dst, table)
+
+        return [old for old in mapping if old not in live]
+
+    def copy_appended(self, src: Connection, dst: Connection) -> int:
+        n = 0
+        for t in TENANT_TABLES:
+            if not t.append_only:
+                continue
+            table = t.model.__table__
+            while True:
+                after = self.copied_upto.get(t.model, 0)
+                rows = [dict(r._mapping) for r in src.execute(
+                    select(table)
+                    .where(table.c.user_id == self.user_id, table.c.id > after)
+                    .order_by(table.c.id)
+                    .limit(self.batch)
+                )]
+                if not rows:
+                    break
+                last = rows[-1]["id"]
+                if any(row[col] not in self.ids.get(ref, {}) for row in rows for col, ref in t.refs.items()):
+                    # referência criada depois da última sincronização
+                    self.sync_mutable(src, dst)
+                # ids novos na ordem da origem: extrato empata por (created_at, id)
+                for row, new in zip(rows, _allocate_ids(dst, t, len(rows))):
+                    _remap(t, row, self.ids)
+                    row["id"] = new
+                dst.execute(insert(table), rows)
+                dst.commit()
+                self.copied_upto[t.model] = last
+                n += len(rows)
+        return n
+
+    def verify(self, src: Connection, dst: Connection) -> None:
+        # linha apagada/inserida abaixo da marca d'água (ex.: período encerrado
+        # durante a cópia) não é acompanhada: a contagem denuncia
+        for t in TENANT_TABLES:
+            a, b = _count(src, t, self.user_id), _count(dst, t, self.user_id)
+            if a != b:
+                raise MoveAborted(f"{t.model.__tablename__}: {a} linha(s) na origem, {b} no destino")
+
+
+def _set_user(user_id: int, **values) -> None:
+    with engine.begin() as conn:
+        conn.execute(update(User.__table__).where(User.__table__.c.id == user_id).values(**values))
+
+
+def move_tenant(
+    user_id: int,
+    target: str,
+    batch: int = 10_000,
+    rounds: int = 5,
+    grace: float = 2.0,
+    log=log.info,
+) -> dict:
+    with Session(engine) as session:
+        user = session.get(User, user_id)
+        if not user:
+            raise SystemExit(f"usuário {user_id} não existe")
+        session.expunge(user)
+    source = user.shard
+    if source == target:
+        raise SystemExit(f"usuário {user_id} já está em {target}")
+    if user.shard_frozen:
+        raise SystemExit(f"usuário {user_id} está congelado (mudança anterior interrompida?)")
+
+    move = TenantMove(user_id, source, target, batch=batch)
+    stats = {"user_id": user_id, "from": source, "to": target}
+
+    with move.src.connect() as src, move.dst.connect() as dst:
+        # sobra de tentativa anterior
+        leftovers = _purge(dst, user_id, batch)
+        if leftovers:
+            log(f"removidas {leftovers} linha(s) de uma tentativa anterior em {target}")
+        ensure_user_row(dst, user)
+        dst.commit()
+
+        frozen = False
+        try:
+            # 1) cópia ao vivo; cada rodada pega o que entrou durante a anterior
+            t0 = time.perf_counter()
+            for i in range(rounds):
+                move.sync_mutable(src, dst)
+                dst.commit()
+                n = move.copy_appended(src, dst)
+                src.rollback()  # snapshot novo na próxima leitura
+                log(f"rodada {i + 1}: {n} linha(s) copiada(s)")
+                if n < batch:
+                    break
+            stats["live_seconds"] = round(time.perf_counter() - t0, 3)
+
+            # 2) congela escritas, espera as que estavam em voo e fecha a diferença
+            _set_user(user_id, shard_frozen=True)
+            frozen = True
+            t0 = time.perf_counter()
+            time.sleep(grace)
+            move.sync_mutable(src, dst)
+            dst.commit()
+            move.copy_appended(src, dst)
+            src.rollback()
+            move.verify(src, dst)
+            if any(old != new for m in (Category, Product) for old, new in move.ids.get(m, {}).items()):
+                # ids renumerados: cache do catálogo nos clientes não vale mais
+                with Session(bind=dst) as session:
+                    touch_catalog(session, user_id, op="reset")
+                dst.commit()
+            _set_user(user_id, shard=target, shard_frozen=False)
+            # caches apontam para o shard antigo (e ids podem ter mudado)
+            invalidate("catalog", "stock", "quotes", user_id=user_id)
+        except BaseException:
+            if frozen:
+                _set_user(user_id, shard_frozen=False)
+            dst.rollback()
+            _purge(dst, user_id, batch)
+            raise
+        stats["frozen_seconds"] = round(time.perf_counter() - t0, 3)
+        log(f"tenant {user_id} agora em {target} (escritas congeladas por {stats['frozen_seconds']}s)")
+
+        # 3) leituras em voo na origem terminam; depois limpa
+        time.sleep(grace)
+        stats["rows_removed_from_source"] = _purge(src, user_id, batch)
+        stats["renumbered"] = {
+            m.__tablename__: sum(1 for old, new in ids.items() if old != new)
+            for m, ids in move.ids.items()
+        }
+    return stats
+
+
+# =========================
+# CLI
+# =========================
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.shards")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    sub.add_parser("list", help="tenants por shard")
+
+    mv = sub.add_parser("move", help="muda um tenant de shard sem tirá-lo do ar")
+    mv.add_argument("user_id", type=int)
+    mv.add_argument("target", choices=sorted(shard_engines))
+    mv.add_argument("--batch", type=int, default=10_000)
+    mv.add_argument("--grace", type=float, default=2.0, help="segundos de espera por escritas em voo")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if args.cmd == "list":
+        with Session(engine) as session:
+            rows = session.exec(
+                select(User.shard, func.count()).group_by(User.shard).order_by(User.shard)
+            ).all()
+        counts = dict(rows)
+        for name in sorted(set(shard_engines) | set(counts)):
+            mark = "" if name in shard_engines else "  (fora de SHARDS!)"
+            print(f"{name:20} {counts.get(name, 0):>8} tenant(s){mark}")
+        return 0
+
+    try:
+        stats = move_tenant(args.user_id, args.target, batch=args.batch, grace=args.grace)
+    except MoveAborted as e:
+        print(f"mudança desfeita: {e}; rode de novo", file=sys.stderr)
+        return 1
+    for k, v in stats.items():
+        print(f"{k}: {v}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,302 @@
+"""
+Log de consultas lentas. Todo statement (banco principal, réplicas e
+shards) que passar de SLOW_QUERY_MS vai para o logger `genericerp.slowlog`
+e entra num agregado por fingerprint — o texto normalizado, com literais,
+parâmetros e listas do IN trocados por `?`. Cada fingerprint guarda
+contagem e tempos, as rotas de origem, os últimos parâmetros (redigidos:
+texto vira `<str:N>`) e o plano (EXPLAIN sem ANALYZE). O plano é tirado
+por uma thread à parte, numa conexão própria, e renovado a cada
+SLOW_QUERY_PLAN_TTL_SECONDS — assim dá para ver o plano mudar conforme os
+tenants crescem. O top-N sai em /admin/slow-queries.
+
+O agregado é por processo e só vive na memória (SLOW_QUERY_MAX_FINGERPRINTS).
+"""
+from __future__ import annotations
+
+import contextvars
+import hashlib
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from datetime import time as dtime
+from decimal import Decimal
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+log = logging.getLogger("genericerp.slowlog")
+
+# 0 desliga
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+SLOW_QUERY_EXPLAIN = os.getenv("SLOW_QUERY_EXPLAIN", "true").lower() == "true"
+SLOW_QUERY_PLAN_TTL_SECONDS = float(os.getenv("SLOW_QUERY_PLAN_TTL_SECONDS", "600"))
+SLOW_QUERY_MAX_FINGERPRINTS = int(os.getenv("SLOW_QUERY_MAX_FINGERPRINTS", "500"))
+SLOW_QUERY_TOP = int(os.getenv("SLOW_QUERY_TOP", "20"))
+
+# scope ASGI da requisição em andamento (a rota casada entra nele depois)
+_scope: contextvars.ContextVar[dict | None] = contextvars.ContextVar("slowlog_scope", default=None)
+
+
+# =========================
+# NORMALIZAÇÃO
+# =========================
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_PARAM = re.compile(r"%\(\w+\)s|%s|\?")
+_NUMBER = re.compile(r"(?<![\w.$])\d+(?:\.\d+)?(?!\w)")
+_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_ROWS = re.compile(r"\(\?\+\)(?:\s*,\s*\(\?\+\))+")
+_EXPLAINABLE = re.compile(r"^\s*(?:SELECT|WITH|INSERT|UPDATE|DELETE)\b", re.I)
+
+
+def normalize(statement: str) -> str:
+    s = " ".join(statement.split())
+    s = _STRING.sub("?", s)
+    s = _PARAM.sub("?", s)
+    s = _NUMBER.sub("?", s)
+    # IN (?, ?, ?) e VALUES (...), (...) não podem virar fingerprints diferentes
+    s = _LIST.sub("(?+)", s)
+    return _ROWS.sub("(?+)", s)
+
+
+def fingerprint(normalized: str) -> str:
+    return hashlib.sha1(normalized.encode()).hexdigest()[:16]
+
+
+def _redact(value):
+    if value is None or isinstance(value, (bool, int, float, Decimal)):
+        return value
+    if isinstance(value, (datetime, date, dtime)):
+        return value.isoformat()
+    if isinstance(value, str):
+        return f"<str:{len(value)}>"
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return f"<bytes:{len(value)}>"
+    return f"<{type(value).__name__}>"
+
+
+def redact(parameters, executemany: bool = False):
+    if executemany:
+        return {"executemany": len(parameters)}
+    if isinstance(parameters, dict):
+        return {k: _redact(v) for k, v in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [_redact(v) for v in parameters]
+    return _redact(parameters)
+
+
+def current_route() -> str:
+    scope = _scope.get()
+    if scope is None:
+        # scheduler, barramento, CLI
+        return f"[{threading.current_thread().name}]"
+    route = scope.get("route")
+    return f"{scope.get('method', '')} {getattr(route, 'path', None) or scope.get('path', '')}"
+
+
+# =========================
+# AGREGADO
+# =========================
+@dataclass
+class SlowQuery:
+    fingerprint: str
+    sql: str
+    dialect: str
+    count: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+    last_ms: float = 0.0
+    last_at: datetime | None = None
+    last_params: object = None
+    routes: Counter = field(default_factory=Counter)
+    plan: list[str] | None = None
+    plan_at: datetime | None = None
+    plan_error: str | None = None
+    # monotonic do último pedido de EXPLAIN (None = nunca / falhou na fila)
+    plan_requested: float | None = None
+
+    def as_dict(self) -> dict:
+        return {
+            "fingerprint": self.fingerprint,
+            "sql": self.sql,
+            "dialect": self.dialect,
+            "count": self.count,
+            "total_ms": round(self.total_ms, 3),
+            "mean_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "max_ms": round(self.max_ms, 3),
+            "last_ms": round(self.last_ms, 3),
+            "last_at": self.last_at,
+            "last_params": self.last_params,
+            "routes": dict(self.routes.most_common(10)),
+            "plan": self.plan,
+            "plan_at": self.plan_at,
+            "plan_error": self.plan_error,
+        }
+
+
+_stats: dict[str, SlowQuery] = {}
+_lock = threading.Lock()
+
+_ORDER = {
+    "total": lambda q: q.total_ms,
+    "max": lambda q: q.max_ms,
+    "mean": lambda q: q.total_ms / q.count,
+    "count": lambda q: q.count,
+}
+
+
+def report(limit: int = SLOW_QUERY_TOP, order: str = "total") -> dict:
+    key = _ORDER[order]
+    with _lock:
+        top = sorted(_stats.values(), key=key, reverse=True)[:limit]
+        queries = [q.as_dict() for q in top]
+        total = len(_stats)
+    return {"threshold_ms": SLOW_QUERY_MS, "fingerprints": total, "order": order, "queries": queries}
+
+
+def reset() -> None:
+    with _lock:
+        _stats.clear()
+
+
+def _record(engine, statement: str, parameters, executemany: bool, ms: float) -> None:
+    sql = normalize(statement)
+    fp = fingerprint(sql)
+    route = current_route()
+    now = time.monotonic()
+    with _lock:
+        q = _stats.get(fp)
+        if q is None:
+            if len(_stats) >= SLOW_QUERY_MAX_FINGERPRINTS:
+                # sai o que menos pesou no total
+                del _stats[min(_stats.values(), key=_ORDER["total"]).fingerprint]
+            q = _stats[fp] = SlowQuery(fingerprint=fp, sql=sql, dialect=engine.dialect.name)
+        q.count += 1
+        q.total_ms += ms
+        q.max_ms = max(q.max_ms, ms)
+        q.last_ms = ms
+        q.last_at = datetime.utcnow()
+        q.last_params = redact(parameters, executemany)
+        q.routes[route] += 1
+        want_plan = (
+            SLOW_QUERY_EXPLAIN
+            and not executemany
+            and _EXPLAINABLE.match(statement) is not None
+            and (q.plan_requested is None or now - q.plan_requested > SLOW_QUERY_PLAN_TTL_SECONDS)
+        )
+        if want_plan:
+            q.plan_requested = now
+
+    log.warning("consulta lenta %.1f ms [%s] %s: %s", ms, route, fp, sql[:500])
+    if want_plan:
+        _explainer.submit(engine, fp, statement, parameters)
+
+
+# =========================
+# EXPLAIN (thread própria: não pesa na requisição nem mexe na transação dela)
+# =========================
+def explain(engine, statement: str, parameters) -> list[str]:
+    raw = engine.raw_connection()
+    try:
+        cur = raw.cursor()
+        if engine.dialect.name == "sqlite":
+            cur.execute("EXPLAIN QUERY PLAN " + statement, parameters)
+            return [row[-1] for row in cur.fetchall()]
+        # sem ANALYZE: UPDATE/DELETE não são executados
+        cur.execute("EXPLAIN (ANALYZE false) " + statement, parameters)
+        return [row[0] for row in cur.fetchall()]
+    finally:
+        raw.rollback()
+        raw.close()
+
+
+class _Explainer:
+    def __init__(self):
+        self._queue: queue.Queue = queue.Queue(maxsize=100)
+        self._thread: threading.Thread | None = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, engine, fp: str, statement: str, parameters) -> None:
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="slowlog-explain", daemon=True)
+                self._thread.start()
+        try:
+            self._queue.put_nowait((engine, fp, statement, parameters))
+        except queue.Full:
+            with _lock:
+                q = _stats.get(fp)
+                if q is not None:
+                    q.plan_requested = None  # tenta de novo na próxima vez
+
+    def _loop(self) -> None:
+        while True:
+            engine, fp, statement, parameters = self._queue.get()
+            plan, error = None, None
+            try:
+                plan = explain(engine, statement, parameters)
+            except Exception as e:
+                error = repr(e)[:500]
+            with _lock:
+                q = _stats.get(fp)
+                if q is None:
+                    continue
+                if plan is not None:
+                    q.plan, q.plan_at, q.plan_error = plan, datetime.utcnow(), None
+                else:
+                    q.plan_error = error
+
+
+_explainer = _Explainer()
+
+
+# =========================
+# EVENTOS (todas as engines)
+# =========================
+def _before(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("slowlog_t0", []).append(time.perf_counter())
+
+
+def _after(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("slowlog_t0")
+    if not starts:
+        return
+    ms = (time.perf_counter() - starts.pop()) * 1000.0
+    if ms >= SLOW_QUERY_MS:
+        _record(conn.engine, statement, parameters, executemany, ms)
+
+
+def _failed(ctx):
+    # statement com erro não passa pelo after_cursor_execute
+    if ctx.connection is not None:
+        starts = ctx.connection.info.get("slowlog_t0")
+        if starts:
+            starts.pop()
+
+
+if SLOW_QUERY_MS > 0:
+    event.listen(Engine, "before_cursor_execute", _before)
+    event.listen(Engine, "after_cursor_execute", _after)
+    event.listen(Engine, "handle_error", _failed)
+
+
+# =========================
+# MIDDLEWARE: de qual rota veio a consulta
+# =========================
+class SlowQueryMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        token = _scope.set(scope)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _scope.reset(token)
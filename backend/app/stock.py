@@ -0,0 +1,282 @@
+from __future__ import annotations
+
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import case, delete, func, insert, literal, select, text, union_all, update
+from sqlmodel import Session
+
+from .models import ReorderPoint, StockAlert, StockMovement, StockMovementArchive, StockPeriod
+
+# saldo de abertura gravado no encerramento de período
+OPENING = "OPENING"
+POSITIVE_TYPES = ("IN", "ADJUST", OPENING)
+
+# movimentações por transação no encerramento (cada lote segura o lock do tenant)
+SEAL_BATCH = int(os.getenv("SEAL_BATCH", "5000"))
+
+# pg_advisory_xact_lock(_LOCK_KEY, user_id): movimentação e encerramento do
+# mesmo tenant em fila
+_LOCK_KEY = 0x570C_4
+
+
+def lock_stock(session: Session, user_id: int) -> None:
+    """Lock de estoque do tenant até o fim da transação; chame antes de ler o período encerrado."""
+    conn = session.connection()
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("SELECT pg_advisory_xact_lock(:k, :u)"), {"k": _LOCK_KEY, "u": user_id})
+    elif conn.dialect.name == "sqlite" and not conn.connection.driver_connection.in_transaction:
+        # SQLite só tem o lock do banco: pede o de escrita já, e não no primeiro
+        # INSERT (depois da checagem do período)
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+def signed_quantity(cols):
+    # cols: StockMovement, StockMovementArchive ou .c de um subquery
+    return case(
+        (cols.type.in_(POSITIVE_TYPES), cols.quantity),
+        (cols.type == "OUT", -cols.quantity),
+        else_=0,
+    )
+
+
+def signed(type_: str, quantity: float) -> float:
+    if type_ in POSITIVE_TYPES:
+        return float(quantity)
+    if type_ == "OUT":
+        return -float(quantity)
+    return 0.0
+
+
+def product_balance(session: Session, user_id: int, product_id: int) -> float:
+    # períodos encerrados já estão nas linhas OPENING da tabela quente
+    return float(session.exec(
+        select(func.coalesce(func.sum(signed_quantity(StockMovement)), 0)).where(
+            StockMovement.user_id == user_id,
+            StockMovement.product_id == product_id,
+        )
+    ).one()[0])
+
+
+def closed_before(session: Session, user_id: int) -> datetime | None:
+    return session.exec(
+        select(func.max(StockPeriod.closed_before)).where(StockPeriod.user_id == user_id)
+    ).one()[0]
+
+
+def movement_history(user_id: int, product_id: int | None = None):
+    """
+    Histórico completo (arquivo + tabela quente), sem as linhas OPENING —
+    elas só resumem o que já está no arquivo.
+    """
+    cols = ("id", "user_id", "product_id", "type", "quantity", "note", "created_at")
+
+    archived = select(*(getattr(StockMovementArchive, c) for c in cols)).where(
+        StockMovementArchive.user_id == user_id
+    )
+    hot = select(*(getattr(StockMovement, c) for c in cols)).where(
+        StockMovement.user_id == user_id,
+        StockMovement.type != OPENING,
+    )
+    if product_id is not None:
+        archived = archived.where(StockMovementArchive.product_id == product_id)
+        hot = hot.where(StockMovement.product_id == product_id)
+    return union_all(archived, hot).subquery("mv")
+
+
+def movement_source(session: Session, user_id: int, since: datetime | None, product_id: int | None = None):
+    """
+    Tabela a consultar para movimentações a partir de `since` (None = desde
+    sempre): a quente basta enquanto não cruzar um período encerrado.
+    """
+    boundary = closed_before(session, user_id)
+    if boundary is not None and (since is None or since < boundary):
+        return movement_history(user_id, product_id)
+    return StockMovement.__table__
+
+
+def seal_period(session: Session, user_id: int, before: datetime) -> StockPeriod:
+    """
+    Encerra o período: move as movimentações anteriores a `before` para o
+    arquivo e deixa uma linha OPENING por produto com o saldo no corte, de
+    modo que saldo e extrato continuem batendo só com a tabela quente.
+
+    O StockPeriod entra primeiro (daí em diante create_movement recusa datas
+    anteriores) e o resto vai em lotes de SEAL_BATCH, um por transação: cada
+    lote arquiva, apaga e soma na OPENING exatamente os mesmos ids. Se cair no
+    meio, chamar de novo com o mesmo `before` termina o serviço.
+    """
+    opening_at = before - timedelta(microseconds=1)
+    # inclui as OPENING anteriores (o saldo é cumulativo), não a deste encerramento
+    old = (
+        (StockMovement.user_id == user_id)
+        & (StockMovement.created_at < before)
+        & ((StockMovement.type != OPENING) | (StockMovement.created_at != opening_at))
+    )
+
+    lock_stock(session, user_id)
+    period = session.exec(
+        select(StockPeriod).where(StockPeriod.user_id == user_id).order_by(StockPeriod.closed_before.desc())
+    ).scalars().first()
+    if period is not None and before < period.closed_before:
+        raise ValueError(f"já encerrado até {period.closed_before.isoformat()}")
+    if period is not None and before == period.closed_before:
+        if session.exec(select(StockMovement.id).where(old).limit(1)).first() is None:
+            raise ValueError(f"já encerrado até {period.closed_before.isoformat()}")
+        # encerramento interrompido: continua de onde parou
+    else:
+        period = StockPeriod(user_id=user_id, closed_before=before)
+        session.add(period)
+    session.commit()
+
+    archived = 0
+    while True:
+        lock_stock(session, user_id)
+        batch = session.exec(
+            select(StockMovement.id, StockMovement.product_id, StockMovement.type, StockMovement.quantity)
+            .where(old)
+            .order_by(StockMovement.id)
+            .limit(SEAL_BATCH)
+        ).all()
+        if not batch:
+            break
+        ids = [r.id for r in batch]
+        deltas: dict[int, float] = {}
+        for r in batch:
+            deltas[r.product_id] = deltas.get(r.product_id, 0.0) + signed(r.type, r.quantity)
+
+        archived += session.exec(
+            insert(StockMovementArchive).from_select(
+                ["id", "user_id", "product_id", "type", "quantity", "note", "created_at", "archived_at"],
+                select(
+                    StockMovement.id,
+                    StockMovement.user_id,
+                    StockMovement.product_id,
+                    StockMovement.type,
+                    StockMovement.quantity,
+                    StockMovement.note,
+                    StockMovement.created_at,
+                    literal(datetime.utcnow()),
+                ).where(StockMovement.id.in_(ids), StockMovement.type != OPENING),
+            )
+        ).rowcount or 0
+        session.exec(delete(StockMovement).where(StockMovement.id.in_(ids)))
+        _carry(session, user_id, opening_at, deltas)
+        session.commit()
+
+    # último passo sob o lock: nada mais entra antes de `before`
+    lock_stock(session, user_id)
+    opening = (
+        (StockMovement.user_id == user_id)
+        & (StockMovement.type == OPENING)
+        & (StockMovement.created_at == opening_at)
+    )
+    session.exec(delete(StockMovement).where(opening, StockMovement.quantity == 0))
+    period.movements_archived += archived
+    period.products_carried = session.exec(select(func.count()).select_from(StockMovement).where(opening)).one()[0]
+    session.add(period)
+    session.commit()
+    session.refresh(period)
+    return period
+
+
+def _carry(session: Session, user_id: int, opening_at: datetime, deltas: dict[int, float]) -> None:
+    # logo antes do corte: extrato a partir de `before` já começa com a OPENING
+    table = StockMovement.__table__
+    for product_id, delta in sorted(deltas.items()):
+        if session.exec(
+            update(table)
+            .where(table.c.user_id == user_id, table.c.product_id == product_id,
+                   table.c.type == OPENING, table.c.created_at == opening_at)
+            .values(quantity=table.c.quantity + delta)
+        ).rowcount:
+            continue
+        session.exec(insert(table).values(
+            user_id=user_id, product_id=product_id, type=OPENING, quantity=delta,
+            note="saldo de abertura", created_at=opening_at,
+        ))
+
+
+# =========================
+# PONTO DE PEDIDO
+# =========================
+def _restocked(balance: float, reorder_min: float, reorder_max: float | None) -> bool:
+    # histerese: com reorder_max o alerta só fecha depois de repor até ele
+    return balance >= reorder_max if reorder_max is not None else balance > reorder_min
+
+
+def _evaluate(session: Session, user_id: int, product_id: int, rp_id: int,
+              balance: float, reorder_min: float, reorder_max: float | None, low: bool) -> str | None:
+    """Abre/fecha o alerta quando o saldo cruza os limites: "open", "resolved" ou None."""
+    table = ReorderPoint.__table__
+    if not low and balance <= reorder_min:
+        session.exec(update(table).where(table.c.id == rp_id).values(low=True))
+        session.add(StockAlert(
+            user_id=user_id, product_id=product_id,
+            balance=balance, reorder_min=reorder_min, reorder_max=reorder_max,
+        ))
+        return "open"
+    if low and _restocked(balance, reorder_min, reorder_max):
+        session.exec(update(table).where(table.c.id == rp_id).values(low=False))
+        alerts = StockAlert.__table__
+        session.exec(
+            update(alerts)
+            .where(alerts.c.user_id == user_id, alerts.c.product_id == product_id, alerts.c.resolved_at.is_(None))
+            .values(resolved_at=datetime.utcnow(), resolved_balance=balance)
+        )
+        return "resolved"
+    return None
+
+
+def apply_reorder(session: Session, user_id: int, product_id: int, delta: float) -> str | None:
+    """
+    Soma a movimentação ao saldo do ponto de pedido do produto (se houver) e
+    avalia o alerta, na mesma transação da movimentação (não faz commit).
+    """
+    table = ReorderPoint.__table__
+    row = session.exec(
+        update(table)
+        .where(table.c.user_id == user_id, table.c.product_id == product_id)
+        .values(balance=table.c.balance + delta, updated_at=datetime.utcnow())
+        .returning(table.c.id, table.c.balance, table.c.reorder_min, table.c.reorder_max, table.c.low)
+    ).first()
+    if row is None:
+        return None
+    return _evaluate(session, user_id, product_id, *row)
+
+
+def set_reorder_point(session: Session, user_id: int, product_id: int,
+                      reorder_min: float, reorder_max: float | None) -> tuple[ReorderPoint, str | None]:
+    """Cria/altera o ponto de pedido; o saldo é recalculado do histórico (não faz commit)."""
+    # o lock que create_movement pega antes de apply_reorder: nenhuma
+    # movimentação confirma entre a soma abaixo e a gravação do saldo
+    lock_stock(session, user_id)
+    rp = session.exec(
+        select(ReorderPoint)
+        .where(ReorderPoint.user_id == user_id, ReorderPoint.product_id == product_id)
+        .with_for_update()
+    ).scalars().first()
+    if rp is None:
+        rp = ReorderPoint(user_id=user_id, product_id=product_id, reorder_min=reorder_min)
+    rp.reorder_min = reorder_min
+    rp.reorder_max = reorder_max
+    rp.balance = product_balance(session, user_id, product_id)
+    rp.updated_at = datetime.utcnow()
+    session.add(rp)
+    session.flush()
+    change = _evaluate(session, user_id, product_id, rp.id, rp.balance, rp.reorder_min, rp.reorder_max, rp.low)
+    return rp, change
+
+
+def drop_reorder_point(session: Session, user_id: int, product_id: int) -> bool:
+    """Remove o ponto de pedido e fecha o alerta aberto (não faz commit)."""
+    table, alerts = ReorderPoint.__table__, StockAlert.__table__
+    removed = session.exec(
+        delete(table).where(table.c.user_id == user_id, table.c.product_id == product_id)
+    ).rowcount
+    session.exec(
+        update(alerts)
+        .where(alerts.c.user_id == user_id, alerts.c.product_id == product_id, alerts.c.resolved_at.is_(None))
+        .values(resolved_at=datetime.utcnow())
+    )
+    return bool(removed)
@@ -1,16 +1,34 @@
 from __future__ import annotations
-from datetime import date, datetime, time, timedelta
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Literal
 
 from fastapi import APIRouter, Depends, HTTPException
 from sqlmodel import SQLModel, Session, select
-from sqlalchemy import func, case
+from sqlalchemy import func
 
-from .db import get_session
-from .auth import get_current_user
-from .models import Product, StockMovement, User
+from .auth import get_current_reader, get_current_user, get_read_session, get_tenant_session
+from .cache import invalidate, tenant_cache
+from .events import broker
+from .fields import parse_fields, rows, select_fields, sparse_response
+from .models import Category, Product, ReorderPoint, StockAlert, StockMovement, StockPeriod, User
+from .stock import (
+    OPENING,
+    apply_reorder,
+    closed_before,
+    drop_reorder_point,
+    lock_stock,
+    movement_source,
+    product_balance,
+    seal_period,
+    set_reorder_point,
+    signed,
+    signed_quantity,
+)
 
 router = APIRouter()
 
+stock_cache = tenant_cache("stock")
+
 
 class StockBalance(SQLModel):
     product_id: int
@@ -29,6 +47,41 @@ class StockStatementLine(SQLModel):
     balance_after: float
 
 
+class CategoryValuation(SQLModel):
+    category_id: int
+    name: str
+    value: float
+
+
+class StockValuation(SQLModel):
+    as_of: date | None = None
+    total_value: float
+    categories: list[CategoryValuation]
+
+
+class StockPeriodIn(SQLModel):
+    before: date
+
+
+class ReorderPointIn(SQLModel):
+    reorder_min: float
+    reorder_max: float | None = None
+
+
+class StockAlertOut(SQLModel):
+    id: int
+    product_id: int
+    sku: str
+    name: str
+    kind: str
+    balance: float
+    reorder_min: float
+    reorder_max: float | None = None
+    opened_at: datetime
+    resolved_at: datetime | None = None
+    resolved_balance: float | None = None
+
+
 class StockStatement(SQLModel):
     product_id: int
     from_date: date | None = None
@@ -41,29 +94,67 @@ class StockStatement(SQLModel):
 @router.post("/stock/movements", response_model=StockMovement)
 def create_movement(
     mv: StockMovement,
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_tenant_session),
     user: User = Depends(get_current_user),
 ):
     if mv.quantity <= 0:
         raise HTTPException(status_code=400, detail="quantity must be > 0")
+    if mv.type == OPENING:
+        raise HTTPException(status_code=400, detail="OPENING is reserved for closed periods")
 
     # valida produto do usuário
     p = session.get(Product, mv.product_id)
     if not p or p.user_id != user.id:
         raise HTTPException(status_code=400, detail="product inválido")
 
+    # modelo de tabela não valida o corpo: created_at chega como texto
+    if isinstance(mv.created_at, str):
+        try:
+            mv.created_at = datetime.fromisoformat(mv.created_at)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="invalid created_at")
+    if mv.created_at.tzinfo is not None:
+        # banco guarda UTC sem fuso (datetime.utcnow): com fuso, a comparação abaixo estoura
+        mv.created_at = mv.created_at.astimezone(timezone.utc).replace(tzinfo=None)
+
+    # em fila com seal_period: encerramento em andamento já vale aqui
+    lock_stock(session, user.id)
+    boundary = closed_before(session, user.id)
+    if boundary is not None and mv.created_at < boundary:
+        raise HTTPException(status_code=409, detail=f"period closed before {boundary.isoformat()}")
+
     mv.user_id = user.id
     session.add(mv)
+    # ponto de pedido: só o saldo deste produto, somado na mesma transação
+    alert = apply_reorder(session, user.id, mv.product_id, signed(mv.type, mv.quantity))
     session.commit()
     session.refresh(mv)
+    invalidate("stock", user_id=user.id)
+    if alert:
+        broker.publish(user.id, "stock.alert", {"product_id": mv.product_id, "status": alert})
+
+    # SSE: só calcula o saldo se houver tela aberta ouvindo
+    if broker.has_subscribers(user.id):
+        broker.publish(user.id, "stock.balance", {
+            "product_id": mv.product_id,
+            "balance": product_balance(session, user.id, mv.product_id),
+        })
     return mv
 
 
 @router.get("/stock/movements", response_model=list[StockMovement])
 def list_movements(
-    session: Session = Depends(get_session),
-    user: User = Depends(get_current_user),
+    fields: str | None = None,
+    session: Session = Depends(get_read_session),
+    user: User = Depends(get_current_reader),
 ):
+    names = parse_fields(StockMovement, fields)
+    if names is not None:
+        return sparse_response(rows(session, (
+            select_fields(StockMovement, names)
+            .where(StockMovement.user_id == user.id)
+            .order_by(StockMovement.id.desc())
+        )))
     return session.exec(
         select(StockMovement)
         .where(StockMovement.user_id == user.id)
@@ -73,14 +164,11 @@ def list_movements(
 
 @router.get("/stock/balance", response_model=list[StockBalance])
 def stock_balance(
-    session: Session = Depends(get_session),
-    user: User = Depends(get_current_user),
+    session: Session = Depends(get_read_session),
+    user: User = Depends(get_current_reader),
 ):
-    signed_qty = case(
-        (StockMovement.type.in_(["IN", "ADJUST"]), StockMovement.quantity),
-        (StockMovement.type == "OUT", -StockMovement.quantity),
-        else_=0,
-    )
+    # períodos encerrados já estão resumidos nas linhas OPENING
+    signed_qty = signed_quantity(StockMovement)
 
     stmt = (
         select(
@@ -98,8 +186,9 @@ def stock_balance(
         .order_by(Product.id)
     )
 
-    rows = session.exec(stmt).all()
-    return [StockBalance(**dict(r._mapping)) for r in rows]
+    return stock_cache.get_or_load(session, user.id, "balance", lambda: [
+        StockBalance(**dict(r._mapping)) for r in session.exec(stmt).all()
+    ])
 
 
 @router.get("/stock/statement", response_model=StockStatement)
@@ -107,8 +196,8 @@ def stock_statement(
     product_id: int,
     from_date: date | None = None,
     to_date: date | None = None,
-    session: Session = Depends(get_session),
-    user: User = Depends(get_current_user),
+    session: Session = Depends(get_read_session),
+    user: User = Depends(get_current_reader),
 ):
     product = session.get(Product, product_id)
     if not product or product.user_id != user.id:
@@ -117,53 +206,45 @@ def stock_statement(
     start_dt = datetime.combine(from_date, time.min) if from_date else None
     end_dt = datetime.combine(to_date + timedelta(days=1), time.min) if to_date else None
 
-    signed_qty_expr = case(
-        (StockMovement.type.in_(["IN", "ADJUST"]), StockMovement.quantity),
-        (StockMovement.type == "OUT", -StockMovement.quantity),
-        else_=0,
-    )
+    # cruzando um período encerrado, lê arquivo + tabela quente
+    cols = movement_source(session, user.id, start_dt, product_id).c
 
-    stmt_start = select(func.coalesce(func.sum(signed_qty_expr), 0)).where(
-        StockMovement.product_id == product_id,
-        StockMovement.user_id == user.id,
-    )
+    # sem from_date o extrato começa do zero (todas as linhas entram abaixo)
+    starting_balance = 0.0
     if start_dt:
-        stmt_start = stmt_start.where(StockMovement.created_at < start_dt)
-
-    starting_balance = float(session.exec(stmt_start).one())
+        stmt_start = select(func.coalesce(func.sum(signed_quantity(cols)), 0)).where(
+            cols.product_id == product_id,
+            cols.user_id == user.id,
+            cols.created_at < start_dt,
+        )
+        starting_balance = float(session.exec(stmt_start).one())
 
-    stmt = select(StockMovement).where(
-        StockMovement.product_id == product_id,
-        StockMovement.user_id == user.id,
+    stmt = select(*cols).where(
+        cols.product_id == product_id,
+        cols.user_id == user.id,
     )
     if start_dt:
-        stmt = stmt.where(StockMovement.created_at >= start_dt)
+        stmt = stmt.where(cols.created_at >= start_dt)
     if end_dt:
-        stmt = stmt.where(StockMovement.created_at < end_dt)
+        stmt = stmt.where(cols.created_at < end_dt)
 
-    stmt = stmt.order_by(StockMovement.created_at.asc(), StockMovement.id.asc())
+    stmt = stmt.order_by(cols.created_at.asc(), cols.id.asc())
     movements = session.exec(stmt).all()
 
     balance = starting_balance
     lines: list[StockStatementLine] = []
 
     for mv in movements:
-        if mv.type in ("IN", "ADJUST"):
-            signed = float(mv.quantity)
-        elif mv.type == "OUT":
-            signed = -float(mv.quantity)
-        else:
-            signed = 0.0
-
-        balance += signed
+        qty = signed(mv.type, mv.quantity)
+        balance += qty
         lines.append(
             StockStatementLine(
                 id=mv.id,
                 created_at=mv.created_at,
                 type=mv.type,
                 quantity=float(mv.quantity),
-                signed_quantity=signed,
-                note=getattr(mv, "note", None),
+                signed_quantity=qty,
+                note=mv.note,
                 balance_after=balance,
             )
         )
@@ -176,3 +257,151 @@ def stock_statement(
         ending_balance=balance,
         lines=lines,
     )
+
+
+@router.get("/stock/valuation", response_model=StockValuation)
+def stock_valuation(
+    as_of: date | None = None,
+    session: Session = Depends(get_read_session),
+    user: User = Depends(get_current_reader),
+):
+    # saldo (até o fim de as_of) x preço atual do produto, somado por categoria
+    def load():
+        end_dt = datetime.combine(as_of + timedelta(days=1), time.min) if as_of else None
+        # depois do último corte, as linhas OPENING da tabela quente bastam
+        src = movement_source(session, user.id, end_dt) if end_dt else StockMovement.__table__
+        cols = src.c
+
+        on = (cols.product_id == Product.id) & (cols.user_id == user.id)
+        if end_dt:
+            on &= cols.created_at < end_dt
+        stmt = (
+            select(
+                Category.id,
+                Category.name,
+                func.coalesce(func.sum(signed_quantity(cols) * Product.price), 0),
+            )
+            .select_from(Category)
+            .outerjoin(Product, (Product.category_id == Category.id) & (Product.user_id == user.id))
+            .outerjoin(src, on)
+            .where(Category.user_id == user.id)
+            .group_by(Category.id, Category.name)
+            .order_by(Category.name)
+        )
+        categories = [
+            CategoryValuation(category_id=r[0], name=r[1], value=round(float(r[2]), 2))
+            for r in session.exec(stmt).all()
+        ]
+        return StockValuation(
+            as_of=as_of,
+            total_value=round(sum(c.value for c in categories), 2),
+            categories=categories,
+        )
+
+    # invalidado por movimentação, encerramento de período e mudança de produto/categoria
+    return stock_cache.get_or_load(session, user.id, ("valuation", as_of), load)
+
+
+@router.post("/stock/periods", response_model=StockPeriod)
+def close_period(
+    data: StockPeriodIn,
+    session: Session = Depends(get_tenant_session),
+    user: User = Depends(get_current_user),
+):
+    before = datetime.combine(data.before, time.min)
+    if before > datetime.utcnow():
+        raise HTTPException(status_code=400, detail="cannot close a period in the future")
+    try:
+        period = seal_period(session, user.id, before)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    invalidate("stock", user_id=user.id)
+    return period
+
+
+@router.get("/stock/periods", response_model=list[StockPeriod])
+def list_periods(
+    session: Session = Depends(get_read_session),
+    user: User = Depends(get_current_reader),
+):
+    return session.exec(
+        select(StockPeriod)
+        .where(StockPeriod.user_id == user.id)
+        .order_by(StockPeriod.closed_before.desc())
+    ).all()
+
+
+# ---------- Ponto de pedido / alertas ----------
+def _reorder_product(session: Session, user: User, product_id: int) -> Product:
+    product = session.get(Product, product_id)
+    if not product or product.user_id != user.id:
+        raise HTTPException(status_code=404, detail="product not found")
+    return product
+
+
+@router.put("/stock/reorder-points/{product_id}", response_model=ReorderPoint)
+def put_reorder_point(
+    product_id: int,
+    data: ReorderPointIn,
+    session: Session = Depends(get_tenant_session),
+    user: User = Depends(get_current_user),
+):
+    if data.reorder_min < 0:
+        raise HTTPException(status_code=400, detail="reorder_min must be >= 0")
+    if data.reorder_max is not None and data.reorder_max <= data.reorder_min:
+        raise HTTPException(status_code=400, detail="reorder_max must be > reorder_min")
+    _reorder_product(session, user, product_id)
+
+    rp, alert = set_reorder_point(session, user.id, product_id, data.reorder_min, data.reorder_max)
+    session.commit()
+    session.refresh(rp)
+    if alert:
+        broker.publish(user.id, "stock.alert", {"product_id": product_id, "status": alert})
+    return rp
+
+
+@router.delete("/stock/reorder-points/{product_id}")
+def delete_reorder_point(
+    product_id: int,
+    session: Session = Depends(get_tenant_session),
+    user: User = Depends(get_current_user),
+):
+    if not drop_reorder_point(session, user.id, product_id):
+        raise HTTPException(status_code=404, detail="reorder point not found")
+    session.commit()
+    return {"ok": True}
+
+
+@router.get("/stock/reorder-points", response_model=list[ReorderPoint])
+def list_reorder_points(
+    session: Session = Depends(get_read_session),
+    user: User = Depends(get_current_reader),
+):
+    return session.exec(
+        select(ReorderPoint)
+        .where(ReorderPoint.user_id == user.id)
+        .order_by(ReorderPoint.product_id)
+    ).all()
+
+
+@router.get("/stock/alerts", response_model=list[StockAlertOut])
+def list_alerts(
+    status: Literal["open", "resolved", "all"] = "open",
+    session: Session = Depends(get_read_session),
+    user: User = Depends(get_current_reader),
+):
+    # abertos: índice parcial ux_stockalert_open; demais: (user_id, id)
+    stmt = (
+        select(StockAlert, Product.sku, Product.name)
+        .join(Product, Product.id == StockAlert.product_id)
+        .where(StockAlert.user_id == user.id)
+        .order_by(StockAlert.id.desc())
+    )
+    if status == "open":
+        stmt = stmt.where(StockAlert.resolved_at.is_(None))
+    elif status == "resolved":
+        stmt = stmt.where(StockAlert.resolved_at.is_not(None))
+    return [
+        StockAlertOut(**a.model_dump(exclude={"user_id"}), sku=sku, name=name)
+        for a, sku, name in session.exec(stmt).all()
+    ]
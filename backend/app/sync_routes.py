@@ -0,0 +1,83 @@
+from fastapi import APIRouter, Depends
+from sqlmodel import Session, select
+
+from .auth import get_current_reader, get_read_session
+from .catalog import catalog_window
+from .models import CatalogChange, Category, Product, User
+
+router = APIRouter()
+
+
+def _category_row(c: Category) -> dict:
+    return {
+        "id": c.id,
+        "name": c.name,
+        "auto_discount_enabled": c.auto_discount_enabled,
+        "default_discount_percent": c.default_discount_percent,
+        "updated_at": c.updated_at,
+    }
+
+
+def _product_row(p: Product) -> dict:
+    return {
+        "id": p.id,
+        "sku": p.sku,
+        "name": p.name,
+        "unit": p.unit,
+        "price": p.price,
+        "pack_factor": p.pack_factor,
+        "category_id": p.category_id,
+        "updated_at": p.updated_at,
+    }
+
+
+@router.get("/sync/catalog")
+def sync_catalog(
+    since: int = 0,
+    session: Session = Depends(get_read_session),
+    user: User = Depends(get_current_reader),
+):
+    """
+    Catálogo incremental: devolve o que mudou depois de `since` (o `cursor`
+    da resposta anterior) e os ids apagados. `full=true` quando o cliente
+    precisa descartar o cache e usar só esta resposta.
+    """
+    # cursor antes das linhas: o que for gravado entre as duas leituras volta
+    # de novo no próximo sync, nunca se perde
+    oldest, cursor = catalog_window(session, user.id)
+
+    # since < oldest - 1: o trecho do log que o cliente precisava já foi apagado
+    full = since <= 0 or since > cursor or since < oldest - 1
+    if not full:
+        full = session.exec(
+            select(CatalogChange.id)
+            .where(CatalogChange.user_id == user.id)
+            .where(CatalogChange.seq > since)
+            .where(CatalogChange.op == "reset")
+            .limit(1)
+        ).first() is not None
+
+    cats = select(Category).where(Category.user_id == user.id)
+    prods = select(Product).where(Product.user_id == user.id)
+    deleted = {"categories": [], "products": []}
+    if not full:
+        cats = cats.where(Category.change_seq > since)
+        prods = prods.where(Product.change_seq > since)
+        for entity, entity_id in session.exec(
+            select(CatalogChange.entity, CatalogChange.entity_id)
+            .where(CatalogChange.user_id == user.id)
+            .where(CatalogChange.seq > since)
+            .where(CatalogChange.op == "delete")
+        ).all():
+            if entity == "category":
+                deleted["categories"].append(entity_id)
+            elif entity == "product":
+                deleted["products"].append(entity_id)
+
+    return {
+        "cursor": cursor,
+        "full": full,
+        "categories": [_category_row(c) for c in session.exec(cats.order_by(Category.id)).all()],
+        "products": [_product_row(p) for p in session.exec(prods.order_by(Product.id)).all()],
+        "deleted": deleted,
+    }
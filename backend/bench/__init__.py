@@ -0,0 +1,8 @@
+"""
+Benchmark do GenericERP: semeia tenants sintéticos, dirige todas as rotas
+pelo app ASGI e grava throughput + p50/p95/p99 em JSON.
+
+    cd backend
+    python -m bench run --movements 1000000 --out results.json
+    python -m bench compare base.json results.json
+"""
@@ -0,0 +1,363 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from dataclasses import asdict
+from datetime import date, datetime
+from pathlib import Path
+
+DEFAULT_DB = "sqlite:///./bench.db"
+SIZE_FIELDS = ("categories", "products", "movements", "quotes", "quote_items", "days")
+
+
+def _log(msg: str) -> None:
+    print(msg, file=sys.stderr, flush=True)
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _sqlite_path(url: str) -> str | None:
+    return url[len("sqlite:///"):] if url.startswith("sqlite:///") else None
+
+
+def _mirror_replica(primary: str, replica: str) -> None:
+    # réplica "de mentira" para SQLite: cópia do arquivo já semeado
+    src, dst = _sqlite_path(primary), _sqlite_path(replica)
+    if src is None or dst is None:
+        return  # Postgres: a replicação é do próprio servidor
+    import shutil
+    from app.db import engine
+
+    engine.dispose()
+    shutil.copyfile(src, dst)
+
+
+def _reset_database(url: str) -> None:
+    # banco descartável: apaga tudo antes de semear
+    path = _sqlite_path(url)
+    if path is not None:
+        for suffix in ("", "-wal", "-shm", "-journal"):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path + suffix)
+        return
+
+    from sqlmodel import SQLModel
+    from app.db import engine
+
+    SQLModel.metadata.drop_all(engine)
+
+
+async def _prepare(args):
+    from app.auth import create_access_token
+    from app.db import engine
+    from app.main import app
+    from app.migrations import migrate
+    from app.seed import SeedConfig, seed_database
+
+    from .asgi import ASGIClient
+    from .scenarios import Context
+    from .tenants import BENCH_DOMAIN, BENCH_PASSWORD, load_tenants
+
+    cfg = SeedConfig(
+        tenants=args.tenants,
+        categories=args.categories,
+        products=args.products,
+        movements=args.movements,
+        quotes=args.quotes,
+        quote_items=args.quote_items,
+        until=date.today(),
+        seed=args.seed,
+        email_domain=BENCH_DOMAIN,
+        password=BENCH_PASSWORD,
+    )
+
+    # primeiro boot: num banco novo inclui aplicar todas as migrações
+    client = ASGIClient(app)
+    t0 = time.perf_counter()
+    await client.startup()
+    first_start = time.perf_counter() - t0
+    migrate(engine, online=True)
+
+    seed_seconds = None
+    if not args.reuse:
+        _log(f"semeando {args.tenants} tenant(s)...")
+        t0 = time.perf_counter()
+        seed_database(engine, cfg, log=lambda m: _log(f"  {m}"))
+        seed_seconds = round(time.perf_counter() - t0, 3)
+
+    tenants = load_tenants(engine)
+    if not tenants:
+        raise SystemExit("nenhum tenant de benchmark encontrado no banco")
+    if args.replica:
+        _mirror_replica(args.db, args.replica)
+
+    # reinício com o schema em dia: pool novo + checagem de versão
+    await client.shutdown()
+    engine.dispose()
+    client = ASGIClient(app)
+    t0 = time.perf_counter()
+    await client.startup()
+    restart = time.perf_counter() - t0
+
+    ctx = Context(
+        client=client,
+        tenants=tenants,
+        tokens={t.user_id: create_access_token(t.user_id) for t in tenants},
+    )
+    info = {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "database": engine.dialect.name,
+            "tenants": len(tenants),
+            "size": None if args.reuse else {
+                k: v for k, v in asdict(cfg).items() if k in SIZE_FIELDS
+            },
+            "seed": args.seed,
+            "replica": bool(args.replica),
+        },
+        "seed_seconds": seed_seconds,
+        "startup": {
+            "fresh_db": not args.reuse,
+            "first_ms": round(first_start * 1000.0, 3),
+            "restart_ms": round(restart * 1000.0, 3),
+        },
+    }
+    return ctx, info
+
+
+def _selected(args):
+    from .scenarios import SCENARIOS
+
+    return [
+        sc for sc in SCENARIOS
+        if not args.only or any(o.lower() in sc.name.lower() for o in args.only)
+    ]
+
+
+async def _run(args) -> dict:
+    from app import slowlog
+
+    from .runner import run_scenario
+
+    ctx, info = await _prepare(args)
+    # o que a semeadura deixou no log de consultas lentas não interessa
+    slowlog.reset()
+    info["meta"].update(iterations=args.iterations, warmup=args.warmup, concurrency=args.concurrency)
+
+    routes = {}
+    for sc in _selected(args):
+        _log(f"  {sc.name}")
+        # e-mails de DEV vão pro stdout; não deixa misturar com o JSON
+        with contextlib.redirect_stdout(io.StringIO()):
+            routes[sc.name] = await run_scenario(
+                ctx, sc,
+                iterations=args.iterations,
+                warmup=args.warmup,
+                concurrency=args.concurrency,
+            )
+
+    await ctx.client.shutdown()
+    info["routes"] = routes
+    info["slow_queries"] = [
+        {k: q[k] for k in ("fingerprint", "sql", "count", "mean_ms", "max_ms", "routes", "plan")}
+        for q in slowlog.report(limit=10)["queries"]
+    ]
+    return info
+
+
+async def _explain(args) -> dict:
+    from app.db import engine, replica_engines
+
+    from .explain import capture_selects, explain, full_scans
+
+    ctx, info = await _prepare(args)
+
+    with capture_selects(engine, *replica_engines) as log, contextlib.redirect_stdout(io.StringIO()):
+        for sc in _selected(args):
+            call = await sc.build(ctx, 0)
+            log.route = sc.name
+            await ctx.client.request(
+                call.method, call.path, json_body=call.json_body, params=call.params, token=call.token,
+            )
+            log.route = None
+
+    await ctx.client.shutdown()
+
+    routes: dict[str, list] = {}
+    seen = set()
+    for route, statement, params in log.statements:
+        if (route, statement) in seen:
+            continue
+        seen.add((route, statement))
+        plan = explain(engine, statement, params)
+        routes.setdefault(route, []).append({
+            "sql": " ".join(statement.split()),
+            "plan": plan,
+            "full_scans": full_scans(engine.dialect.name, plan),
+        })
+
+    info["routes"] = routes
+    return info
+
+
+def _environ(args) -> None:
+    os.environ["DATABASE_URL"] = args.db
+    os.environ["DEV_RETURN_RESET_CODE"] = "true"
+    # manutenção em segundo plano distorce a medição
+    os.environ["SCHEDULER_ENABLED"] = "false"
+    if args.replica:
+        os.environ["READ_REPLICA_URLS"] = args.replica
+
+
+def cmd_run(args) -> int:
+    _environ(args)
+
+    if not args.reuse:
+        _reset_database(args.db)
+
+    result = asyncio.run(_run(args))
+    text = json.dumps(result, indent=2, ensure_ascii=False)
+    if args.out:
+        Path(args.out).write_text(text + "\n", encoding="utf-8")
+        _log(f"resultado gravado em {args.out}")
+    else:
+        print(text)
+    return 0
+
+
+def cmd_explain(args) -> int:
+    _environ(args)
+
+    if not args.reuse:
+        _reset_database(args.db)
+
+    result = asyncio.run(_explain(args))
+    if args.out:
+        Path(args.out).write_text(json.dumps(result, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+
+    failures = 0
+    for route, queries in result["routes"].items():
+        for q in queries:
+            if q["full_scans"]:
+                failures += 1
+                print(f"FULL SCAN [{route}] {', '.join(q['full_scans'])}: {q['sql'][:160]}")
+                for line in q["plan"]:
+                    print(f"    {line}")
+    total = sum(len(q) for q in result["routes"].values())
+    print(f"{total} consulta(s) em {len(result['routes'])} rota(s); {failures} com leitura completa")
+    return 1 if failures else 0
+
+
+def cmd_compare(args) -> int:
+    base = json.loads(Path(args.base).read_text(encoding="utf-8"))
+    head = json.loads(Path(args.head).read_text(encoding="utf-8"))
+
+    regressions = 0
+    print(f"{'rota':45} {'p95 base':>10} {'p95 head':>10} {'delta':>8} {'rps base':>10} {'rps head':>10}")
+    for name, h in head["routes"].items():
+        b = base["routes"].get(name)
+        if not b:
+            print(f"{name:45} {'-':>10} {h['p95_ms']:>10.2f} {'novo':>8}")
+            continue
+        delta = (h["p95_ms"] - b["p95_ms"]) / b["p95_ms"] * 100.0 if b["p95_ms"] else 0.0
+        flag = ""
+        if delta > args.threshold:
+            regressions += 1
+            flag = "  <-- regressão"
+        print(
+            f"{name:45} {b['p95_ms']:>10.2f} {h['p95_ms']:>10.2f} {delta:>+7.1f}% "
+            f"{b['throughput_rps']:>10.1f} {h['throughput_rps']:>10.1f}{flag}"
+        )
+    return 1 if regressions else 0
+
+
+def cmd_check(args) -> int:
+    import tempfile
+
+    from .checks import CHECKS, run_checks
+
+    names = args.names or list(CHECKS)
+    unknown = [n for n in names if n not in CHECKS]
+    if unknown:
+        _log(f"checagem desconhecida: {', '.join(unknown)} (há: {', '.join(CHECKS)})")
+        return 2
+    with tempfile.TemporaryDirectory(prefix="genericerp-check-") as tmp:
+        # o app lê o ambiente no import: bancos da checagem "replicas"
+        replicas = Path(tmp) / "replicas"
+        os.environ["DATABASE_URL"] = f"sqlite:///{replicas / 'primary.db'}"
+        os.environ["READ_REPLICA_URLS"] = f"sqlite:///{replicas / 'replica.db'}"
+        os.environ["READ_YOUR_WRITES_SECONDS"] = "0.5"
+        os.environ["SCHEDULER_ENABLED"] = "false"
+        os.environ.pop("SHARDS", None)
+        results = run_checks(names, Path(tmp))
+    for name, error in results.items():
+        print(f"{'ok  ' if error is None else 'FAIL'} {name}" + (f": {error}" if error else ""))
+    return 1 if any(results.values()) else 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m bench")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    def dataset_args(p):
+        p.add_argument("--db", default=DEFAULT_DB, help=f"URL do banco descartável (default: {DEFAULT_DB})")
+        p.add_argument("--reuse", action="store_true", help="não recria o banco; usa os tenants já semeados")
+        p.add_argument(
+            "--replica",
+            help="URL da réplica de leitura (SQLite: recebe uma cópia do banco semeado)",
+        )
+        p.add_argument("--tenants", type=int, default=2)
+        p.add_argument("--categories", type=int, default=20)
+        p.add_argument("--products", type=int, default=1_000)
+        p.add_argument("--movements", type=int, default=200_000, help="movimentações por tenant")
+        p.add_argument("--quotes", type=int, default=50)
+        p.add_argument("--quote-items", type=int, default=200, help="média de itens por orçamento")
+        p.add_argument("--seed", type=int, default=1)
+        p.add_argument("--only", action="append", help="filtra rotas por trecho do nome (repetível)")
+
+    run = sub.add_parser("run", help="semeia tenants e mede todas as rotas")
+    dataset_args(run)
+    run.add_argument("--iterations", type=int, default=50, help="requisições medidas por rota")
+    run.add_argument("--warmup", type=int, default=3)
+    run.add_argument("--concurrency", type=int, default=1)
+    run.add_argument("--out", help="arquivo JSON de saída (default: stdout)")
+    run.set_defaults(func=cmd_run)
+
+    exp = sub.add_parser("explain", help="captura o EXPLAIN das consultas de cada rota; falha se houver leitura completa")
+    dataset_args(exp)
+    exp.add_argument("--out", help="grava os planos em JSON")
+    exp.set_defaults(func=cmd_explain)
+
+    cmp_ = sub.add_parser("compare", help="compara dois resultados (p95 e throughput)")
+    cmp_.add_argument("base")
+    cmp_.add_argument("head")
+    cmp_.add_argument("--threshold", type=float, default=10.0, help="%% de piora no p95 que conta como regressão")
+    cmp_.set_defaults(func=cmd_compare)
+
+    chk = sub.add_parser("check", help="checagens de comportamento (migrações, roteamento); exit 1 se alguma falhar")
+    chk.add_argument("names", nargs="*", help="default: todas")
+    chk.set_defaults(func=cmd_check)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
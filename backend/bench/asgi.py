@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from typing import Any
+from urllib.parse import urlencode
+
+
+class ASGIClient:
+    """
+    Cliente mínimo que fala ASGI direto com o app (sem rede, sem httpx).
+    Assim o benchmark mede só a aplicação + banco.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._lifespan_task: asyncio.Task | None = None
+        self._lifespan_in: asyncio.Queue | None = None
+        self._lifespan_out: asyncio.Queue | None = None
+
+    async def startup(self) -> None:
+        self._lifespan_in = asyncio.Queue()
+        self._lifespan_out = asyncio.Queue()
+        scope = {"type": "lifespan", "asgi": {"version": "3.0"}, "state": {}}
+        self._lifespan_task = asyncio.create_task(
+            self.app(scope, self._lifespan_in.get, self._lifespan_out.put)
+        )
+        await self._lifespan_in.put({"type": "lifespan.startup"})
+        msg = await self._lifespan_out.get()
+        if msg["type"] != "lifespan.startup.complete":
+            raise RuntimeError(f"startup falhou: {msg.get('message', msg)}")
+
+    async def shutdown(self) -> None:
+        if not self._lifespan_task:
+            return
+        await self._lifespan_in.put({"type": "lifespan.shutdown"})
+        await self._lifespan_out.get()
+        await self._lifespan_task
+        self._lifespan_task = None
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        *,
+        json_body: Any = None,
+        params: dict | None = None,
+        token: str | None = None,
+    ) -> tuple[int, Any]:
+        body = json.dumps(json_body).encode("utf-8") if json_body is not None else b""
+        headers = [(b"host", b"bench"), (b"content-length", str(len(body)).encode())]
+        if json_body is not None:
+            headers.append((b"content-type", b"application/json"))
+        if token:
+            headers.append((b"authorization", f"Bearer {token}".encode()))
+
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": method.upper(),
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": urlencode(params or {}).encode(),
+            "root_path": "",
+            "headers": headers,
+            "client": ("127.0.0.1", 0),
+            "server": ("bench", 80),
+            "state": {},
+        }
+
+        sent = False
+
+        async def receive():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return {"type": "http.disconnect"}
+
+        status = 0
+        chunks: list[bytes] = []
+
+        async def send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+        await self.app(scope, receive, send)
+
+        raw = b"".join(chunks)
+        try:
+            data = json.loads(raw) if raw else None
+        except ValueError:
+            data = raw
+        return status, data
@@ -0,0 +1,176 @@
+"""
+Checagens de comportamento que o benchmark não mede: cada uma monta os
+próprios bancos descartáveis em `workdir` e levanta AssertionError quando
+algo sai do esperado.
+
+    cd backend
+    python -m bench check              # todas
+    python -m bench check migrations
+
+A checagem "replicas" sobe o app: o `check` aponta DATABASE_URL e
+READ_REPLICA_URLS para arquivos em `workdir` antes de importar qualquer coisa.
+"""
+from __future__ import annotations
+
+import asyncio
+import shutil
+import time
+from pathlib import Path
+from typing import Callable
+
+from sqlalchemy import create_engine, inspect
+
+CHECKS: dict[str, Callable[[Path], None]] = {}
+
+
+def check(name: str):
+    def deco(fn: Callable[[Path], None]):
+        CHECKS[name] = fn
+        return fn
+    return deco
+
+
+def _legacy_database(url: str):
+    """Banco como o create_all antigo deixava: dados e nenhum índice da migração 2 nem schemaversion."""
+    from sqlmodel import SQLModel
+
+    from app.models import (
+        Category, PasswordReset, Product, Quote, QuoteDailySummary, QuoteItem, StockMovement, User,
+    )
+    from app.seed import SeedConfig, seed_database
+
+    eng = create_engine(url)
+    # o resumo diário só porque o seed o preenche; a migração 9 o cria com checkfirst
+    models = (User, PasswordReset, Category, Product, StockMovement, Quote, QuoteItem, QuoteDailySummary)
+    SQLModel.metadata.create_all(eng, tables=[m.__table__ for m in models])
+    seed_database(eng, SeedConfig(
+        tenants=1, categories=5, products=50, movements=2_000, quotes=5, quote_items=5, defer_indexes=False,
+    ))
+    with eng.begin() as conn:
+        for model in (Category, Product, StockMovement, Quote, QuoteItem):
+            for index in model.__table__.indexes:
+                index.drop(conn, checkfirst=True)
+    return eng
+
+
+def _indexes(eng, table: str) -> set[str]:
+    return {i["name"] for i in inspect(eng).get_indexes(table)}
+
+
+@check("migrations")
+def _migrations(workdir: Path) -> None:
+    from app.migrations import applied_versions, migrate
+
+    eng = _legacy_database(f"sqlite:///{workdir / 'legacy.db'}")
+
+    # boot: sem schemaversion, mas com dados — as online ficam para depois
+    migrate(eng)
+    applied = applied_versions(eng)
+    assert 1 in applied and 2 not in applied, f"boot aplicou {sorted(applied)}"
+    assert "ux_product_user_id_sku" not in _indexes(eng, "product"), "boot construiu índice online"
+
+    migrate(eng, online=True)
+    assert 2 in applied_versions(eng), "--online não registrou a migração 2"
+    assert "ux_product_user_id_sku" in _indexes(eng, "product")
+    assert "ix_stockmovement_user_product_created" in _indexes(eng, "stockmovement")
+
+
+@check("migrations-duplicates")
+def _migrations_duplicates(workdir: Path) -> None:
+    from sqlalchemy import delete, func, select
+
+    from app.migrations import MigrationError, applied_versions, migrate
+    from app.models import Product
+
+    eng = _legacy_database(f"sqlite:///{workdir / 'legacy.db'}")
+    with eng.begin() as conn:
+        # sem o índice único, o create_all antigo deixava passar SKU repetido
+        row = conn.execute(select(Product.__table__).limit(1)).mappings().one()
+        dup = conn.execute(Product.__table__.insert().values(
+            {k: v for k, v in row.items() if k != "id"}
+        ).returning(Product.id)).scalar_one()
+
+    try:
+        migrate(eng, online=True)
+    except MigrationError as e:
+        assert row["sku"] in str(e), f"mensagem sem o SKU repetido: {e}"
+    else:
+        raise AssertionError("migração 2 passou com SKU repetido")
+    assert 2 not in applied_versions(eng), "migração 2 registrada mesmo falhando"
+    assert "ux_product_user_id_sku" not in _indexes(eng, "product")
+
+    with eng.begin() as conn:
+        conn.execute(delete(Product).where(Product.id == dup))
+    migrate(eng, online=True)
+    assert 2 in applied_versions(eng), "migração 2 não aplicou depois de corrigir os dados"
+    with eng.connect() as conn:
+        n = conn.execute(select(func.count()).select_from(Product).where(Product.sku == row["sku"])).scalar()
+    assert n == 1
+
+
+@check("replicas")
+def _replicas(workdir: Path) -> None:
+    from app import db
+    from app.auth import create_access_token
+    from app.migrations import migrate
+    from app.models import Product
+    from app.seed import SeedConfig, seed_database
+
+    from .asgi import ASGIClient
+
+    assert db.replica_engines, "READ_REPLICA_URLS não configurado para a checagem"
+    migrate(db.engine)
+    seed_database(db.engine, SeedConfig(tenants=1, categories=2, products=5, movements=50, quotes=1, quote_items=1))
+    db.engine.dispose()
+    # réplica parada no tempo: o que for escrito depois só existe no primário
+    shutil.copyfile(workdir / "primary.db", workdir / "replica.db")
+
+    with db.engine.connect() as conn:
+        product = conn.execute(Product.__table__.select().limit(1)).mappings().one()
+    token = create_access_token(product["user_id"])
+
+    async def scenario() -> None:
+        from app.main import app
+
+        client = ASGIClient(app)
+        await client.startup()
+        try:
+            status, mv = await client.request("POST", "/stock/movements", token=token, json_body={
+                "product_id": product["id"], "type": "IN", "quantity": 1,
+            })
+            assert status == 200, f"POST /stock/movements: {status} {mv}"
+
+            status, listed = await client.request("GET", "/stock/movements", token=token)
+            assert status == 200
+            assert listed[0]["id"] == mv["id"], "GET logo depois da escrita não leu do primário"
+
+            await asyncio.sleep(db.READ_YOUR_WRITES_SECONDS + 0.1)
+            status, listed = await client.request("GET", "/stock/movements", token=token)
+            assert all(m["id"] != mv["id"] for m in listed), "GET depois do prazo não foi para a réplica"
+        finally:
+            await client.shutdown()
+
+    asyncio.run(scenario())
+
+    # quem escreveu e sumiu não fica para sempre em _pinned
+    for uid in range(1_000_000, 1_000_500):
+        db.pin_to_primary(uid)
+    time.sleep(db.READ_YOUR_WRITES_SECONDS + 0.1)
+    for uid in range(2_000_000, 2_000_020):
+        db.pin_to_primary(uid)
+    assert len(db._pinned) <= 64, f"_pinned com {len(db._pinned)} entradas vencidas"
+
+
+def run_checks(names: list[str], workdir: Path) -> dict[str, str | None]:
+    """Roda as checagens pedidas; devolve nome -> erro (None = passou)."""
+    out: dict[str, str | None] = {}
+    for name in names:
+        sub = workdir / name
+        sub.mkdir(parents=True, exist_ok=True)
+        try:
+            CHECKS[name](sub)
+        except AssertionError as e:
+            out[name] = str(e) or "falhou"
+        else:
+            out[name] = None
+    return out
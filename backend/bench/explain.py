@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import re
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+# SQLite: "SCAN stockmovement" / "SCAN product USING INDEX ..." sem SEARCH
+# é leitura da tabela (ou do índice) inteira
+_SQLITE_SCAN = re.compile(r"^SCAN (?!CONSTANT ROW)(\w+)")
+_PG_SEQ_SCAN = re.compile(r"Seq Scan on (\w+)")
+# subquery (ex.: union arquivo + tabela quente) já lido via SEARCH por dentro
+_SQLITE_SUBQUERY = re.compile(r"^(?:CO-ROUTINE|MATERIALIZE) (\w+)")
+
+
+class StatementLog:
+    def __init__(self):
+        self.route: str | None = None
+        self.statements: list[tuple[str, str, object]] = []
+
+
+@contextmanager
+def capture_selects(*engines):
+    """Guarda (rota, sql, parâmetros) de todo SELECT executado nos engines."""
+    log = StatementLog()
+
+    def before(conn, cursor, statement, parameters, context, executemany):
+        if log.route and statement.lstrip().upper().startswith("SELECT"):
+            log.statements.append((log.route, statement, parameters))
+
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", before)
+    try:
+        yield log
+    finally:
+        for engine in engines:
+            event.remove(engine, "before_cursor_execute", before)
+
+
+def explain(engine, statement: str, parameters) -> list[str]:
+    raw = engine.raw_connection()
+    try:
+        cur = raw.cursor()
+        if engine.dialect.name == "sqlite":
+            cur.execute("EXPLAIN QUERY PLAN " + statement, parameters)
+            return [row[-1] for row in cur.fetchall()]
+        if engine.dialect.name == "postgresql":
+            # sem seq scan "de graça": se sobrar Seq Scan é porque não há índice utilizável
+            cur.execute("SET LOCAL enable_seqscan = off")
+            cur.execute("EXPLAIN " + statement, parameters)
+            return [row[0] for row in cur.fetchall()]
+        raise SystemExit(f"EXPLAIN não suportado para {engine.dialect.name}")
+    finally:
+        raw.rollback()
+        raw.close()
+
+
+def full_scans(dialect: str, plan: list[str]) -> list[str]:
+    pattern = _SQLITE_SCAN if dialect == "sqlite" else _PG_SEQ_SCAN
+    subqueries = {m.group(1) for line in plan if (m := _SQLITE_SUBQUERY.search(line.strip()))}
+    found = []
+    for line in plan:
+        m = pattern.search(line.strip())
+        if m and "SEARCH" not in line and m.group(1) not in subqueries:
+            found.append(m.group(1))
+    return found
@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import asyncio
+import math
+import time
+
+from .scenarios import Context, Scenario
+
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    # nearest-rank: estável e sem interpolação (bom pra comparar entre commits)
+    if not sorted_values:
+        return 0.0
+    k = max(0, math.ceil(p / 100.0 * len(sorted_values)) - 1)
+    return sorted_values[k]
+
+
+def summarize(latencies: list[float], wall: float, errors: int) -> dict:
+    ms = sorted(x * 1000.0 for x in latencies)
+    return {
+        "count": len(ms),
+        "errors": errors,
+        "throughput_rps": round(len(ms) / wall, 2) if wall > 0 else 0.0,
+        "mean_ms": round(sum(ms) / len(ms), 3) if ms else 0.0,
+        "p50_ms": round(percentile(ms, 50), 3),
+        "p95_ms": round(percentile(ms, 95), 3),
+        "p99_ms": round(percentile(ms, 99), 3),
+        "max_ms": round(ms[-1], 3) if ms else 0.0,
+    }
+
+
+async def run_scenario(
+    ctx: Context,
+    sc: Scenario,
+    *,
+    iterations: int,
+    warmup: int,
+    concurrency: int,
+) -> dict:
+    for i in range(warmup):
+        call = await sc.build(ctx, i)
+        await ctx.client.request(call.method, call.path, json_body=call.json_body, params=call.params, token=call.token)
+
+    latencies: list[float] = []
+    errors = 0
+    first_error = None
+    counter = iter(range(warmup, warmup + iterations))
+    busy = 0.0  # tempo gasto só nas requisições medidas
+
+    async def worker():
+        nonlocal errors, first_error, busy
+        for i in counter:
+            call = await sc.build(ctx, i)
+            t0 = time.perf_counter()
+            status, data = await ctx.client.request(
+                call.method, call.path, json_body=call.json_body, params=call.params, token=call.token,
+            )
+            dt = time.perf_counter() - t0
+            busy += dt
+            if status in call.expect:
+                latencies.append(dt)
+            else:
+                errors += 1
+                if first_error is None:
+                    first_error = f"{status} {data}"
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    wall = time.perf_counter() - t0
+
+    # o preparo de dados (build) roda fora da medição; com concorrência 1 o
+    # throughput usa o tempo das requisições, senão o relógio de parede
+    out = summarize(latencies, busy if concurrency <= 1 else wall, errors)
+    if first_error:
+        out["first_error"] = first_error[:500]
+    return out
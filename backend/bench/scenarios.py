@@ -0,0 +1,341 @@
+from __future__ import annotations
+
+import itertools
+import uuid
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Any, Awaitable, Callable
+
+from .asgi import ASGIClient
+from .tenants import BENCH_DOMAIN, BENCH_PASSWORD, Tenant
+
+
+@dataclass
+class Context:
+    client: ASGIClient
+    tenants: list[Tenant]
+    tokens: dict[int, str]
+    seq: itertools.count = field(default_factory=lambda: itertools.count(1))
+
+    def tenant(self, i: int) -> Tenant:
+        return self.tenants[i % len(self.tenants)]
+
+    def token(self, t: Tenant) -> str:
+        return self.tokens[t.user_id]
+
+    def unique(self) -> int:
+        return next(self.seq)
+
+
+@dataclass
+class Call:
+    method: str
+    path: str
+    json_body: Any = None
+    params: dict | None = None
+    token: str | None = None
+    expect: tuple[int, ...] = (200,)
+
+
+Builder = Callable[[Context, int], Awaitable[Call]]
+
+
+@dataclass
+class Scenario:
+    name: str
+    build: Builder  # roda fora da medição (pode preparar dados)
+
+
+SCENARIOS: list[Scenario] = []
+
+
+def scenario(name: str):
+    def deco(fn: Builder) -> Builder:
+        SCENARIOS.append(Scenario(name=name, build=fn))
+        return fn
+    return deco
+
+
+async def _create_item(ctx: Context, t: Tenant, quote_id: int) -> int:
+    status, data = await ctx.client.request(
+        "POST", f"/quotes/{quote_id}/items",
+        json_body={"product_id": t.product_ids[0], "quantity": 1},
+        token=ctx.token(t),
+    )
+    if status != 200:
+        raise RuntimeError(f"preparo falhou: {status} {data}")
+    return data["id"]
+
+
+# ---------- Auth ----------
+@scenario("POST /auth/register")
+async def _(ctx, i):
+    return Call("POST", "/auth/register", {"email": f"new{ctx.unique()}-{i}@{BENCH_DOMAIN}", "password": BENCH_PASSWORD})
+
+
+@scenario("POST /auth/login")
+async def _(ctx, i):
+    return Call("POST", "/auth/login", {"email": ctx.tenant(i).email, "password": BENCH_PASSWORD})
+
+
+@scenario("GET /auth/me")
+async def _(ctx, i):
+    return Call("GET", "/auth/me", token=ctx.token(ctx.tenant(i)))
+
+
+@scenario("POST /auth/forgot-password")
+async def _(ctx, i):
+    return Call("POST", "/auth/forgot-password", {"email": ctx.tenant(i).email})
+
+
+@scenario("POST /auth/reset-password")
+async def _(ctx, i):
+    t = ctx.tenant(i)
+    status, data = await ctx.client.request("POST", "/auth/forgot-password", json_body={"email": t.email})
+    if status != 200:
+        raise RuntimeError(f"preparo falhou: {status} {data}")
+    return Call("POST", "/auth/reset-password", {"email": t.email, "code": data["dev_code"], "new_password": BENCH_PASSWORD})
+
+
+# ---------- Catalog ----------
+@scenario("POST /categories")
+async def _(ctx, i):
+    return Call("POST", "/categories", {"name": f"Bench {ctx.unique()}"}, token=ctx.token(ctx.tenant(i)))
+
+
+@scenario("GET /categories")
+async def _(ctx, i):
+    return Call("GET", "/categories", token=ctx.token(ctx.tenant(i)))
+
+
+@scenario("PATCH /categories/{id}")
+async def _(ctx, i):
+    t = ctx.tenant(i)
+    return Call("PATCH", f"/categories/{t.category_ids[i % len(t.category_ids)]}",
+                {"default_discount_percent": float(i % 20)}, token=ctx.token(t))
+
+
+@scenario("POST /categories/{id}/reprice")
+async def _(ctx, i):
+    # sobe e desce alternado: preços não derivam entre rodadas
+    t = ctx.tenant(i)
+    return Call("POST", f"/categories/{t.category_ids[i % len(t.category_ids)]}/reprice",
+                {"value": 1.0 if i % 2 == 0 else -0.99, "update_draft_quotes": True}, token=ctx.token(t))
+
+
+@scenario("DELETE /categories/{id}")
+async def _(ctx, i):
+    t = ctx.tenant(i)
+    status, data = await ctx.client.request(
+        # nome aleatório: com --reuse, categorias de rodadas anteriores continuam lá
+        "POST", "/categories", json_body={"name": f"Bench del {uuid.uuid4().hex[:12]}"}, token=ctx.token(t),
+    )
+    if status != 200:
+        raise RuntimeError(f"preparo falhou: {status} {data}")
+    return Call("DELETE", f"/categories/{data['id']}", token=ctx.token(t))
+
+
+@scenario("POST /products")
+async def _(ctx, i):
+    t = ctx.tenant(i)
+    n = ctx.unique()
+    return Call("POST", "/products", {
+        "sku": f"BENCH-{n}", "name": f"Bench {n}", "unit": "UN", "price": 10.0,
+        "category_id": t.category_ids[0],
+    }, token=ctx.token(t))
+
+
+@scenario("GET /products")
+async def _(ctx, i):
+    return Call("GET", "/products", token=ctx.token(ctx.tenant(i)))
+
+
+@scenario("GET /products?fields")
+async def _(ctx, i):
+    return Call("GET", "/products", params={"fields": "id,sku,name"}, token=ctx.token(ctx.tenant(i)))
+
+
+@scenario("GET /sync/catalog (full)")
+async def _(ctx, i):
+    return Call("GET", "/sync/catalog", token=ctx.token(ctx.tenant(i)))
+
+
+@scenario("GET /sync/catalog (delta)")
+async def _(ctx, i):
+    # cliente que já tinha o catálogo e perdeu uma alteração
+    t = ctx.tenant(i)
+    status, data = await ctx.client.request(
+        "PATCH", f"/categories/{t.category_ids[i % len(t.category_ids)]}",
+        json_body={"default_discount_percent": float(i % 20)}, token=ctx.token(t),
+    )
+    if status != 200:
+        raise RuntimeError(f"preparo falhou: {status} {data}")
+    return Call("GET", "/sync/catalog", params={"since": data["change_seq"] - 1}, token=ctx.token(t))
+
+
+@scenario("GET /products/min")
+async def _(ctx, i):
+    return Call("GET", "/products/min", token=ctx.token(ctx.tenant(i)))
+
+
+@scenario("PATCH /products/{id}")
+async def _(ctx, i):
+    t = ctx.tenant(i)
+    return Call("PATCH", f"/products/{t.product_ids[i % len(t.product_ids)]}",
+                {"price": float(10 + i % 90)}, token=ctx.token(t))
+
+
+# ---------- Stock ----------
+@scenario("POST /stock/movements")
+async def _(ctx, i):
+    t = ctx.tenant(i)
+    return Call("POST", "/stock/movements", {
+        "product_id": t.product_ids[i % len(t.product_ids)], "type": "IN", "quantity": 1,
+    }, token=ctx.token(t))
+
+
+@scenario("PUT /stock/reorder-points/{id}")
+async def _(ctx, i):
+    # mínimo alto: abre alerta, e as entradas acima passam pelo ponto de pedido
+    t = ctx.tenant(i)
+    return Call("PUT", f"/stock/reorder-points/{t.product_ids[i % len(t.product_ids)]}", {
+        "reorder_min": 1_000_000, "reorder_max": 2_000_000,
+    }, token=ctx.token(t))
+
+
+@scenario("GET /stock/alerts")
+async def _(ctx, i):
+    return Call("GET", "/stock/alerts", token=ctx.token(ctx.tenant(i)))
+
+
+@scenario("GET /stock/movements")
+async def _(ctx, i):
+    return Call("GET", "/stock/movements", token=ctx.token(ctx.tenant(i)))
+
+
+@scenario("GET /stock/movements?fields")
+async def _(ctx, i):
+    return Call("GET", "/stock/movements", params={"fields": "id,product_id,type,quantity"}, token=ctx.token(ctx.tenant(i)))
+
+
+@scenario("GET /stock/balance")
+async def _(ctx, i):
+    return Call("GET", "/stock/balance", token=ctx.token(ctx.tenant(i)))
+
+
+@scenario("GET /stock/statement")
+async def _(ctx, i):
+    t = ctx.tenant(i)
+    return Call("GET", "/stock/statement", params={"product_id": t.hot_product_id}, token=ctx.token(t))
+
+
+@scenario("GET /stock/statement (30 dias)")
+async def _(ctx, i):
+    t = ctx.tenant(i)
+    params = {
+        "product_id": t.hot_product_id,
+        "from_date": (date.today() - timedelta(days=30)).isoformat(),
+        "to_date": date.today().isoformat(),
+    }
+    return Call("GET", "/stock/statement", params=params, token=ctx.token(t))
+
+
+@scenario("GET /stock/valuation")
+async def _(ctx, i):
+    return Call("GET", "/stock/valuation", token=ctx.token(ctx.tenant(i)))
+
+
+@scenario("GET /stock/valuation?as_of")
+async def _(ctx, i):
+    as_of = date.today() - timedelta(days=30 + i % 60)
+    return Call("GET", "/stock/valuation", params={"as_of": as_of.isoformat()}, token=ctx.token(ctx.tenant(i)))
+
+
+@scenario("GET /stock/periods")
+async def _(ctx, i):
+    return Call("GET", "/stock/periods", token=ctx.token(ctx.tenant(i)))
+
+
+# ---------- Quotes ----------
+@scenario("POST /quotes")
+async def _(ctx, i):
+    return Call("POST", "/quotes", {"customer_name": f"Bench {ctx.unique()}"}, token=ctx.token(ctx.tenant(i)))
+
+
+@scenario("GET /quotes")
+async def _(ctx, i):
+    return Call("GET", "/quotes", token=ctx.token(ctx.tenant(i)))
+
+
+@scenario("GET /quotes?fields")
+async def _(ctx, i):
+    return Call("GET", "/quotes", params={"fields": "id,customer_name,status,total_net"}, token=ctx.token(ctx.tenant(i)))
+
+
+@scenario("GET /quotes/summary")
+async def _(ctx, i):
+    # painel: últimos 90 dias
+    return Call("GET", "/quotes/summary", params={
+        "from": (date.today() - timedelta(days=90)).isoformat(),
+        "to": date.today().isoformat(),
+    }, token=ctx.token(ctx.tenant(i)))
+
+
+@scenario("GET /quotes/{id}")
+async def _(ctx, i):
+    t = ctx.tenant(i)
+    return Call("GET", f"/quotes/{t.quote_ids[0]}", token=ctx.token(t))
+
+
+@scenario("GET /quotes/{id}/document")
+async def _(ctx, i):
+    # depois do primeiro render de cada orçamento/formato, sai do cache em disco
+    t = ctx.tenant(i)
+    return Call("GET", f"/quotes/{t.quote_ids[i % len(t.quote_ids)]}/document",
+                params={"format": "pdf" if i % 2 else "html"}, token=ctx.token(t))
+
+
+@scenario("POST /batch (tela de orçamentos)")
+async def _(ctx, i):
+    # o que o front pede ao abrir a tela de orçamentos
+    t = ctx.tenant(i)
+    return Call("POST", "/batch", {"requests": [
+        {"path": "/sync/catalog", "params": {"since": 0}},
+        {"path": "/quotes", "params": {"fields": "id,customer_name,status,total_net,issued_at,valid_until"}},
+        {"path": f"/quotes/{t.quote_ids[0]}"},
+    ]}, token=ctx.token(t))
+
+
+@scenario("PATCH /quotes/{id}/status")
+async def _(ctx, i):
+    t = ctx.tenant(i)
+    return Call("PATCH", f"/quotes/{t.quote_ids[0]}/status",
+                {"status": "SENT" if i % 2 else "DRAFT"}, token=ctx.token(t))
+
+
+@scenario("POST /quotes/{id}/duplicate")
+async def _(ctx, i):
+    t = ctx.tenant(i)
+    return Call("POST", f"/quotes/{t.quote_ids[i % len(t.quote_ids)]}/duplicate",
+                {"customer_name": f"Bench {ctx.unique()}", "refresh_prices": i % 2 == 0}, token=ctx.token(t))
+
+
+@scenario("POST /quotes/{id}/items")
+async def _(ctx, i):
+    t = ctx.tenant(i)
+    return Call("POST", f"/quotes/{t.quote_ids[-1]}/items",
+                {"product_id": t.product_ids[i % len(t.product_ids)], "quantity": 2}, token=ctx.token(t))
+
+
+@scenario("PATCH /quotes/{id}/items/{item_id}")
+async def _(ctx, i):
+    t = ctx.tenant(i)
+    item_id = await _create_item(ctx, t, t.quote_ids[-1])
+    return Call("PATCH", f"/quotes/{t.quote_ids[-1]}/items/{item_id}", {"quantity": 3}, token=ctx.token(t))
+
+
+@scenario("DELETE /quotes/{id}/items/{item_id}")
+async def _(ctx, i):
+    t = ctx.tenant(i)
+    item_id = await _create_item(ctx, t, t.quote_ids[-1])
+    return Call("DELETE", f"/quotes/{t.quote_ids[-1]}/items/{item_id}", token=ctx.token(t))
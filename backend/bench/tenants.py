@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+
+from sqlalchemy import func, select
+
+from app.db import shard_engine
+from app.models import Category, Product, Quote, StockMovement, User
+
+BENCH_DOMAIN = "bench.genericerp.dev"
+BENCH_PASSWORD = "bench-password"
+
+
+@dataclass
+class Tenant:
+    user_id: int
+    email: str
+    category_ids: list[int] = field(default_factory=list)
+    product_ids: list[int] = field(default_factory=list)
+    quote_ids: list[int] = field(default_factory=list)
+    hot_product_id: int | None = None  # produto com mais movimentações
+
+
+def load_tenants(engine) -> list[Tenant]:
+    """Recupera os tenants de um banco já semeado (``--reuse``)."""
+    out: list[Tenant] = []
+    with engine.connect() as directory:
+        users = directory.execute(
+            select(User.id, User.email, User.shard).where(User.email.like(f"%@{BENCH_DOMAIN}")).order_by(User.id)
+        ).all()
+    for uid, email, shard in users:
+        with shard_engine(shard).connect() as conn:
+            t = Tenant(user_id=uid, email=email)
+            t.category_ids = list(conn.execute(select(Category.id).where(Category.user_id == uid)).scalars())
+            t.product_ids = list(conn.execute(select(Product.id).where(Product.user_id == uid)).scalars())
+            t.quote_ids = list(conn.execute(select(Quote.id).where(Quote.user_id == uid)).scalars())
+            t.hot_product_id = conn.execute(
+                select(StockMovement.product_id)
+                .where(StockMovement.user_id == uid)
+                .group_by(StockMovement.product_id)
+                .order_by(func.count().desc())
+                .limit(1)
+            ).scalar()
+        # contas criadas pelo cenário de registro não têm catálogo
+        if t.product_ids:
+            out.append(t)
+    return out
@@ -3,6 +3,7 @@ const byId = (id) => document.getElementById(id);
 const FALLBACK_LOCAL = "http://localhost:8000";
 const LS_API_BASE = "genericerp.apiBase";
 const LS_TOKEN = "genericerp.token";
+const LS_CATALOG = "genericerp.catalog"; // + ":" + usuário (sub do token)
 
 const ROUTES = {
   login:      { title: "Login", desc: "Entre com seu e-mail e senha." },
@@ -24,6 +25,12 @@ const ROUTES = {
 let currentQuoteId = null;
 let productsCache = [];
 let categoriesCache = [];
+let catalog = null;       // { key, cursor, categories: {id: c}, products: {id: p} } (GET /sync/catalog)
+let quotesCache = null;   // última lista de /quotes (atualizada pelos eventos)
+let balanceCache = null;  // último /stock/balance (idem)
+
+let events = null;        // EventSource de /events
+let eventsConnected = false;
 
 function guessApiBase() {
   const raw = window.location.origin;
@@ -58,6 +65,59 @@ function getToken() {
 function setToken(t) {
   if (!t) localStorage.removeItem(LS_TOKEN);
   else localStorage.setItem(LS_TOKEN, t);
+  connectEvents();
+}
+
+/* =======================
+   EVENTS (SSE)
+   ======================= */
+function connectEvents() {
+  if (events) events.close();
+  events = null;
+  eventsConnected = false;
+
+  const token = getToken();
+  if (!token || typeof EventSource === "undefined") return;
+
+  events = new EventSource(apiBase() + "/events?token=" + encodeURIComponent(token));
+  events.onopen = () => { eventsConnected = true; };
+  events.onerror = () => { eventsConnected = false; };  // o navegador reconecta sozinho
+
+  events.addEventListener("stock.balance", (ev) => {
+    const data = JSON.parse(ev.data);
+    if (!balanceCache) return;
+    const row = balanceCache.find((r) => r.product_id === data.product_id);
+    if (row) {
+      row.balance = data.balance;
+      renderBalance();
+    }
+  });
+
+  events.addEventListener("quote.totals", (ev) => {
+    const data = JSON.parse(ev.data);
+    if (quotesCache) {
+      const q = quotesCache.find((r) => r.id === data.quote_id);
+      if (q) {
+        Object.assign(q, {
+          status: data.status,
+          total_gross: data.total_gross,
+          total_discount: data.total_discount,
+          total_net: data.total_net,
+        });
+        renderQuotes();
+      }
+    }
+    if (currentQuoteId === data.quote_id) {
+      byId("qStatus").value = data.status || "DRAFT";
+      byId("qTotal").textContent = (data.total_net ?? 0).toFixed(2);
+    }
+  });
+
+  // fila estourou no servidor: recarrega a tela atual
+  events.addEventListener("resync", () => {
+    onEnterRoute(routeNameFromHash()).catch(() => {});
+    if (balanceCache) onLoadBalance().catch(() => {});
+  });
 }
 
 function showNotice(elId, kind, msg) {
@@ -341,8 +401,78 @@ async function onResetPassword() {
 /* =======================
    DATA LOADERS
    ======================= */
+function catalogKey() {
+  const token = getToken();
+  try {
+    const sub = JSON.parse(atob(token.split(".")[1].replace(/-/g, "+").replace(/_/g, "/"))).sub;
+    return `${LS_CATALOG}:${apiBase()}:${sub}`;
+  } catch {
+    return "";
+  }
+}
+
+function loadStoredCatalog(key) {
+  try {
+    const stored = JSON.parse(localStorage.getItem(key) || "null");
+    if (stored && stored.key === key) return stored;
+  } catch {}
+  return { key, cursor: 0, categories: {}, products: {} };
+}
+
+function rebuildCatalogCaches() {
+  const cats = catalog.categories;
+  categoriesCache = Object.values(cats).sort((a, b) => b.id - a.id);
+  // mesmo formato de /products/min (produto + campos da categoria)
+  productsCache = Object.values(catalog.products)
+    .filter((p) => cats[p.category_id])
+    .map((p) => {
+      const c = cats[p.category_id];
+      return {
+        ...p,
+        category_name: c.name,
+        auto_discount_enabled: c.auto_discount_enabled,
+        default_discount_percent: c.default_discount_percent,
+      };
+    })
+    .sort((a, b) => (a.name < b.name ? -1 : a.name > b.name ? 1 : 0));
+}
+
+// Catálogo incremental: só o que mudou desde o último cursor
+function catalogSyncPath() {
+  const key = catalogKey();
+  if (!catalog || catalog.key !== key) catalog = loadStoredCatalog(key);
+  return `/sync/catalog?since=${catalog.cursor}`;
+}
+
+async function syncCatalog() {
+  applyCatalogSync(await fetchJson(catalogSyncPath()));
+}
+
+function applyCatalogSync(d) {
+  const key = catalog.key;
+  if (d.full) {
+    catalog.categories = {};
+    catalog.products = {};
+  }
+  d.categories.forEach((c) => { catalog.categories[c.id] = c; });
+  d.products.forEach((p) => { catalog.products[p.id] = p; });
+  d.deleted.categories.forEach((id) => { delete catalog.categories[id]; });
+  d.deleted.products.forEach((id) => { delete catalog.products[id]; });
+  catalog.cursor = d.cursor;
+
+  if (key) {
+    try {
+      localStorage.setItem(key, JSON.stringify(catalog));
+    } catch {
+      // cota do localStorage: segue só com o cache em memória
+      localStorage.removeItem(key);
+    }
+  }
+  rebuildCatalogCaches();
+}
+
 async function loadCategories() {
-  categoriesCache = await fetchJson("/categories");
+  await syncCatalog();
   const sel = byId("pCategory");
   if (sel) {
     sel.innerHTML = "";
@@ -377,7 +507,11 @@ async function loadCategories() {
 }
 
 async function loadProductsMin() {
-  productsCache = await fetchJson("/products/min");
+  await syncCatalog();
+  renderProductSelect();
+}
+
+function renderProductSelect() {
   const sel = byId("qiProduct");
   if (sel) {
     sel.innerHTML = "";
@@ -392,10 +526,10 @@ async function loadProductsMin() {
 
 async function loadProductsTable() {
   const mount = byId("prodTable");
-  const rows = await fetchJson("/products/min");
+  await syncCatalog();
   renderTable({
     mountEl: mount,
-    rows: rows.map((p) => ({
+    rows: productsCache.map((p) => ({
       id: p.id,
       sku: p.sku,
       name: p.name,
@@ -502,12 +636,39 @@ async function onCreateQuote() {
   }
 }
 
+// só as colunas da tabela (o resto vem em /quotes/{id})
+const QUOTES_LIST_PATH = "/quotes?fields=id,customer_name,status,total_gross,total_discount,total_net,issued_at,valid_until";
+
 async function loadQuotes() {
-  const rows = await fetchJson("/quotes");
+  quotesCache = await fetchJson(QUOTES_LIST_PATH);
+  renderQuotes();
+}
+
+// Abrir a tela: catálogo, lista e orçamento aberto num POST /batch só
+async function loadQuoteScreen() {
+  const requests = [{ path: catalogSyncPath() }, { path: QUOTES_LIST_PATH }];
+  if (currentQuoteId) requests.push({ path: `/quotes/${currentQuoteId}` });
+
+  const { results } = await fetchJson("/batch", { method: "POST", body: JSON.stringify({ requests }) });
+  const [cat, list, detail] = results;
+  for (const r of [cat, list]) {
+    if (r.status >= 400) throw new Error(`${r.status} ${r.body?.detail ?? ""}`);
+  }
+
+  applyCatalogSync(cat.body);
+  renderProductSelect();
+  quotesCache = list.body;
+  renderQuotes();
+  syncAutoFillFromProduct();
+  // orçamento apagado/inexistente: só não mostra os itens
+  if (detail && detail.status < 400) renderQuoteDetails(detail.body);
+}
+
+function renderQuotes() {
   const mount = byId("quotesTable");
   renderTable({
     mountEl: mount,
-    rows: rows.map((q) => ({
+    rows: quotesCache.map((q) => ({
       id: q.id,
       cliente: q.customer_name,
       status: q.status,
@@ -537,7 +698,10 @@ async function loadQuotes() {
 async function loadQuoteDetails() {
   if (!currentQuoteId) return;
 
-  const data = await fetchJson(`/quotes/${currentQuoteId}`);
+  renderQuoteDetails(await fetchJson(`/quotes/${currentQuoteId}`));
+}
+
+function renderQuoteDetails(data) {
   const q = data.quote;
   const items = data.items || [];
 
@@ -593,7 +757,7 @@ async function onAddItem() {
     byId("qiQty").value = "";
 
     await loadQuoteDetails();
-    await loadQuotes();
+    if (!eventsConnected) await loadQuotes();  // com SSE o total chega por evento
   } catch (e) {
     showNotice("quoteNotice", "err", e.message);
   }
@@ -606,8 +770,10 @@ async function onSetStatus() {
     const payload = { status: byId("qStatus").value };
     await fetchJson(`/quotes/${currentQuoteId}/status`, { method: "PATCH", body: JSON.stringify(payload) });
     showNotice("quoteNotice", "ok", "Status atualizado.");
-    await loadQuoteDetails();
-    await loadQuotes();
+    if (!eventsConnected) {
+      await loadQuoteDetails();
+      await loadQuotes();
+    }
   } catch (e) {
     showNotice("quoteNotice", "err", e.message);
   }
@@ -636,11 +802,15 @@ async function onCreateMovement() {
 }
 
 async function onLoadBalance() {
-  const data = await fetchJson("/stock/balance");
+  balanceCache = await fetchJson("/stock/balance");
+  renderBalance();
+}
+
+function renderBalance() {
   const mount = byId("balanceTable");
   renderTable({
     mountEl: mount,
-    rows: data.map((r) => ({
+    rows: balanceCache.map((r) => ({
       id: r.product_id,
       sku: r.sku,
       nome: r.name,
@@ -714,10 +884,7 @@ async function onEnterRoute(name) {
   }
 
   if (name === "quotes") {
-    await loadProductsMin();
-    await loadQuotes();
-    syncAutoFillFromProduct();
-    await loadQuoteDetails().catch(() => {});
+    await loadQuoteScreen();
   }
 }
 
@@ -781,5 +948,6 @@ document.addEventListener("DOMContentLoaded", () => {
   }
 
   wire();
+  connectEvents();
   if (!window.location.hash) window.location.hash = "#/login";
 });